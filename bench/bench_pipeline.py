@@ -0,0 +1,369 @@
+"""Throughput, latency and peak-memory benchmark for every pipeline stage.
+
+Starts the local MinerU and OpenAI stand-ins from bench/servers.py, builds a
+synthetic scanned PDF, and runs the stages one after another, each in a fresh
+subprocess so peak RSS belongs to that stage alone:
+
+    slice     raw/SlicePDF.split_pdf          synthetic PDF -> page files
+    hash      raw/OCR.construct_pdf_data      SHA-256 manifest of the page files (cold)
+    upload    raw/OCR.upload_pdfs             presigned-URL PUTs to the MinerU stand-in
+    download  raw/OCR.download_results        poll, download and unzip the synthetic full.md files
+    split     raw/splitter.split_to_file      full.md -> *_chunks.json
+    generate  dataset/dataset.generate_batch  chat completions against the OpenAI stand-in
+    merge     utils/process_json              renumber ``--merge-records`` questions and merge labels
+
+Every stage reports wall seconds, items and MB per second, peak RSS, and the
+p50/p95 of its per-item spans and requests (taken from utils/telemetry.py
+records). ``--output`` writes the results with the git commit and all
+parameters as JSON; ``--compare`` prints the per-stage change between two such
+files, e.g. from before and after a change.
+
+Usage (from repo root):
+    python -m bench.bench_pipeline --output bench_pipeline.json
+    python -m bench.bench_pipeline --pages 400 --md-kb 64 --llm-latency 1.0 --llm-error-rate 0.05 --stream
+    python -m bench.bench_pipeline --compare before.json after.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+from bench.servers import MinerUServer, OpenAIServer  # noqa: E402
+from bench.synthetic import make_synthetic_pdf  # noqa: E402
+from dataset.dataset import combine_batch_results, generate_batch, load_batch_prompts  # noqa: E402
+from raw import OCR  # noqa: E402
+from raw.SlicePDF import split_pdf  # noqa: E402
+from raw.splitter import output_name, split_to_file  # noqa: E402
+from utils import http_pool, telemetry  # noqa: E402
+from utils.process_json import iter_records, merge_data, write_records  # noqa: E402
+
+STAGES = ("slice", "hash", "upload", "download", "split", "generate", "merge")
+BOOK = "book"
+
+
+def _max_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _files_size(paths) -> int:
+    return sum(Path(p).stat().st_size for p in paths)
+
+
+# ----------------------------- stages (run in the child) -----------------------------
+# Each stage does its untimed setup, then returns the timed ``seconds`` plus what it processed.
+
+
+def stage_slice(workdir: Path, config: dict) -> dict:
+    pdf = workdir / "raw" / f"{BOOK}.pdf"
+    start = time.perf_counter()
+    pages_dir = split_pdf(pdf, None, False, config["pages_per_file"])
+    seconds = time.perf_counter() - start
+    files = len(list(pages_dir.glob("*.pdf")))
+    return {"seconds": seconds, "unit": "pages", "items": config["pages"], "bytes": pdf.stat().st_size, "files": files}
+
+
+def stage_hash(workdir: Path, config: dict) -> dict:
+    start = time.perf_counter()
+    file_path, _ = OCR.construct_pdf_data(workdir / "processed" / BOOK, hash_workers=config["hash_workers"])
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "unit": "files", "items": len(file_path), "bytes": _files_size(file_path)}
+
+
+def stage_upload(workdir: Path, config: dict) -> dict:
+    pages_dir = workdir / "processed" / BOOK
+    file_path, data = OCR.construct_pdf_data(pages_dir, hash_workers=config["hash_workers"])
+    start = time.perf_counter()
+    batch_id = OCR.upload_pdfs(file_path, data, workers=config["upload_workers"], backoff=0.1, pdf_url=pages_dir)
+    seconds = time.perf_counter() - start
+    if batch_id is None:
+        raise RuntimeError("upload failed")
+    (workdir / "batch_id").write_text(batch_id, encoding="utf-8")
+    return {"seconds": seconds, "unit": "files", "items": len(file_path), "bytes": _files_size(file_path)}
+
+
+def stage_download(workdir: Path, config: dict) -> dict:
+    pages_dir = workdir / "processed" / BOOK
+    ocr_dir = workdir / "ocr" / BOOK
+    batch_id = (workdir / "batch_id").read_text(encoding="utf-8")
+    interval = config["poll_interval"]
+    start = time.perf_counter()
+    OCR.download_results(
+        OCR.iter_resolved_results(batch_id, interval, interval * 4), ocr_dir, pages_dir, workers=config["download_workers"]
+    )
+    seconds = time.perf_counter() - start
+    OCR.clear_upload_state(pages_dir)
+    results = sorted(ocr_dir.rglob("full.md"))
+    return {"seconds": seconds, "unit": "files", "items": len(results), "bytes": _files_size(results)}
+
+
+def stage_split(workdir: Path, config: dict) -> dict:
+    ocr_dir = workdir / "ocr" / BOOK
+    chunks_dir = workdir / "split" / BOOK
+    markdown = sorted(ocr_dir.rglob("*.md"))
+    chunks = 0
+    start = time.perf_counter()
+    for md in markdown:
+        with telemetry.span("split", item=md.parent.name) as fields:
+            fields["chunks"] = split_to_file(
+                md, chunks_dir / output_name(md, ocr_dir), config["max_chunk_size"], config["chunk_overlap"]
+            )
+        chunks += fields["chunks"]
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "unit": "chunks", "items": chunks, "bytes": _files_size(markdown), "files": len(markdown)}
+
+
+def stage_generate(workdir: Path, config: dict) -> dict:
+    args = argparse.Namespace(
+        input=workdir / "split" / BOOK,
+        topic=None,
+        mode="objective",
+        single_choice=5,
+        true_false=5,
+        reasoning_count=5,
+        pack_tokens=config["pack_tokens"],
+        print_prompt=False,
+        dry_run=False,
+    )
+    chunks, prompts = load_batch_prompts(args)
+    start = time.perf_counter()
+    results = asyncio.run(generate_batch(
+        prompts,
+        model="bench",
+        temperature=0.2,
+        max_tokens=2000,
+        api_key="bench",
+        base_url=config["openai_url"] + "/v1",
+        concurrency=config["concurrency"],
+        stream=config["stream"],
+    ))
+    count = write_records(combine_batch_results(chunks, results), workdir / "questions.jsonl")
+    seconds = time.perf_counter() - start
+    failed = sum(isinstance(r, Exception) for r in results)
+    return {
+        "seconds": seconds, "unit": "questions", "items": count, "bytes": sum(len(p.encode("utf-8")) for p in prompts),
+        "prompts": len(prompts), "failed": failed,
+    }
+
+
+def stage_merge(workdir: Path, config: dict) -> dict:
+    generated = list(iter_records(workdir / "questions.jsonl"))
+    if not generated:
+        raise RuntimeError("no questions to merge")
+    questions = workdir / "merge_questions.jsonl"
+    labels = workdir / "merge_labels.jsonl"
+
+    def replicated():
+        for n in range(config["merge_records"]):
+            record = dict(generated[n % len(generated)])
+            record["uid"] = f"{record['uid']}-{n}"
+            yield record
+
+    write_records(replicated(), questions)
+    write_records(
+        ({"uid": r["uid"], "module": "bench", "difficulty": 2} for r in iter_records(questions)), labels
+    )
+
+    def renumbered():
+        for number, record in enumerate(iter_records(questions), start=1):
+            record["id"] = number
+            yield record
+
+    start = time.perf_counter()
+    merged = workdir / "merged.jsonl"
+    count = write_records(renumbered(), merged)
+    merge_data(merged, labels, workdir / "final_dataset.jsonl")
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "unit": "records", "items": count, "bytes": _files_size([questions, labels])}
+
+
+STAGE_FUNCS = {
+    "slice": stage_slice,
+    "hash": stage_hash,
+    "upload": stage_upload,
+    "download": stage_download,
+    "split": stage_split,
+    "generate": stage_generate,
+    "merge": stage_merge,
+}
+
+
+def run_child(stage: str, workdir: Path, config: dict) -> dict:
+    http_pool.configure(
+        pool_size=max(config["concurrency"], config["upload_workers"], config["download_workers"]),
+        rate_limit=not config["no_rate_limit"],
+        rate_limit_path=str(workdir / "rate_limits.sqlite"),
+    )
+    OCR.api_base = config["mineru_url"] + "/api/v4"
+    OCR.header = {"Content-Type": "application/json", "Authorization": "Bearer bench"}
+    telemetry.enable(workdir / "telemetry.jsonl")
+    rss_before = _max_rss_mb()
+    # the stages print progress; keep stdout for the JSON result
+    with contextlib.redirect_stdout(sys.stderr):
+        result = STAGE_FUNCS[stage](workdir, config)
+        summary = telemetry.finish()
+    latency = {
+        name: {"count": s["count"], "p50": s["p50"], "p95": s["p95"]}
+        for name, s in {**summary["stages"], **summary["requests"]}.items()
+    }
+    result.update(
+        stage=stage, rss_before_mb=rss_before, max_rss_mb=_max_rss_mb(), latency=latency, counters=summary["counters"]
+    )
+    return result
+
+
+# ----------------------------- parent -----------------------------
+
+
+def git_revision() -> dict:
+    def git(*args: str) -> str:
+        proc = subprocess.run(["git", *args], cwd=REPO, capture_output=True, text=True)
+        return proc.stdout.strip() if proc.returncode == 0 else ""
+
+    return {
+        "commit": git("rev-parse", "HEAD") or None,
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def run_stage(stage: str, workdir: Path, config: dict, servers: dict[str, MinerUServer | OpenAIServer]) -> dict:
+    before = {name: Counter(server.stats) for name, server in servers.items()}
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.bench_pipeline", "--child", stage, str(workdir), json.dumps(config)],
+        capture_output=True, text=True, cwd=REPO,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f"stage {stage} failed (exit {proc.returncode})")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["server"] = {
+        name: dict(Counter(server.stats) - before[name]) for name, server in servers.items()
+        if Counter(server.stats) - before[name]
+    }
+    seconds = result["seconds"]
+    result["seconds"] = round(seconds, 4)
+    result["items_per_s"] = round(result["items"] / seconds, 2) if seconds else None
+    result["mb_per_s"] = round(result["bytes"] / 1024 / 1024 / seconds, 2) if seconds else None
+    return result
+
+
+def compare(base_path: Path, head_path: Path) -> None:
+    base, head = (json.loads(p.read_text(encoding="utf-8")) for p in (base_path, head_path))
+    print(f"base {base['meta'].get('commit', '')[:10]}  head {head['meta'].get('commit', '')[:10]}")
+    if base["params"] != head["params"]:
+        changed = sorted(k for k in base["params"].keys() | head["params"].keys()
+                         if base["params"].get(k) != head["params"].get(k))
+        print(f"warning: parameters differ: {', '.join(changed)}")
+    base_results = {r["stage"]: r for r in base["results"]}
+    print(f"{'stage':>9} {'seconds':>17} {'change':>8} {'items/s':>19} {'max RSS MB':>17}")
+    for r in head["results"]:
+        b = base_results.get(r["stage"])
+        if b is None:
+            continue
+        change = (r["seconds"] - b["seconds"]) / b["seconds"] * 100 if b["seconds"] else 0.0
+        print(f"{r['stage']:>9} {b['seconds']:>8.3f}{r['seconds']:>9.3f} {change:>+7.1f}% "
+              f"{b['items_per_s'] or 0:>9.1f}{r['items_per_s'] or 0:>10.1f} "
+              f"{b['max_rss_mb'] or 0:>8.1f}{r['max_rss_mb'] or 0:>9.1f}")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage against local MinerU/OpenAI stand-ins.")
+    parser.add_argument("--pages", type=int, default=200, help="Pages in the synthetic PDF")
+    parser.add_argument("--page-kb", type=int, default=64, help="Image payload per page in KiB")
+    parser.add_argument("--pages-per-file", type=int, default=10, help="Pages per sliced file (one OCR upload each)")
+    parser.add_argument("--md-kb", type=int, default=16, help="Size of each synthetic full.md returned by OCR, in KiB")
+    parser.add_argument("--extract-seconds", type=float, default=0.5, help="MinerU processing time per file after upload")
+    parser.add_argument("--ocr-latency", type=float, default=0.02, help="Seconds added to every MinerU request")
+    parser.add_argument("--ocr-error-rate", type=float, default=0.0, help="Fraction of MinerU requests answered with 503")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds before a completion starts")
+    parser.add_argument("--llm-token-seconds", type=float, default=0.0, help="Seconds per generated token")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of completions answered with 429")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per completion")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent completions")
+    parser.add_argument("--stream", action="store_true", help="Stream completions")
+    parser.add_argument("--pack-tokens", type=int, default=0, help="Pack chunks to this token budget before generating")
+    parser.add_argument("--max-chunk-size", type=int, default=2000, help="Splitter max chunk size in characters")
+    parser.add_argument("--chunk-overlap", type=int, default=0, help="Splitter chunk overlap in characters")
+    parser.add_argument("--merge-records", type=int, default=100000, help="Questions merged with labels in the merge stage")
+    parser.add_argument("--hash-workers", type=int, default=4)
+    parser.add_argument("--upload-workers", type=int, default=4)
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="Initial extract-results poll interval")
+    parser.add_argument("--no-rate-limit", action="store_true", help="Bypass utils/rate_limit.py")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for injected errors and synthetic markdown")
+    parser.add_argument("--workdir", type=Path, default=None, help="Keep inputs and outputs here instead of a temp dir")
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BASE", "HEAD"), help="Compare two --output files")
+    parser.add_argument("--child", nargs=3, metavar=("STAGE", "WORKDIR", "CONFIG"), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    if args.child:
+        stage, workdir, config = args.child
+        print(json.dumps(run_child(stage, Path(workdir), json.loads(config))))
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    params = {k: v for k, v in vars(args).items() if k not in ("workdir", "output", "compare", "child")}
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    if args.workdir and workdir.exists():
+        shutil.rmtree(workdir)
+    make_synthetic_pdf(workdir / "raw" / f"{BOOK}.pdf", args.pages, args.page_kb)
+
+    servers = {
+        "mineru": MinerUServer(args.ocr_latency, args.ocr_error_rate, args.extract_seconds, args.md_kb, seed=args.seed),
+        "openai": OpenAIServer(args.llm_latency, args.llm_error_rate, args.llm_token_seconds, args.questions, seed=args.seed),
+    }
+    config = {**params, "mineru_url": servers["mineru"].url, "openai_url": servers["openai"].url}
+    results = []
+    try:
+        with servers["mineru"], servers["openai"]:
+            for stage in STAGES:
+                result = run_stage(stage, workdir, config, servers)
+                results.append(result)
+                requests = {k: v["p95"] for k, v in result["latency"].items() if v["p95"] is not None}
+                print(f"{stage:>9}: {result['seconds']:>7.2f}s  {result['items']:>7} {result['unit']:<9} "
+                      f"{result['items_per_s'] or 0:>9.1f}/s {result['mb_per_s'] or 0:>7.1f} MB/s  "
+                      f"max RSS {result['max_rss_mb'] or 0:>6.1f} MB  p95 {requests}")
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        report = {
+            "meta": {
+                **git_revision(),
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "params": params,
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
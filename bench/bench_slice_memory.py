@@ -0,0 +1,108 @@
+"""Peak-memory benchmark for the fullpages output of raw/SlicePDF.py.
+
+Compares the previous approach (one PdfWriter holding every page until the end)
+with the streaming writer on synthetic PDFs of increasing page count. Each run
+happens in a fresh subprocess so reader caches do not leak between cases.
+
+Usage (from repo root):
+    python -m bench.bench_slice_memory
+    python -m bench.bench_slice_memory --pages 100 400 1600 --page-kb 64 --output bench_slice_memory.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench.synthetic import make_synthetic_pdf  # noqa: E402
+from raw.SlicePDF import group_pages, select_pages, write_fullpages, write_groups  # noqa: E402
+from pypdf import PdfReader, PdfWriter  # noqa: E402
+
+MODES = ("legacy", "streaming", "split")
+
+
+def legacy_fullpages(pdf_path: Path, fullpage_path: Path, kept: list[int]) -> None:
+    """The pre-streaming implementation: every page is collected in one PdfWriter."""
+    reader = PdfReader(pdf_path)
+    fullpage = PdfWriter()
+    for src_idx in kept:
+        fullpage.add_page(reader.pages[src_idx])
+    with fullpage_path.open("wb") as f:
+        fullpage.write(f)
+
+
+def _max_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(mode: str, pdf_path: Path) -> dict:
+    out_dir = Path(tempfile.mkdtemp())
+    with pdf_path.open("rb") as fh:
+        kept = select_pages(PdfReader(fh), from_z_lib=True)
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "legacy":
+        legacy_fullpages(pdf_path, out_dir / "full.pdf", kept)
+    elif mode == "streaming":
+        write_fullpages(pdf_path, out_dir / "full.pdf", kept)
+    else:
+        groups = group_pages(pdf_path, kept)
+        write_groups(pdf_path, out_dir, groups, out_dir / "full.pdf")
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": mode,
+        "pages": len(kept),
+        "seconds": round(elapsed, 3),
+        "peak_traced_mb": round(peak / 1024 / 1024, 2),
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Peak memory of fullpages PDF writing vs. page count.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 400, 1600])
+    parser.add_argument("--page-kb", type=int, default=64, help="Image payload per page in KiB")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PDF"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child[0], Path(args.child[1]))))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            pdf_path = make_synthetic_pdf(Path(tmp) / f"synthetic_{pages}.pdf", pages, args.page_kb, landscape_every=50)
+            for mode in args.modes:
+                proc = subprocess.run(
+                    [sys.executable, "-m", "bench.bench_slice_memory", "--child", mode, str(pdf_path)],
+                    capture_output=True, text=True, check=True,
+                    cwd=Path(__file__).resolve().parent.parent,
+                )
+                result = json.loads(proc.stdout.strip().splitlines()[-1])
+                result["page_kb"] = args.page_kb
+                results.append(result)
+                print(f"{mode:>9} {pages:>5} pages: peak {result['peak_traced_mb']:>8.1f} MB "
+                      f"traced, {result['seconds']:.1f}s")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""Local stand-ins for the MinerU and OpenAI-compatible APIs.
+
+Both servers run in a background thread on an ephemeral port and implement just
+enough of the real API for raw/OCR.py and dataset/dataset.py to run unchanged
+against them. Latency and the fraction of failed responses are configurable, and
+failures are drawn from a seeded RNG so runs are reproducible.
+
+MinerU (``MinerUServer``, base URL ``<url>/api/v4``):
+    POST /api/v4/file-urls/batch             presigned upload URLs for a new batch
+    PUT  /upload/<batch>/<i>                 upload one file (body is discarded)
+    GET  /api/v4/extract-results/batch/<id>  a file is "done" ``extract_seconds`` after its upload
+    GET  /zip/<batch>/<i>                    zip with a synthetic full.md of ``md_kb`` KiB
+
+OpenAI (``OpenAIServer``, base URL ``<url>/v1``):
+    POST /v1/chat/completions                JSON array of questions quoting the prompt's
+                                             reference text; supports ``stream=True``
+
+Usage (serve both until Ctrl-C, e.g. to point raw/OCR.py or dataset/dataset.py at them):
+    python -m bench.servers --llm-latency 0.5 --llm-error-rate 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zipfile
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from bench.synthetic import synthetic_markdown  # noqa: E402
+
+READ_BLOCK_SIZE = 1 << 16
+STREAM_PIECE_CHARS = 16
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Threaded HTTP server with injected latency and errors; use as a context manager."""
+
+    daemon_threads = True
+    # bursts of concurrent uploads or completions must not be refused by a short listen backlog
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        handler: type[BaseHTTPRequestHandler],
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stats: Counter[str] = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += n
+
+    def should_fail(self) -> bool:
+        """Count one API request and decide whether it gets an injected error."""
+        with self._lock:
+            self.stats["requests"] += 1
+            failed = self._random.random() < self.error_rate
+            self.stats["errors"] += failed
+        return failed
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandInServer
+
+    def log_message(self, format, *args) -> None:  # noqa: A002 - BaseHTTPRequestHandler signature
+        pass
+
+    def send(self, status: int, body: bytes | dict | list, content_type: str = "application/json",
+             headers: dict[str, str] | None = None) -> None:
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def iter_body(self):
+        """Yield the request body in blocks, for both Content-Length and chunked uploads."""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    return
+                yield self.rfile.read(size)
+                self.rfile.readline()
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining:
+            block = self.rfile.read(min(remaining, READ_BLOCK_SIZE))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
+
+    def read_json(self):
+        return json.loads(b"".join(self.iter_body()) or b"{}")
+
+    def inject(self) -> bool:
+        """Sleep for the configured latency; answer with an error and return True if one is drawn."""
+        time.sleep(self.server.latency)
+        if not self.server.should_fail():
+            return False
+        headers = {"Retry-After": "1"} if self.server.error_status == 429 else None
+        self.send(self.server.error_status, {"error": {"message": "injected failure"}}, headers=headers)
+        return True
+
+
+# ----------------------------- MinerU -----------------------------
+
+
+class _MinerUHandler(_Handler):
+    server: "MinerUServer"
+
+    def do_POST(self) -> None:
+        if not self.path.startswith("/api/v4/file-urls/batch"):
+            self.send(404, {"code": 404, "msg": "not found"})
+            return
+        data = self.read_json()
+        if self.inject():
+            return
+        batch_id = self.server.new_batch(data["files"])
+        urls = [f"{self.server.url}/upload/{batch_id}/{i}" for i in range(len(data["files"]))]
+        self.send(200, {"code": 0, "data": {"batch_id": batch_id, "file_urls": urls}})
+
+    def do_PUT(self) -> None:
+        size = sum(len(block) for block in self.iter_body())
+        if self.inject():
+            return
+        _, _, batch_id, index = self.path.split("/")
+        self.server.uploaded(batch_id, int(index))
+        self.server.count("upload_bytes", size)
+        self.send(200, b"", "text/plain")
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/api/v4/extract-results/batch/"):
+            if self.inject():
+                return
+            results = self.server.results(self.path.rsplit("/", 1)[1])
+            if results is None:
+                self.send(200, {"code": -1, "msg": "batch not found"})
+            else:
+                self.send(200, {"code": 0, "data": {"extract_result": results}})
+        elif self.path.startswith("/zip/"):
+            if self.inject():
+                return
+            _, _, batch_id, index = self.path.split("/")
+            body = self.server.result_zip(batch_id, int(index))
+            self.server.count("download_bytes", len(body))
+            self.send(200, body, "application/zip")
+        else:
+            self.send(404, {"code": 404, "msg": "not found"})
+
+
+class MinerUServer(StandInServer):
+    """MinerU batch API: upload URLs, delayed extraction and result zips."""
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0.0, extract_seconds: float = 1.0,
+                 md_kb: int = 32, error_status: int = 503, seed: int = 0) -> None:
+        super().__init__(_MinerUHandler, latency, error_rate, error_status, seed)
+        self.extract_seconds = extract_seconds
+        self.md_kb = md_kb
+        self.seed = seed
+        self._batches: dict[str, list[dict]] = {}
+
+    def new_batch(self, files: list[dict]) -> str:
+        with self._lock:
+            batch_id = f"batch-{len(self._batches):04d}"
+            self._batches[batch_id] = [{"info": info, "uploaded": None} for info in files]
+        return batch_id
+
+    def uploaded(self, batch_id: str, index: int) -> None:
+        with self._lock:
+            self._batches[batch_id][index]["uploaded"] = time.monotonic()
+
+    def results(self, batch_id: str) -> list[dict] | None:
+        with self._lock:
+            files = self._batches.get(batch_id)
+            if files is None:
+                return None
+            now = time.monotonic()
+            results = []
+            for i, file in enumerate(files):
+                uploaded = file["uploaded"]
+                if uploaded is None:
+                    state = "waiting-file"
+                elif now - uploaded < self.extract_seconds:
+                    state = "running"
+                else:
+                    state = "done"
+                result = {"file_name": file["info"]["name"], "data_id": file["info"].get("data_id"), "state": state}
+                if state == "done":
+                    result["full_zip_url"] = f"{self.url}/zip/{batch_id}/{i}"
+                results.append(result)
+        return results
+
+    def result_zip(self, batch_id: str, index: int) -> bytes:
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("full.md", synthetic_markdown(self.md_kb, seed=f"{self.seed}/{batch_id}/{index}"))
+        return buf.getvalue()
+
+
+# ----------------------------- OpenAI -----------------------------
+
+
+class _OpenAIHandler(_Handler):
+    server: "OpenAIServer"
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send(404, {"error": {"message": "not found"}})
+            return
+        body = self.read_json()
+        if self.inject():
+            return
+        prompt = body["messages"][-1]["content"]
+        text = json.dumps(self.server.questions_for(prompt), ensure_ascii=False, indent=2)
+        usage = {"prompt_tokens": len(prompt.encode("utf-8")) // 3, "completion_tokens": len(text.encode("utf-8")) // 3}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.server.count("completion_tokens", usage["completion_tokens"])
+        if body.get("stream"):
+            self.stream(body, text, usage)
+            return
+        time.sleep(usage["completion_tokens"] * self.server.token_seconds)
+        self.send(200, {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+            "usage": usage,
+        })
+
+    def stream(self, body: dict, text: str, usage: dict) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"]}
+
+        def event(payload) -> None:
+            data = ("data: " + (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)) + "\n\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        piece_seconds = usage["completion_tokens"] * self.server.token_seconds * STREAM_PIECE_CHARS / max(1, len(text))
+        try:
+            for start in range(0, len(text), STREAM_PIECE_CHARS):
+                time.sleep(piece_seconds)
+                delta = {"content": text[start:start + STREAM_PIECE_CHARS]}
+                event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if body.get("stream_options", {}).get("include_usage"):
+                event({**base, "choices": [], "usage": usage})
+            event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client closes the stream as soon as the JSON array is complete
+            self.close_connection = True
+
+
+class OpenAIServer(StandInServer):
+    """OpenAI chat completions; each response holds ``questions`` questions built from the prompt."""
+
+    def __init__(self, latency: float = 0.5, error_rate: float = 0.0, token_seconds: float = 0.0,
+                 questions: int = 10, error_status: int = 429, seed: int = 0) -> None:
+        super().__init__(_OpenAIHandler, latency, error_rate, error_status, seed)
+        self.token_seconds = token_seconds
+        self.questions = questions
+
+    def questions_for(self, prompt: str) -> list[dict]:
+        # quote sentences of the reference text so downstream quote checks see real matches
+        parts = prompt.split('"""')
+        reference = parts[1] if len(parts) > 2 else prompt
+        sentences = re.findall(r"[^。！？\n]+[。！？]", reference) or [reference.strip()[:60] or "参考文本"]
+        questions = []
+        for i in range(self.questions):
+            quote = sentences[i % len(sentences)].strip()
+            if i % 2 == 0:
+                questions.append({
+                    "id": i + 1, "type": 1,
+                    "question": f"根据参考文本，下列说法正确的是：{quote[:30]}……,A. 甲,B. 乙,C. 丙,D. 丁",
+                    "answer": "ABCD"[i % 4], "explanation": f"原文指出：{quote}", "source_quote": quote,
+                })
+            else:
+                questions.append({
+                    "id": i + 1, "type": 2, "question": f"判断：{quote}", "answer": i % 4 == 1,
+                    "explanation": f"原文指出：{quote}", "source_quote": quote,
+                })
+        return questions
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve the MinerU and OpenAI stand-ins until interrupted.")
+    parser.add_argument("--ocr-latency", type=float, default=0.05, help="Seconds added to every MinerU request")
+    parser.add_argument("--ocr-error-rate", type=float, default=0.0, help="Fraction of MinerU requests answered with 503")
+    parser.add_argument("--extract-seconds", type=float, default=1.0, help="Seconds from upload until a file is done")
+    parser.add_argument("--md-kb", type=int, default=32, help="Size of each synthetic full.md in KiB")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before a completion starts")
+    parser.add_argument("--llm-token-seconds", type=float, default=0.0, help="Seconds per generated token")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of completions answered with 429")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per completion")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    mineru = MinerUServer(args.ocr_latency, args.ocr_error_rate, args.extract_seconds, args.md_kb, seed=args.seed)
+    openai = OpenAIServer(args.llm_latency, args.llm_error_rate, args.llm_token_seconds, args.questions, seed=args.seed)
+    with mineru, openai:
+        print(f"MinerU: {mineru.url}/api/v4")
+        print(f"OpenAI: {openai.url}/v1")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
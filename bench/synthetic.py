@@ -0,0 +1,108 @@
+"""Synthetic inputs for benchmarks.
+
+The generators write their output incrementally so that building a large input
+does not itself dominate the memory profile being measured.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+from pathlib import Path
+
+TERMS = (
+    "阳极效应", "电解质", "冰晶石", "氧化铝", "分子比", "槽电压", "电流效率", "炭阳极",
+    "阴极", "物料平衡", "氟化盐", "出铝", "效应系数", "点式下料", "槽温", "铝液高度",
+)
+PHRASES = (
+    "在生产过程中需要重点关注", "的稳定直接影响", "应结合现场数据判断", "与工艺参数密切相关",
+    "偏离正常范围时会导致", "需要定期测量并记录", "是衡量电解槽运行状态的重要指标",
+)
+
+
+def make_synthetic_pdf(path: Path, pages: int, page_kb: int = 64, landscape_every: int = 0) -> Path:
+    """Write a ``pages``-page PDF where each page draws its own ``page_kb`` KiB image.
+
+    Image data is random, so it behaves like a scanned page: it is neither
+    shared between pages nor compressible. With ``landscape_every`` > 0 every
+    n-th page is landscape, which exercises the Z-Library removal logic.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    width = 1024
+    height = max(1, page_kb)
+    offsets: dict[int, int] = {}
+
+    with path.open("wb") as f:
+        def obj(num: int, body: bytes, stream: bytes | None = None) -> None:
+            offsets[num] = f.tell()
+            f.write(f"{num} 0 obj\n".encode() + body)
+            if stream is not None:
+                f.write(b"\nstream\n" + stream + b"\nendstream")
+            f.write(b"\nendobj\n")
+
+        f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        kids = []
+        for i in range(pages):
+            page_num, content_num, image_num = 3 + 3 * i, 4 + 3 * i, 5 + 3 * i
+            kids.append(page_num)
+            landscape = landscape_every and (i + 1) % landscape_every == 0
+            box = "842 595" if landscape else "595 842"
+            content = f"q 595 0 0 842 0 0 cm /Im0 Do Q BT /F1 12 Tf 72 72 Td (page {i + 1}) Tj ET".encode()
+            obj(page_num, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {box}] /Contents {content_num} 0 R "
+                f"/Resources << /XObject << /Im0 {image_num} 0 R >> >> >>"
+            ).encode())
+            obj(content_num, f"<< /Length {len(content)} >>".encode(), content)
+            image = os.urandom(width * height)
+            obj(image_num, (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Length {len(image)} >>"
+            ).encode(), image)
+
+        kid_refs = " ".join(f"{k} 0 R" for k in kids)
+        obj(2, f"<< /Type /Pages /Kids [{kid_refs}] /Count {pages} >>".encode())
+        obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        size = 3 + 3 * pages
+        xref = f.tell()
+        f.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        for num in range(1, size):
+            f.write(f"{offsets[num]:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return path
+
+
+def synthetic_markdown(size_kb: int, seed: int = 0, section_chars: int = 1200) -> str:
+    """Return markdown of about ``size_kb`` KiB (UTF-8) shaped like MinerU output.
+
+    Sections of roughly ``section_chars`` characters sit under an H1/H2/H3
+    hierarchy, and sentences mix smelting terms with filler, so the splitter
+    and tokenizers see CJK text with realistic punctuation and headers.
+    """
+    rng = random.Random(seed)
+    parts: list[str] = []
+    size = 0
+
+    def add(text: str) -> None:
+        nonlocal size
+        parts.append(text)
+        size += len(text.encode("utf-8")) + 2
+
+    section = 0
+    while size < size_kb * 1024:
+        if section % 6 == 0:
+            add(f"# 第{section // 6 + 1}章 {rng.choice(TERMS)}")
+        if section % 2 == 0:
+            add(f"## {section // 2 + 1}. {rng.choice(TERMS)}与{rng.choice(TERMS)}")
+        add(f"### {rng.choice(TERMS)}")
+        paragraph = ""
+        chars = 0
+        while chars < section_chars:
+            sentence = f"{rng.choice(TERMS)}{rng.choice(PHRASES)}{rng.choice(TERMS)}，{rng.choice(PHRASES)}。"
+            paragraph += sentence
+            chars += len(sentence)
+            if len(paragraph) > 200 or chars >= section_chars:
+                add(paragraph)
+                paragraph = ""
+        section += 1
+    return "\n\n".join(parts)
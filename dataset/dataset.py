@@ -4,6 +4,19 @@
 - 根据输入文本自动拼装客观题（单选/判断）或推理题提示词
 - 可选直接调用 OpenAI Chat Completions API，期望返回 Json 题目列表
 - 支持 dry-run，仅输出提示词，便于人工验证
+- 默认启用本地响应缓存（SQLite），相同提示词/模型/采样参数的请求重跑时直接命中，
+  可用 --no-cache 关闭或 --refresh 强制重新请求
+- 支持 --stream 流式模式：边接收边解析 JSON 数组，逐题产出；输出被 max_tokens 截断时保留
+  已完整的题目，输出明显不符合格式时提前断开，不再为无效内容付费
+- 支持 --batch 批量模式：读取 raw/splitter.py 生成的 *_chunks.json（或其所在目录），
+  使用 asyncio 并发地为每个分块生成题目，按分块顺序合并为一个输出文件；
+  每道题带有由分块原文与题目内容得到的稳定 uid，输出为 .jsonl 时可用 --append 追加
+- 支持 --batch-api 离线批量模式：把所有分块的请求写成一个 Batch 输入文件，经 Files/Batches
+  接口提交并轮询，结束后流式取回结果按分块合并；重新运行时只提交失败的请求
+- 支持 --topic 按考点出题：从 utils/retrieval.py 建立的 BM25 索引中检索与考点最相关的分块，
+  按 --context-tokens 预算拼成带出处的参考文本，每个考点生成一组题目（可配合 --batch-api）
+- 支持 --telemetry 记录每次请求的延迟与 token 用量，结束时打印 p50/p95、每题 token、
+  每分钟题数与费用（--price）；--profile 用 cProfile 分析热点
 
 注意：
 - 需要配置 OPENAI_API_KEY 环境变量
@@ -14,19 +27,33 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
 import os
 import re
+import sys
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator, Callable
 
 try:
-   from openai import OpenAI
+   from openai import AsyncOpenAI
 except ImportError as exc:  # pragma: no cover - 提示依赖缺失
    raise SystemExit(
       "缺少 openai 依赖，请先运行 `pip install -r requirements.txt`"
    ) from exc
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import batch_api, http_pool, telemetry  # noqa: E402
+from utils.llm_cache import (  # noqa: E402
+   DEFAULT_CACHE_PATH,
+   DEFAULT_MAX_AGE_DAYS,
+   DEFAULT_MAX_BYTES,
+   ResponseCache,
+)
+from utils.process_json import chunk_ref, make_uid, write_records  # noqa: E402
+from utils.retrieval import DEFAULT_INDEX_DIR, BM25Index  # noqa: E402
+
 
 # --------------------------- prompt builders ---------------------------
 
@@ -106,6 +133,72 @@ def build_reasoning_prompt(input_text: str, count: int = 5) -> str:
    }}
 """
 
+QUESTION_TYPES = {
+    "T1": "单项选择",
+    "T2": "多项选择",
+    "T3": "判断",
+    "T4": "填空（数值/术语）",
+    "T5": "简答（流程/计算）",
+    "T6": "场景分析（故障判断/实际工程方案/多因素耦合分析）",
+}
+
+ANSWER_FORMATS = {
+    "T1": "唯一选项字母，如 \"C\"",
+    "T2": "多个选项字母组合，如 \"ABD\"",
+    "T3": "true 或 false",
+    "T4": "具体数值（含单位）或术语",
+    "T5": "参考答案文本或计算公式，列出关键得分点",
+    "T6": "详细的文字描述、步骤或方案，列出关键得分点",
+}
+
+
+def build_question_prompt(
+    input_text: str,
+    question_type: str,
+    difficulty: str,
+    count: int = 5,
+    knowledge_point: str = "",
+) -> str:
+    """按方案 2.3.4 模板生成指定题型（T1-T6）与难度（Easy/Medium/Hard）的提示词。"""
+
+    return f"""# Role
+你是一位有30年工作经验的资深严谨的铝冶炼工业考核专家。
+
+# Task
+请阅读下方【参考文本】，从中提取关键知识点，生成{count}道难度等级为{difficulty}的{QUESTION_TYPES[question_type]}题（{question_type}）。难度等级参照下方【难度等级标准】。{f"考察知识点：{knowledge_point}。" if knowledge_point else ""}
+
+# Input Context
+\"\"\"
+{input_text}
+\"\"\"
+
+# Difficulty Assessment Criteria
+1. **Easy**：仅涉及单一知识点，直接陈述，考察基础概念和记忆，题目直接，选项明确，无需复杂推理。
+2. **Medium**：题目涉及多个知识点，包含工艺流程理解、参数关联分析等，考察综合理解和应用，需一定推理或简单计算。
+3. **Hard**：题目涉及多因素耦合分析和实际工程方案设计，考察复杂问题解决能力，需要工程判断，涉及安全、成本、效率等多方面综合性现实考量。
+
+# Constraints
+1. 严格限制来源：你生成的每一个问题、答案、解析，都必须100%来源于上述【参考文本】，严禁使用外部知识或经验。
+2. 准确性（T1、T2类题目）：干扰选项必须具有一定迷惑性，但不能违背基本的物理化学常数（除非文本中提及）。
+3. 科学性、逻辑性（T5、T6类题目）：题目应描述一种现象，要求回答原因或处理措施，参考答案需要包含推理步骤。
+4. 幻觉控制：禁止生成参考文本中未提及的数值、参数或定义。如果【参考文本】中的信息不足以支持生成指定难度的题目，请直接输出 NULL，不要强行编造条件。
+5. 溯源：在“解析”中必须引用原文的具体句子作为证据。
+
+# Output Format(Json)
+请严格按Json格式输出：
+[
+   {{
+      "type":"{question_type}",
+      "difficulty":"{difficulty}",
+      "knowledge_point":"考察知识点...",
+      "question":"题目描述...",
+      "answer":"{ANSWER_FORMATS[question_type]}",
+      "explanation":"解析内容...",
+      "source_quote":"原文依据..."
+   }}
+]
+"""
+
 # --------------------------- helpers ---------------------------
 
 def load_text(path: str | Path) -> str:
@@ -132,21 +225,747 @@ def parse_json_content(content: str) -> Any:
       ) from exc
 
 
+class JsonArrayStream:
+   """增量解析流式返回的题目 JSON 数组，每闭合一个题目对象就立即交出。
+
+   ``feed`` 每次只扫描新到达的字符，记录括号深度与字符串状态；题目对象闭合时才对该片段
+   调用 ``json.loads``，总开销与输出长度成线性。允许开头的 ``` 代码块标记、单个对象与
+   NULL（视为没有题目）。输出明显不符合格式（数组外有其它文字、数组元素不是题目对象）时
+   抛出 ValueError，调用方据此提前中止请求；被 max_tokens 截断时，已闭合的题目仍然有效。
+   """
+
+   FENCE_PATTERN = re.compile(r"```[a-zA-Z]*[ \t]*\n")
+
+   def __init__(self, required: tuple[str, ...] = ("question",)) -> None:
+      self.required = required
+      self.text = ""
+      self.questions: list[dict[str, Any]] = []
+      self.started = False
+      self.closed = False
+      self._pos = 0
+      self._depth = 0
+      self._base = 0
+      self._item_start = 0
+      self._in_string = False
+      self._escape = False
+
+   def feed(self, delta: str) -> list[dict[str, Any]]:
+      """追加一段输出，返回其中新闭合的题目。"""
+
+      if self.closed or not delta:
+         return []
+      self.text += delta
+      if not self.started and not self._start():
+         return []
+
+      found = []
+      text = self.text
+      for i in range(self._pos, len(text)):
+         ch = text[i]
+         if self._depth == self._base:
+            # 数组元素之间只允许空白、逗号、下一个对象或数组结束
+            if ch in " \t\r\n,":
+               continue
+            if ch == "{":
+               self._item_start = i
+               self._depth += 1
+               continue
+            if ch == "]":
+               self.closed = True
+               break
+            raise ValueError(f"题目数组中出现非对象内容：{text[max(0, i - 20):i + 20]!r}")
+         if self._in_string:
+            if self._escape:
+               self._escape = False
+            elif ch == "\\":
+               self._escape = True
+            elif ch == '"':
+               self._in_string = False
+         elif ch == '"':
+            self._in_string = True
+         elif ch in "{[":
+            self._depth += 1
+         elif ch in "}]":
+            self._depth -= 1
+            if self._depth == self._base:
+               found.append(self._decode(text[self._item_start:i + 1]))
+               if self._base == 0:  # 顶层为单个对象
+                  self.closed = True
+                  break
+      self._pos = len(text)
+      self.questions.extend(found)
+      return found
+
+   def _start(self) -> bool:
+      """跳过开头的空白与代码块标记，定位数组或对象的起点；内容尚不足以判断时返回 False。"""
+
+      text = self.text.lstrip()
+      if text.startswith("`"):
+         match = self.FENCE_PATTERN.match(text)
+         if match is None:
+            if len(text) > 32 or not "```".startswith(text[:3]):
+               raise ValueError(f"模型输出不是题目 JSON：{text[:40]!r}")
+            return False
+         text = text[match.end():].lstrip()
+      if not text:
+         return False
+      if text[0] in "nN":
+         if len(text) < 4:
+            return False
+         if text[:4].lower() != "null":
+            raise ValueError(f"模型输出不是题目 JSON：{text[:40]!r}")
+         self.started = self.closed = True
+         return False
+      if text[0] not in "[{":
+         raise ValueError(f"模型输出不是题目 JSON：{text[:40]!r}")
+
+      offset = len(self.text) - len(text)
+      self.started = True
+      if text[0] == "[":
+         self._depth = self._base = 1
+         self._pos = offset + 1
+      else:
+         self._depth, self._base = 0, 0
+         self._pos = offset
+      return True
+
+   def _decode(self, fragment: str) -> dict[str, Any]:
+      try:
+         question = json.loads(fragment)
+      except json.JSONDecodeError as exc:
+         raise ValueError(f"题目对象不是合法 JSON：{fragment[:80]!r}") from exc
+      missing = [key for key in self.required if key not in question]
+      if missing:
+         raise ValueError(f"题目对象缺少字段 {missing}：{fragment[:80]!r}")
+      return question
+
+
+# raw/splitter.py 的默认输出目录；题目中的分块出处记为相对该目录的路径
+DEFAULT_CHUNKS_ROOT = Path("./materials/split_markdown")
+
+
+def load_chunks(path: str | Path) -> list[tuple[Path, int, dict[str, Any]]]:
+   """读取 *_chunks.json 文件（或目录及其子目录下全部此类文件），返回 (文件, 序号, 分块) 列表。"""
+
+   path = Path(path)
+   files = sorted(path.rglob("*_chunks.json")) if path.is_dir() else [path]
+   if not files:
+      raise ValueError(f"目录中没有 *_chunks.json 文件：{path}")
+
+   chunks = []
+   for file in files:
+      data = json.loads(file.read_text(encoding="utf-8"))
+      for idx, chunk in enumerate(data):
+         if chunk.get("content", "").strip():
+            chunks.append((file, idx, chunk))
+   return chunks
+
+
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+SENTENCE_PATTERN = re.compile(r"[^。！？；\n]+[。！？；\n]*|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+   """粗略估计 token 数：中文字符及全角标点各计 1 个，其余字符每 4 个计 1 个。"""
+
+   cjk = len(CJK_PATTERN.findall(text))
+   return cjk + (len(text) - cjk + 3) // 4
+
+
+def split_by_tokens(text: str, budget: int) -> list[str]:
+   """按句子边界把超出预算的文本切成若干段，单句仍超预算时按字符硬切。"""
+
+   pieces: list[str] = []
+   current = ""
+   for sentence in SENTENCE_PATTERN.findall(text):
+      while estimate_tokens(sentence) > budget:
+         if current:
+            pieces.append(current)
+            current = ""
+         cut = max(1, len(sentence) * budget // estimate_tokens(sentence))
+         pieces.append(sentence[:cut])
+         sentence = sentence[cut:]
+      if current and estimate_tokens(current + sentence) > budget:
+         pieces.append(current)
+         current = ""
+      current += sentence
+   if current.strip():
+      pieces.append(current)
+   return [p.strip() for p in pieces if p.strip()]
+
+
+def pack_chunks(
+   chunks: list[tuple[Path, int, dict[str, Any]]], budget: int
+) -> list[tuple[Path, int, dict[str, Any]]]:
+   """把同一文件、同一 H1/H2 章节内相邻的小分块贪心合并，使每个提示词的参考文本不超过 ``budget`` tokens。
+
+   超出预算的单个分块会被切分。合并/切分后的分块在 ``sources`` 中记录原始分块序号及元数据。
+   """
+
+   packed: list[tuple[Path, int, dict[str, Any]]] = []
+   current: list[tuple[Path, int, dict[str, Any]]] = []
+   current_tokens = 0
+
+   def section(item: tuple[Path, int, dict[str, Any]]) -> tuple:
+      metadata = item[2].get("metadata", {})
+      return item[0], metadata.get("H1"), metadata.get("H2")
+
+   def flush() -> None:
+      nonlocal current_tokens
+      if current:
+         file, first_idx, first = current[0]
+         packed.append((file, first_idx, {
+            "content": "\n\n".join(c["content"].strip() for _, _, c in current),
+            "metadata": first.get("metadata", {}),
+            "sources": [{"index": i, "metadata": c.get("metadata", {})} for _, i, c in current],
+         }))
+      current.clear()
+      current_tokens = 0
+
+   for item in chunks:
+      file, idx, chunk = item
+      tokens = estimate_tokens(chunk["content"])
+      if tokens > budget:
+         flush()
+         source = [{"index": idx, "metadata": chunk.get("metadata", {})}]
+         for piece in split_by_tokens(chunk["content"], budget):
+            packed.append((file, idx, {
+               "content": piece,
+               "metadata": chunk.get("metadata", {}),
+               "sources": source,
+            }))
+         continue
+      if current and (section(item) != section(current[0]) or current_tokens + tokens > budget):
+         flush()
+      current.append(item)
+      current_tokens += tokens
+   flush()
+   return packed
+
+
+def load_topic_chunks(
+   topics: list[str], index_dir: str | Path, top_k: int, budget: int
+) -> list[tuple[Path, int, dict[str, Any]]]:
+   """按考点检索分块并拼成参考文本，每个考点一个分块，``sources`` 中记录命中分块的出处与得分。
+
+   命中分块按得分依次加入，直到参考文本超过 ``budget`` tokens；得分最高的分块超出预算时按句子截断。
+   """
+
+   index = BM25Index(index_dir)
+   if not index.manifest["segments"]:
+      raise ValueError(f"检索索引为空：{index_dir}，请先运行 utils/retrieval.py 建立索引")
+
+   chunks = []
+   try:
+      for number, topic in enumerate(topics):
+         start = time.perf_counter()
+         hits = index.search_topic(topic, top_k)
+         telemetry.record("retrieve", time.perf_counter() - start, item=topic, hits=len(hits))
+         if not hits:
+            print(f"考点“{topic}”没有检索到相关分块，已跳过")
+            continue
+         parts: list[str] = []
+         sources = []
+         used = 0
+         for hit in hits:
+            headers = " / ".join(
+               str(v) for k, v in hit["metadata"].items() if k in ("H1", "H2", "H3") and v
+            )
+            label = f"【资料：{Path(hit['file']).name} 第 {hit['index']} 块" + (f"｜{headers}" if headers else "") + "】"
+            content = hit["content"].strip()
+            tokens = estimate_tokens(label) + estimate_tokens(content)
+            if parts and used + tokens > budget:
+               break
+            if tokens > budget:
+               content = split_by_tokens(content, max(1, budget - estimate_tokens(label)))[0]
+               tokens = estimate_tokens(label) + estimate_tokens(content)
+            parts.append(f"{label}\n{content}")
+            sources.append({
+               "file": hit["file"], "index": hit["index"], "metadata": hit["metadata"], "score": hit["score"],
+            })
+            used += tokens
+         chunks.append((Path(index_dir), number, {
+            "content": "\n\n".join(parts),
+            "metadata": {"topic": topic},
+            "sources": sources,
+         }))
+   finally:
+      index.close()
+   return chunks
+
+
+def normalize_questions(parsed: Any) -> list[dict[str, Any]]:
+   """模型可能返回单个对象、列表或 NULL，统一为题目列表。"""
+
+   if parsed is None:
+      return []
+   if isinstance(parsed, dict):
+      return [parsed]
+   return list(parsed)
+
+
 def save_json(data: Any, path: str | Path) -> None:
    Path(path).parent.mkdir(parents=True, exist_ok=True)
    Path(path).write_text(json.dumps(data, ensure_ascii=False, indent=4), encoding="utf-8")
 
 
-def call_chat_completion(prompt: str, model: str, temperature: float, max_tokens: int, api_key: str, base_url: str) -> str:
-   """调用 OpenAI Chat Completions API。"""
-   client = OpenAI(base_url=base_url,api_key=api_key)
-   response = client.chat.completions.create(
-      model=model,
-      messages=[{"role": "user", "content": prompt}],
-      temperature=temperature,
-      max_tokens=max_tokens,
+def record_usage(start: float, response: Any) -> None:
+   """把一次非流式调用的延迟与 ``response.usage`` 交给 telemetry。"""
+
+   usage = getattr(response, "usage", None)
+   telemetry.request(
+      "llm",
+      time.perf_counter() - start,
+      prompt_tokens=getattr(usage, "prompt_tokens", None),
+      completion_tokens=getattr(usage, "completion_tokens", None),
+      finish_reason=response.choices[0].finish_reason if response.choices else None,
    )
-   return response.choices[0].message.content or ""
+
+
+def call_chat_completion(
+   prompt: str,
+   model: str,
+   temperature: float,
+   max_tokens: int,
+   api_key: str,
+   base_url: str,
+   cache: ResponseCache | None = None,
+   refresh: bool = False,
+) -> str:
+   """调用 OpenAI Chat Completions API。
+
+   传入 ``cache`` 时先查缓存，命中则直接返回；``refresh=True`` 跳过查询但仍写回缓存。
+   """
+   key = ResponseCache.make_key(prompt, model, temperature, max_tokens)
+   if cache is not None and not refresh:
+      cached = cache.get(key)
+      if cached is not None:
+         telemetry.request("llm", None, cached=True)
+         return cached
+
+   client = http_pool.get_openai_client(base_url, api_key)
+   start = time.perf_counter()
+   try:
+      response = client.chat.completions.create(
+         model=model,
+         messages=[{"role": "user", "content": prompt}],
+         temperature=temperature,
+         max_tokens=max_tokens,
+      )
+   except Exception as exc:
+      telemetry.request("llm", time.perf_counter() - start, error=type(exc).__name__)
+      raise
+   record_usage(start, response)
+   content = response.choices[0].message.content or ""
+   if cache is not None and content:
+      cache.set(key, content)
+   return content
+
+
+async def call_chat_completion_async(
+   client: AsyncOpenAI,
+   prompt: str,
+   model: str,
+   temperature: float,
+   max_tokens: int,
+   cache: ResponseCache | None = None,
+   refresh: bool = False,
+) -> str:
+   """异步调用 OpenAI Chat Completions API，供批量模式复用同一个客户端。"""
+   key = ResponseCache.make_key(prompt, model, temperature, max_tokens)
+   if cache is not None and not refresh:
+      cached = cache.get(key)
+      if cached is not None:
+         telemetry.request("llm", None, cached=True)
+         return cached
+
+   start = time.perf_counter()
+   try:
+      response = await client.chat.completions.create(
+         model=model,
+         messages=[{"role": "user", "content": prompt}],
+         temperature=temperature,
+         max_tokens=max_tokens,
+      )
+   except Exception as exc:
+      telemetry.request("llm", time.perf_counter() - start, error=type(exc).__name__)
+      raise
+   record_usage(start, response)
+   content = response.choices[0].message.content or ""
+   if cache is not None and content:
+      cache.set(key, content)
+   return content
+
+
+async def stream_questions_async(
+   client: AsyncOpenAI,
+   prompt: str,
+   model: str,
+   temperature: float,
+   max_tokens: int,
+   parser: JsonArrayStream | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+   """以 ``stream=True`` 调用模型，边接收边解析，每闭合一道题目就立即产出。
+
+   数组闭合后即断开连接，不再为多余的输出付费；输出不符合格式时 ``parser`` 抛出 ValueError，
+   同样先关闭流再向上抛出。是否被截断可由 ``parser.closed`` 判断。
+
+   提前断开时收不到服务端的 usage，telemetry 中的 token 数按提示词与已收到的文本估算。
+   """
+   parser = parser if parser is not None else JsonArrayStream()
+   start = time.perf_counter()
+   first_token = None
+   usage = None
+   error = None
+   try:
+      stream = await client.chat.completions.create(
+         model=model,
+         messages=[{"role": "user", "content": prompt}],
+         temperature=temperature,
+         max_tokens=max_tokens,
+         stream=True,
+      )
+      try:
+         async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+               continue
+            if first_token is None:
+               first_token = time.perf_counter() - start
+            for question in parser.feed(chunk.choices[0].delta.content or ""):
+               yield question
+            if parser.closed:
+               break
+      finally:
+         await stream.close()
+   except Exception as exc:
+      error = type(exc).__name__
+      raise
+   finally:
+      telemetry.request(
+         "llm",
+         time.perf_counter() - start,
+         prompt_tokens=usage.prompt_tokens if usage else estimate_tokens(prompt),
+         completion_tokens=usage.completion_tokens if usage else estimate_tokens(parser.text),
+         estimated=usage is None,
+         first_token=first_token,
+         error=error,
+      )
+
+
+async def request_questions_async(
+   client: AsyncOpenAI,
+   prompt: str,
+   model: str,
+   temperature: float,
+   max_tokens: int,
+   cache: ResponseCache | None = None,
+   refresh: bool = False,
+   stream: bool = False,
+   on_question: Callable[[dict[str, Any]], None] | None = None,
+) -> list[dict[str, Any]]:
+   """请求一组题目并解析为列表，内容不合格时抛出 ValueError。
+
+   ``stream=True`` 时走流式解析，每闭合一道题目就调用 ``on_question``：被 max_tokens 截断的
+   输出保留已完整的题目（不写入缓存，重跑时会重新请求），完整输出以规范化后的 JSON 写入缓存，
+   与非流式模式共用缓存键。
+   """
+   if not stream:
+      content = await call_chat_completion_async(
+         client, prompt, model, temperature, max_tokens, cache, refresh
+      )
+      if not content:
+         raise ValueError("模型未返回内容")
+      return normalize_questions(parse_json_content(content))
+
+   key = ResponseCache.make_key(prompt, model, temperature, max_tokens)
+   if cache is not None and not refresh:
+      cached = cache.get(key)
+      if cached is not None:
+         telemetry.request("llm", None, cached=True)
+         questions = normalize_questions(parse_json_content(cached))
+         if on_question is not None:
+            for question in questions:
+               on_question(question)
+         return questions
+
+   parser = JsonArrayStream()
+   async for question in stream_questions_async(client, prompt, model, temperature, max_tokens, parser):
+      if on_question is not None:
+         on_question(question)
+   if not parser.started:
+      raise ValueError("模型未返回内容")
+   if not parser.closed:
+      print(f"输出被截断，保留已完整的 {len(parser.questions)} 道题目")
+   elif cache is not None:
+      cache.set(key, json.dumps(parser.questions, ensure_ascii=False))
+   return parser.questions
+
+
+async def generate_batch(
+   prompts: list[str],
+   model: str,
+   temperature: float,
+   max_tokens: int,
+   api_key: str,
+   base_url: str,
+   concurrency: int = 8,
+   cache: ResponseCache | None = None,
+   refresh: bool = False,
+   stream: bool = False,
+) -> list[list[dict[str, Any]] | Exception]:
+   """并发调用模型，最多同时 ``concurrency`` 个请求。
+
+   返回结果与 ``prompts`` 一一对应；单个分块失败时对应位置为异常对象，不影响其它分块。
+   解析失败的响应会从缓存中移除，重跑时会重新请求。``stream=True`` 时流式解析，见 request_questions_async。
+   """
+   client = http_pool.get_async_openai_client(base_url, api_key)
+   semaphore = asyncio.Semaphore(max(1, concurrency))
+
+   async def run_one(idx: int, prompt: str) -> list[dict[str, Any]] | Exception:
+      async with semaphore:
+         try:
+            try:
+               with telemetry.span("generate", item=str(idx)) as fields:
+                  questions = await request_questions_async(
+                     client, prompt, model, temperature, max_tokens, cache, refresh, stream
+                  )
+                  fields["questions"] = len(questions)
+               return questions
+            except ValueError:
+               if cache is not None:
+                  cache.delete(ResponseCache.make_key(prompt, model, temperature, max_tokens))
+               raise
+         except Exception as exc:  # noqa: BLE001 - 单个分块失败不应中断整批
+            print(f"分块 {idx} 生成失败：{exc}")
+            return exc
+
+   try:
+      return await asyncio.gather(*(run_one(i, p) for i, p in enumerate(prompts)))
+   finally:
+      await http_pool.aclose_async_clients()
+
+
+def combine_batch_results(
+   chunks: list[tuple[Path, int, dict[str, Any]]],
+   results: list[list[dict[str, Any]] | Exception],
+   chunks_root: str | Path | None = DEFAULT_CHUNKS_ROOT,
+) -> list[dict[str, Any]]:
+   """按分块顺序展开题目，重新编号并附上分块来源信息；来源文件记为相对 ``chunks_root`` 的路径。"""
+
+   combined = []
+   for (file, idx, chunk), result in zip(chunks, results):
+      if isinstance(result, Exception):
+         continue
+      for question in result:
+         if not isinstance(question, dict):
+            continue
+         question = dict(question)
+         question["id"] = len(combined) + 1
+         question["uid"] = make_uid(question, chunk["content"])
+         question["chunk"] = {
+            "file": chunk_ref(file, chunks_root),
+            "index": idx,
+            "metadata": chunk.get("metadata", {}),
+         }
+         if "sources" in chunk:
+            question["chunk"]["sources"] = chunk["sources"]
+         combined.append(question)
+   return combined
+
+
+def open_cache(args: argparse.Namespace) -> ResponseCache | None:
+   if args.no_cache:
+      return None
+   return ResponseCache(
+      args.cache_path,
+      max_bytes=int(args.cache_max_mb * 1024 * 1024),
+      max_age_days=args.cache_max_age_days,
+   )
+
+
+def build_prompt(args: argparse.Namespace, input_text: str) -> str:
+   if args.mode == "objective":
+      return build_objective_prompt(input_text, args.single_choice, args.true_false)
+   return build_reasoning_prompt(input_text, args.reasoning_count)
+
+
+def load_batch_prompts(
+   args: argparse.Namespace,
+) -> tuple[list[tuple[Path, int, dict[str, Any]]], list[str]]:
+   """读取（并按需合并）分块，构建每个分块的提示词；--print-prompt/--dry-run 时打印提示词。
+
+   给出 --topic 时改为按考点检索，每个考点一个提示词。
+   """
+
+   if args.topic:
+      chunks = load_topic_chunks(args.topic, args.index, args.top_k, args.context_tokens)
+      print(f"按 {len(args.topic)} 个考点检索，得到 {len(chunks)} 组参考文本")
+   else:
+      chunks = load_chunks(args.input)
+      if args.pack_tokens > 0:
+         total = len(chunks)
+         chunks = pack_chunks(chunks, args.pack_tokens)
+         print(f"按 {args.pack_tokens} tokens 预算合并：{total} 个分块 -> {len(chunks)} 个提示词")
+   prompts = [build_prompt(args, chunk["content"]) for _, _, chunk in chunks]
+
+   if args.print_prompt or args.dry_run:
+      for prompt in prompts:
+         print("\n----- PROMPT BEGIN -----\n")
+         print(prompt)
+         print("\n----- PROMPT END -----\n")
+   return chunks, prompts
+
+
+def run_batch(args: argparse.Namespace) -> None:
+   """批量模式：对分块文件中的每个分块并发生成题目并合并输出。"""
+
+   chunks, prompts = load_batch_prompts(args)
+   print(f"共 {len(prompts)} 个分块，并发数 {args.concurrency}")
+   if args.dry_run:
+      return
+
+   cache = open_cache(args)
+   try:
+      results = asyncio.run(
+         generate_batch(
+            prompts,
+            model=args.model,
+            temperature=args.temperature,
+            max_tokens=args.max_tokens,
+            api_key=args.api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+            cache=cache,
+            refresh=args.refresh,
+            stream=args.stream,
+         )
+      )
+   finally:
+      if cache is not None:
+         print(f"缓存命中 {cache.hits}，未命中 {cache.misses}")
+         cache.close()
+   failed = sum(isinstance(r, Exception) for r in results)
+   combined = combine_batch_results(chunks, results, args.chunks_root)
+
+   write_records(combined, args.output, append=args.append)
+   telemetry.count("questions", len(combined))
+   print(f"已保存 {len(combined)} 道题目到 {args.output}（失败分块 {failed}/{len(chunks)}）")
+
+
+def batch_custom_id(idx: int, prompt: str, args: argparse.Namespace) -> str:
+   """Batch 请求的 custom_id：分块序号加请求内容哈希，输入或参数变化后不会误用旧结果。"""
+
+   key = ResponseCache.make_key(prompt, args.model, args.temperature, args.max_tokens)
+   return f"chunk-{idx}-{key[:16]}"
+
+
+def parse_batch_content(content: str) -> list[dict[str, Any]]:
+   """解析 Batch 返回的内容；不是完整 JSON 时（如被 max_tokens 截断）保留其中已完整的题目。"""
+
+   try:
+      return normalize_questions(parse_json_content(content))
+   except ValueError:
+      parser = JsonArrayStream()
+      parser.feed(content)
+      if not parser.questions:
+         raise
+      return parser.questions
+
+
+def run_batch_api(args: argparse.Namespace) -> None:
+   """离线批量模式：把全部提示词作为一个 Batch 任务提交，轮询结束后取回结果并合并输出。
+
+   已成功的请求记录在 ``--batch-dir`` 下的结果文件中，重新运行同一命令时只提交失败或
+   尚未提交的请求；已提交但未结束的批次会继续轮询，不会重复提交。
+   """
+
+   chunks, prompts = load_batch_prompts(args)
+   if args.dry_run:
+      return
+
+   stem = Path(args.output).stem
+   job = batch_api.BatchJob(
+      args.batch_dir / f"{stem}.state.json", args.batch_dir / f"{stem}.results.jsonl"
+   )
+   ids = [batch_custom_id(i, p, args) for i, p in enumerate(prompts)]
+   client = http_pool.get_openai_client(args.base_url, args.api_key or os.getenv("OPENAI_API_KEY"))
+
+   if not job.pending:
+      todo = [(cid, prompt) for cid, prompt in zip(ids, prompts) if cid not in job.contents]
+      if todo:
+         path = args.batch_dir / f"{stem}.requests.jsonl"
+         batch_api.write_requests(todo, path, args.model, args.temperature, args.max_tokens)
+         batch = batch_api.submit(client, path, metadata={"output": str(args.output)})
+         job.pending.append(batch.id)
+         job.save()
+         retried = sum(cid in job.errors for cid, _ in todo)
+         print(f"已提交批次 {batch.id}：{len(todo)} 个请求（其中重新提交失败请求 {retried} 个）")
+
+   job.results_path.parent.mkdir(parents=True, exist_ok=True)
+   with job.results_path.open("a", encoding="utf-8") as out:
+      for batch_id in list(job.pending):
+         if args.no_wait:
+            batch = client.batches.retrieve(batch_id)
+            if batch.status not in batch_api.TERMINAL_STATUSES:
+               print(f"批次 {batch_id} 尚未结束（{batch.status}），稍后重新运行以取回结果")
+               continue
+         else:
+            batch = batch_api.wait(client, batch_id, args.poll_interval)
+         for custom_id, content, error in batch_api.iter_results(client, batch):
+            if error is None:
+               try:
+                  parse_batch_content(content)
+               except ValueError as exc:
+                  error = str(exc).splitlines()[0]
+            job.record(out, custom_id, content, error)
+         out.flush()
+         job.pending.remove(batch_id)
+         job.save()
+   if job.pending:
+      print(f"还有 {len(job.pending)} 个批次未结束，取回结果后再合并输出")
+      return
+
+   results: list[list[dict[str, Any]] | Exception] = []
+   for cid in ids:
+      if cid in job.contents:
+         results.append(parse_batch_content(job.contents[cid]))
+      else:
+         results.append(RuntimeError(job.errors.get(cid, "尚未取回结果")))
+   failed = sum(isinstance(r, Exception) for r in results)
+   combined = combine_batch_results(chunks, results, args.chunks_root)
+   write_records(combined, args.output, append=args.append)
+   telemetry.count("questions", len(combined))
+   print(f"已保存 {len(combined)} 道题目到 {args.output}（失败分块 {failed}/{len(chunks)}）")
+   if failed:
+      print("重新运行同一命令将只提交失败的请求")
+
+
+async def stream_single(
+   args: argparse.Namespace, prompt: str, cache: ResponseCache | None
+) -> list[dict[str, Any]]:
+   """单文件流式模式：每收到一道完整题目就打印题干，便于尽早检查生成质量。"""
+
+   shown = 0
+
+   def show(question: dict[str, Any]) -> None:
+      nonlocal shown
+      shown += 1
+      print(f"[{shown}] {' '.join(str(question.get('question', '')).split())[:60]}")
+
+   client = http_pool.get_async_openai_client(args.base_url, args.api_key or os.getenv("OPENAI_API_KEY"))
+   key = ResponseCache.make_key(prompt, args.model, args.temperature, args.max_tokens)
+   try:
+      return await request_questions_async(
+         client, prompt, args.model, args.temperature, args.max_tokens,
+         cache, args.refresh, stream=True, on_question=show,
+      )
+   except ValueError:
+      if cache is not None:
+         cache.delete(key)
+      raise
+   finally:
+      await http_pool.aclose_async_clients()
 
 
 # --------------------------- CLI ---------------------------
@@ -156,7 +975,11 @@ def main() -> None:
    parser = argparse.ArgumentParser(
       description="根据输入文本生成铝冶炼考核题提示词并可调用 ChatGPT API。"
    )
-   parser.add_argument("input", help="包含参考文本的文件路径")
+   parser.add_argument(
+      "input",
+      nargs="?",
+      help="包含参考文本的文件路径；--batch 时为 *_chunks.json 文件或其所在目录；使用 --topic 时省略",
+   )
    parser.add_argument(
       "--mode",
       choices=["objective", "reasoning"],
@@ -175,7 +998,12 @@ def main() -> None:
       "--output",
       default="./output/result.json",
       type=str,
-      help="结果输出路径（Json）。若未指定则打印到 ./output/result.json。",
+      help="结果输出路径（Json）。若未指定则打印到 ./output/result.json。批量模式下扩展名为 .jsonl 时每行一道题。",
+   )
+   parser.add_argument(
+      "--append",
+      action="store_true",
+      help="批量模式输出为 .jsonl 时追加到已有文件，而不是覆盖。",
    )
    parser.add_argument(
       "--dry-run",
@@ -199,15 +1027,153 @@ def main() -> None:
       default="https://api.openai.com/v1",
       help="OpenAI API 基础 URL，默认为官方地址。",
    )
+   parser.add_argument(
+      "--batch",
+      action="store_true",
+      help="批量模式：输入为 raw/splitter.py 输出的 *_chunks.json 或其目录，逐分块并发生成。",
+   )
+   parser.add_argument(
+      "--concurrency", type=int, default=8, help="批量模式下同时进行的最大请求数"
+   )
+   parser.add_argument(
+      "--batch-api",
+      action="store_true",
+      help="离线批量模式：通过 Files/Batches 接口一次性提交所有分块，轮询结束后取回结果；重跑时只提交失败的请求。",
+   )
+   parser.add_argument(
+      "--batch-dir",
+      type=Path,
+      default=Path("./output/batch_api"),
+      help="--batch-api 的请求文件、批次状态与逐请求结果所在目录",
+   )
+   parser.add_argument(
+      "--poll-interval",
+      type=float,
+      default=batch_api.DEFAULT_POLL_INTERVAL,
+      help="--batch-api 轮询批次状态的间隔（秒）",
+   )
+   parser.add_argument(
+      "--no-wait",
+      action="store_true",
+      help="--batch-api 提交后不等待；之后重新运行同一命令取回已结束批次的结果",
+   )
+   parser.add_argument(
+      "--chunks-root",
+      type=Path,
+      default=DEFAULT_CHUNKS_ROOT,
+      help="批量模式下题目 chunk.file 记为相对该目录的路径（如 <书>/<分块文件>），不在其下的文件只记文件名",
+   )
+   parser.add_argument(
+      "--pack-tokens",
+      type=int,
+      default=0,
+      help="批量模式下把同一 H1/H2 章节内相邻分块合并到该 token 预算以内（超出预算的分块会被切分），0 表示不合并",
+   )
+   parser.add_argument(
+      "--topic",
+      nargs="+",
+      default=None,
+      help="按考点出题：从检索索引中取与考点最相关的分块作为参考文本，每个考点生成一组题目",
+   )
+   parser.add_argument(
+      "--index", type=Path, default=DEFAULT_INDEX_DIR, help="--topic 使用的检索索引目录（utils/retrieval.py 建立）"
+   )
+   parser.add_argument("--top-k", type=int, default=8, help="--topic 每个考点最多检索的分块数")
+   parser.add_argument(
+      "--context-tokens",
+      type=int,
+      default=3000,
+      help="--topic 每个考点参考文本的 token 预算，按得分依次加入分块直到超出预算",
+   )
+   parser.add_argument(
+      "--stream",
+      action="store_true",
+      help="流式接收并增量解析输出：逐题产出，截断时保留已完整的题目，输出不合格式时提前中止请求。",
+   )
+   parser.add_argument(
+      "--pool-size",
+      type=int,
+      default=http_pool.DEFAULT_POOL_SIZE,
+      help="每个 base_url 的 keep-alive 连接池大小",
+   )
+   parser.add_argument(
+      "--timeout", type=float, default=http_pool.DEFAULT_TIMEOUT, help="单次请求超时（秒）"
+   )
+   parser.add_argument(
+      "--rpm", type=float, default=None, help="每分钟请求数上限（跨进程共享），默认根据响应头与 429 自适应"
+   )
+   parser.add_argument(
+      "--tpm", type=float, default=None, help="每分钟 token 数上限（跨进程共享），默认根据响应头与 429 自适应"
+   )
+   parser.add_argument(
+      "--no-rate-limit", action="store_true", help="关闭共享限速与 429 自动重试。"
+   )
+   parser.add_argument(
+      "--telemetry",
+      type=Path,
+      default=None,
+      help="把每次请求的延迟、token 用量与各阶段耗时追加写入该 JSONL 文件，结束时打印汇总",
+   )
+   parser.add_argument(
+      "--profile", type=Path, default=None, help="用 cProfile 分析本次运行并写出 .prof 文件"
+   )
+   parser.add_argument(
+      "--price",
+      type=float,
+      nargs=2,
+      metavar=("INPUT", "OUTPUT"),
+      default=None,
+      help="每百万输入/输出 token 的价格，用于在汇总中估算费用",
+   )
+   parser.add_argument(
+      "--no-cache", action="store_true", help="不读取也不写入本地响应缓存。"
+   )
+   parser.add_argument(
+      "--refresh",
+      action="store_true",
+      help="忽略已有缓存强制重新请求，并用新结果覆盖缓存。",
+   )
+   parser.add_argument(
+      "--cache-path", type=Path, default=DEFAULT_CACHE_PATH, help="响应缓存 SQLite 文件路径"
+   )
+   parser.add_argument(
+      "--cache-max-mb",
+      type=float,
+      default=DEFAULT_MAX_BYTES / 1024 / 1024,
+      help="缓存总大小上限（MB），超出后按最近访问时间淘汰",
+   )
+   parser.add_argument(
+      "--cache-max-age-days",
+      type=float,
+      default=DEFAULT_MAX_AGE_DAYS,
+      help="缓存条目最长保留天数，<=0 表示不过期",
+   )
 
    args = parser.parse_args()
+   if args.input is None and not args.topic:
+      parser.error("需要给出 input 或 --topic")
+   http_pool.configure(
+      pool_size=args.pool_size,
+      timeout=args.timeout,
+      rpm=args.rpm,
+      tpm=args.tpm,
+      rate_limit=not args.no_rate_limit,
+   )
+   if args.telemetry or args.profile:
+      telemetry.enable(
+         args.telemetry or Path("./output/telemetry.jsonl"), profile=args.profile, prices=args.price
+      )
 
-   input_text = load_text(args.input)
+   if args.batch_api:
+      run_batch_api(args)
+      return
 
-   if args.mode == "objective":
-      prompt = build_objective_prompt(input_text, args.single_choice, args.true_false)
-   else:
-      prompt = build_reasoning_prompt(input_text, args.reasoning_count)
+   if args.batch or args.topic:
+      run_batch(args)
+      return
+
+   input_text = load_text(args.input)
+   prompt = build_prompt(args, input_text)
 
    if args.print_prompt or args.dry_run:
       print("\n----- PROMPT BEGIN -----\n")
@@ -218,20 +1184,46 @@ def main() -> None:
       return
 
    # 调用 API
-   content = call_chat_completion(
-      prompt=prompt,
-      model=args.model,
-      temperature=args.temperature,
-      max_tokens=args.max_tokens,
-      api_key=args.api_key or os.getenv("OPENAI_API_KEY"),
-      base_url=args.base_url,
-   )
+   cache = open_cache(args)
+   if args.stream:
+      try:
+         parsed = asyncio.run(stream_single(args, prompt, cache))
+      finally:
+         if cache is not None:
+            cache.close()
+      save_json(parsed, args.output)
+      telemetry.count("questions", len(parsed))
+      print(f"已保存 {len(parsed)} 道题目到 {args.output}")
+      return
 
-   if not content:
-      raise RuntimeError("模型未返回内容，请重试或检查参数。")
+   try:
+      content = call_chat_completion(
+         prompt=prompt,
+         model=args.model,
+         temperature=args.temperature,
+         max_tokens=args.max_tokens,
+         api_key=args.api_key or os.getenv("OPENAI_API_KEY"),
+         base_url=args.base_url,
+         cache=cache,
+         refresh=args.refresh,
+      )
+
+      if not content:
+         raise RuntimeError("模型未返回内容，请重试或检查参数。")
 
-   parsed = parse_json_content(content)
+      try:
+         parsed = parse_json_content(content)
+      except ValueError:
+         if cache is not None:
+            cache.delete(
+               ResponseCache.make_key(prompt, args.model, args.temperature, args.max_tokens)
+            )
+         raise
+   finally:
+      if cache is not None:
+         cache.close()
 
+   telemetry.count("questions", len(normalize_questions(parsed)))
    if args.output:
       save_json(parsed, args.output)
       print(f"已保存结果到 {args.output}")
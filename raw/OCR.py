@@ -1,174 +1,448 @@
 import argparse
-import requests
 import json
 from pathlib import Path
 import time
 import hashlib
 import zipfile
 import os
+import random
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import http_pool, telemetry  # noqa: E402
 
 token = ""
 header = {}
+api_base = "https://mineru.net/api/v4"
 pdf_url = Path('./materials/processed/')
 
-def construct_pdf_data(pdf_url: Path = pdf_url) :
-    hash_file = pdf_url / 'cache.json'
-    
+MANIFEST_NAME = 'manifest.json'
+LEGACY_CACHE_NAME = 'cache.json'
+HASH_BLOCK_SIZE = 1 << 20
+UPLOAD_STATE_NAME = 'upload_state.json'
+UPLOAD_URL_TTL = 23 * 3600  # presigned upload URLs are valid for 24 hours
+FINAL_STATES = {"done", "failed"}
+POLL_MIN_INTERVAL = 2.0
+POLL_MAX_INTERVAL = 30.0
+DOWNLOAD_BLOCK_SIZE = 1 << 20
+ZIP_SPOOL_SIZE = 16 << 20  # zips larger than this spill from memory to a temp file
+FULLPAGES_SUFFIX = '_fullpages.pdf'
+
+
+def hash_file(path: Path, block_size: int = HASH_BLOCK_SIZE) -> str:
+    """SHA-256 of a file, read in fixed-size blocks so memory stays flat."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(pdf_url: Path = pdf_url) -> dict:
+    """Load ``manifest.json`` (relative path -> size, mtime_ns, sha256, processed_sha256).
+
+    A legacy ``cache.json`` (file name -> hash of the last processed version) is
+    migrated on first use so already OCR'd files are not resubmitted.
+    """
     try:
-        with open(hash_file, 'r', encoding='utf-8') as f:
-            processed_files = json.load(f)
+        with open(pdf_url / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
-        processed_files = {}
+        pass
+
+    manifest = {}
+    try:
+        with open(pdf_url / LEGACY_CACHE_NAME, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+        for name, file_hash in legacy.items():
+            if _superseded_by_pages(pdf_url / name, pdf_url):
+                print(f"{name} was OCR'd as a whole before; its per-page files are OCR'd instead. "
+                      f"Remove its old result folder to avoid duplicate chunks.")
+                continue
+            manifest[name] = {"processed_sha256": file_hash}
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return manifest
+
+
+def save_manifest(manifest: dict, pdf_url: Path = pdf_url) -> None:
+    tmp_file = pdf_url / (MANIFEST_NAME + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, pdf_url / MANIFEST_NAME)
+
+
+def _superseded_by_pages(pdf_file: Path, pdf_url: Path) -> bool:
+    """A top-level ``<stem>_fullpages.pdf`` whose per-book folder ``<stem>/`` exists."""
+    name = pdf_file.name
+    return (
+        pdf_file.parent == pdf_url
+        and name.endswith(FULLPAGES_SUFFIX)
+        and (pdf_url / name[:-len(FULLPAGES_SUFFIX)]).is_dir()
+    )
+
+
+def iter_ocr_inputs(pdf_url: Path = pdf_url):
+    """Yield the PDFs to OCR under ``pdf_url``: each book folder's page files plus top-level PDFs.
+
+    A book's ``<stem>_fullpages.pdf`` is skipped when its folder exists, so every
+    page is OCR'd exactly once.
+    """
+    for pdf_file in sorted(pdf_url.rglob("*.pdf")):
+        if not _superseded_by_pages(pdf_file, pdf_url):
+            yield pdf_file
+
+
+def scan_pdfs(pdf_url: Path = pdf_url, manifest: dict | None = None, workers: int = 8) -> dict:
+    """Refresh ``manifest`` for every PDF returned by :func:`iter_ocr_inputs`.
+
+    Files whose size and mtime match the manifest keep their recorded hash; the
+    rest are hashed once, in parallel. Entries for deleted files are dropped.
+    """
+    manifest = load_manifest(pdf_url) if manifest is None else manifest
+    current = {}
+    to_hash = []
+    for pdf_file in iter_ocr_inputs(pdf_url):
+        rel = pdf_file.relative_to(pdf_url).as_posix()
+        stat = pdf_file.stat()
+        entry = dict(manifest.get(rel, {}))
+        if entry.get("sha256") and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            current[rel] = entry
+            continue
+        entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        current[rel] = entry
+        to_hash.append((rel, pdf_file))
+
+    if to_hash:
+        print(f"Hashing {len(to_hash)} new or modified PDF files...")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for rel, file_hash in zip((r for r, _ in to_hash), pool.map(hash_file, (p for _, p in to_hash))):
+                current[rel]["sha256"] = file_hash
 
-    files_to_process = []
-    current_files = {}
+    manifest.clear()
+    manifest.update(current)
+    return manifest
 
-    for pdf_file in pdf_url.glob("*.pdf"):
-        with open(pdf_file, 'rb') as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
-        
-        current_files[pdf_file.name] = file_hash
-        
-        if pdf_file.name not in processed_files or processed_files[pdf_file.name] != file_hash:
-            files_to_process.append(pdf_file)
 
+def construct_pdf_data(pdf_url: Path = pdf_url, hash_workers: int = 8) :
+    manifest = scan_pdfs(pdf_url, workers=hash_workers)
+    save_manifest(manifest, pdf_url)
+
+    files_to_process = [
+        rel for rel, entry in manifest.items()
+        if entry.get("processed_sha256") != entry["sha256"]
+    ]
 
     if not files_to_process:
         print("No new or modified PDF files to process.")
         return [], {}
-    
+
     file_path = []
     data = {
         "files": [],
         "model_version":"vlm"
     }
-    for pdf_file in files_to_process:
-        with open(pdf_file, 'rb') as f:
-            data_id = hashlib.sha256(f.read()).hexdigest()
-        file_info = {"name":pdf_file.name, "data_id": data_id}
+    seen = set()
+    for rel in files_to_process:
+        # identical content only needs one OCR job; download_results fans it out
+        if manifest[rel]["sha256"] in seen:
+            continue
+        seen.add(manifest[rel]["sha256"])
+        pdf_file = pdf_url / rel
+        file_info = {"name":pdf_file.name, "data_id": manifest[rel]["sha256"]}
         data["files"].append(file_info)
         file_path.append(pdf_file)
     return file_path, data
 
-def upload_pdfs(file_path, data):
-    url = "https://mineru.net/api/v4/file-urls/batch"
+def load_upload_state(pdf_url: Path = pdf_url) -> dict:
+    try:
+        with open(pdf_url / UPLOAD_STATE_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_upload_state(state: dict, pdf_url: Path = pdf_url) -> None:
+    tmp_file = pdf_url / (UPLOAD_STATE_NAME + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, pdf_url / UPLOAD_STATE_NAME)
+
+
+def clear_upload_state(pdf_url: Path = pdf_url) -> None:
+    (pdf_url / UPLOAD_STATE_NAME).unlink(missing_ok=True)
+
+
+def _resumable_state(state: dict, data: dict) -> bool:
+    """An interrupted batch can be resumed if it covers the same files and its URLs are still valid."""
+    if not state.get("batch_id") or time.time() - state.get("created", 0) > UPLOAD_URL_TTL:
+        return False
+    wanted = {info["data_id"] for info in data["files"]}
+    return wanted == set(state.get("files", {}))
+
+
+def _apply_upload_urls(file_path, data) -> dict | None:
+    url = f"{api_base}/file-urls/batch"
+    start = time.perf_counter()
+    response = http_pool.get_session(url).post(url,headers=header,json=data)
+    telemetry.request("ocr.apply_urls", time.perf_counter() - start, status=response.status_code, files=len(data["files"]))
+    if response.status_code != 200:
+        print('response not success. status:{} ,result:{}'.format(response.status_code, response))
+        return None
+    result = response.json()
+    print('response success. result:{}'.format(result))
+    if result["code"] != 0:
+        print('apply upload url failed,reason:{}'.format(result.get("msg")))
+        return None
+    batch_id = result["data"]["batch_id"]
+    urls = result["data"]["file_urls"]
+    print('batch_id:{},urls:{}'.format(batch_id, urls))
+    return {
+        "batch_id": batch_id,
+        "created": time.time(),
+        "files": {
+            info["data_id"]: {"path": str(path), "url": upload_url, "uploaded": False}
+            for info, path, upload_url in zip(data["files"], file_path, urls)
+        },
+    }
+
+
+def _put_file(path: Path, upload_url: str, retries: int, backoff: float) -> bool:
+    """PUT one file to its presigned URL, streaming from disk, retrying with exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            with open(path, 'rb') as f:
+                res_upload = http_pool.get_session(upload_url).put(upload_url, data=f)
+            if res_upload.status_code == 200:
+                return True
+            print(f"{path.name} upload failed, HTTP status: {res_upload.status_code}")
+        except Exception as err:
+            print(f"{path.name} upload error: {err}")
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+    return False
+
+
+def upload_pdfs(file_path, data, workers: int = 4, retries: int = 3, backoff: float = 1.0, pdf_url: Path = pdf_url):
+    """Upload files in parallel and return the batch id once every file is uploaded.
+
+    Progress is persisted to ``upload_state.json`` after each file, so an
+    interrupted run reuses the same batch and only uploads what is missing.
+    Returns ``None`` if any file still fails after ``retries`` attempts.
+    """
     if not file_path:
         print("No files to upload.")
         return None
-    try:
-        response = requests.post(url,headers=header,json=data)
-        if response.status_code == 200:
-            result = response.json()
-            print('response success. result:{}'.format(result))
-            if result["code"] == 0:
-                batch_id = result["data"]["batch_id"]
-                urls = result["data"]["file_urls"]
-                print('batch_id:{},urls:{}'.format(batch_id, urls))
-                for i in range(0, len(urls)):
-                    with open(file_path[i], 'rb') as f:
-                        res_upload = requests.put(urls[i], data=f)
-                        if res_upload.status_code == 200:
-                            print(f"{urls[i]} upload success")
-                        else:
-                            print(f"{urls[i]} upload failed")
-            else:
-                print('apply upload url failed,reason:{}'.format(result.msg))
-        else:
-            print('response not success. status:{} ,result:{}'.format(response.status_code, response))
-    except Exception as err:
-        print(err)
-    return batch_id
-    
-def get_resolve_result(batch_id: str):
-    url = f"https://mineru.net/api/v4/extract-results/batch/{batch_id}"
-    while True:    
+
+    state = load_upload_state(pdf_url)
+    if _resumable_state(state, data):
+        print(f"Resuming upload for batch {state['batch_id']}.")
+    else:
         try:
-            res = requests.get(url, headers=header)
-            if res.status_code == 200:
-                result = res.json()
-                if result.get("code") == 0:
-                    extract_results = result.get("data", {}).get("extract_result", [])
-                    if not extract_results:
-                        print("No extract results found.")
-                        break
-                    
-                    all_done = all(file.get("state") == "done" for file in extract_results)
-                    
-                    if all_done:
-                        print("All files processed successfully.")
-                        return result
-                    else:
-                        print("Processing not complete, waiting...")
-                        # Optional: print status of each file
-                        for file in extract_results:
-                            print(f"File: {file.get('file_name')}, Status: {file.get('state')}")
-                        time.sleep(5) # Wait for 5 seconds before polling again
-                else:
-                    print(f"API error: {result.get('msg')}")
-                    break
-            else:
+            state = _apply_upload_urls(file_path, data)
+        except Exception as err:
+            print(err)
+            return None
+        if state is None:
+            return None
+        save_upload_state(state, pdf_url)
+
+    pending = {
+        data_id: entry for data_id, entry in state["files"].items()
+        if not entry["uploaded"]
+    }
+    lock = threading.Lock()
+
+    def upload_one(item):
+        data_id, entry = item
+        path = Path(entry["path"])
+        with telemetry.span("ocr.upload", item=path.name, bytes=path.stat().st_size) as fields:
+            ok = _put_file(path, entry["url"], retries, backoff)
+            fields["ok"] = ok
+        if ok:
+            with lock:
+                state["files"][data_id]["uploaded"] = True
+                save_upload_state(state, pdf_url)
+            print(f"{entry['path']} upload success")
+        return ok
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        failed = list(pool.map(upload_one, pending.items())).count(False)
+
+    if failed:
+        print(f"{failed} file(s) failed to upload; rerun to resume the remaining uploads.")
+        return None
+    return state["batch_id"]
+
+def iter_resolved_results(batch_id: str, min_interval: float = POLL_MIN_INTERVAL, max_interval: float = POLL_MAX_INTERVAL):
+    """Poll a batch and yield each extract result as soon as it reaches a final state.
+
+    The poll interval drops back to ``min_interval`` whenever new files finish and
+    backs off towards ``max_interval`` while nothing changes.
+    """
+    url = f"{api_base}/extract-results/batch/{batch_id}"
+    seen = set()
+    interval = min_interval
+    started = time.perf_counter()
+    while True:
+        try:
+            poll_start = time.perf_counter()
+            res = http_pool.get_session(url).get(url, headers=header)
+            telemetry.request("ocr.poll", time.perf_counter() - poll_start, status=res.status_code)
+            if res.status_code != 200:
                 print(f"HTTP error: {res.status_code}")
-                break
+                return
+            result = res.json()
+            if result.get("code") != 0:
+                print(f"API error: {result.get('msg')}")
+                return
         except Exception as err:
             print(err)
             return
 
+        extract_results = result.get("data", {}).get("extract_result", [])
+        if not extract_results:
+            print("No extract results found.")
+            return
 
-def download_results(result, download_dir: Path = Path('./materials/ocr/'), pdf_url: Path = pdf_url):
-    download_dir.mkdir(parents=True, exist_ok=True)
-    extract_results = result.get("data", {}).get("extract_result", [])
-    
-    hash_file = pdf_url / 'cache.json'
+        finished = 0
+        for file in extract_results:
+            key = file.get("data_id") or file.get("file_name")
+            if file.get("state") not in FINAL_STATES:
+                continue
+            finished += 1
+            if key not in seen:
+                seen.add(key)
+                interval = min_interval
+                # time from the first poll until the result was seen, an upper bound on server-side processing
+                telemetry.record("ocr.extract", time.perf_counter() - started, item=file.get("file_name"), state=file.get("state"))
+                yield file
+
+        if finished == len(extract_results):
+            print("All files processed.")
+            return
+        print(f"Processing: {finished}/{len(extract_results)} files finished, next poll in {interval:.0f}s")
+        time.sleep(interval)
+        interval = min(max_interval, interval * 1.5)
+
+
+def _result_targets(file: dict, manifest: dict) -> list:
+    """Manifest entries (relative paths) that a MinerU extract result belongs to.
+
+    Results are matched on ``data_id`` (the file's SHA-256) because page files
+    from different book folders share the same file name.
+    """
+    data_id = file.get("data_id")
+    targets = [
+        rel for rel, entry in manifest.items()
+        if data_id and entry.get("sha256") == data_id
+    ]
+    if not targets:
+        targets = [rel for rel in manifest if rel == file.get("file_name")]
+    return targets
+
+
+def download_one(file: dict, targets: list, download_dir: Path) -> bool:
+    """Stream one result zip into a spooled temp file and extract it for every target."""
+    file_name = file.get("file_name")
+    download_url = file.get("full_zip_url")
+    if file.get("state") != "done" or not download_url:
+        print(f"No download URL for {file_name} (state: {file.get('state')}, {file.get('err_msg', '')})")
+        return False
     try:
-        with open(hash_file, 'r', encoding='utf-8') as f:
-            processed_files = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        processed_files = {}
-    
-    for file in extract_results:
-        file_name = file.get("file_name")
-        download_url = file.get("full_zip_url")
-        if download_url:
-            try:
-                res = requests.get(download_url)
-                if res.status_code == 200:
-                    with open(download_dir / (file_name + '.zip'), 'wb') as f:
-                        f.write(res.content)
-                    print(f"Downloaded {file_name} successfully.")
-                    
-                    zip_path = download_dir / (file_name + '.zip')
-                    try:
-                        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                            zip_ref.extractall(download_dir / file_name)
-                        print(f"Unzipped {file_name}.zip successfully.")
-                        os.remove(zip_path)
-                        
-                        with open(pdf_url / file_name, 'rb') as f:
-                            file_hash = hashlib.sha256(f.read()).hexdigest()
-                        processed_files[Path(file_name).name] = file_hash
-                        
-                    except zipfile.BadZipFile:
-                        print(f"Error: The file {zip_path} is not a valid zip file.")
-                    except Exception as e:
-                        print(f"An error occurred while unzipping {zip_path}: {e}")
-                else:
-                    print(f"Failed to download {file_name}, HTTP status: {res.status_code}")
-            except Exception as err:
-                print(f"Error downloading {file_name}: {err}")
-        else:
-            print(f"No download URL for {file_name}")
-
-    with open(hash_file, 'w', encoding='utf-8') as f:
-        json.dump(processed_files, f, ensure_ascii=False, indent=4)
+        with http_pool.get_session(download_url).get(download_url, stream=True) as res:
+            if res.status_code != 200:
+                print(f"Failed to download {file_name}, HTTP status: {res.status_code}")
+                return False
+            with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_SIZE) as spool:
+                for block in res.iter_content(chunk_size=DOWNLOAD_BLOCK_SIZE):
+                    spool.write(block)
+                spool.seek(0)
+                print(f"Downloaded {file_name} successfully.")
+                with zipfile.ZipFile(spool, 'r') as zip_ref:
+                    for rel in targets:
+                        zip_ref.extractall(download_dir / rel)
+        print(f"Unzipped {file_name}.zip successfully.")
+        return True
+    except zipfile.BadZipFile:
+        print(f"Error: The result for {file_name} is not a valid zip file.")
+    except Exception as err:
+        print(f"Error downloading {file_name}: {err}")
+    return False
+
+
+def download_results(results, download_dir: Path = Path('./materials/ocr/'), pdf_url: Path = pdf_url, workers: int = 4):
+    """Download and extract finished results with a bounded worker pool.
+
+    ``results`` is any iterable of extract results, typically
+    :func:`iter_resolved_results`, so downloads overlap with server-side
+    processing. The manifest is saved after every extracted file. Returns the
+    number of results that could not be downloaded or extracted.
+    """
+    download_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(pdf_url)
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max(1, workers) * 2)
+
+    def worker(file, targets):
+        try:
+            with telemetry.span("ocr.download", item=file.get("file_name")) as fields:
+                ok = fields["ok"] = download_one(file, targets, download_dir)
+            if ok:
+                with lock:
+                    for rel in targets:
+                        manifest[rel]["processed_sha256"] = manifest[rel]["sha256"]
+                    save_manifest(manifest, pdf_url)
+            return ok
+        finally:
+            slots.release()
+
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for file in results:
+            targets = _result_targets(file, manifest)
+            if not targets:
+                print(f"No local PDF matches result {file.get('file_name')}, skipping.")
+                continue
+            slots.acquire()
+            futures[pool.submit(worker, file, targets)] = file.get("file_name")
+
+    failed = 0
+    for future, file_name in futures.items():
+        try:
+            ok = future.result()
+        except Exception as err:
+            print(f"Error processing result {file_name}: {err}")
+            ok = False
+        failed += not ok
+    if failed:
+        print(f"{failed} result(s) failed to download; rerun to retry them.")
+    return failed
 
 def _parse_args():
     parser = argparse.ArgumentParser(description="Upload PDFs for OCR processing and download results.")
     parser.add_argument("--api-key", type=str, help="API key for authentication", required=False)
+    parser.add_argument("--pool-size", type=int, default=http_pool.DEFAULT_POOL_SIZE, help="Keep-alive connection pool size per host")
+    parser.add_argument("--timeout", type=float, default=http_pool.DEFAULT_TIMEOUT, help="Per-request read timeout in seconds")
+    parser.add_argument("--rpm", type=float, default=None, help="Requests per minute per endpoint, shared across processes (default: adapt to 429s)")
+    parser.add_argument("--no-rate-limit", action="store_true", help="Disable the shared rate limiter and automatic 429 retries")
+    parser.add_argument("--hash-workers", type=int, default=8, help="Threads used to hash new or modified PDFs")
+    parser.add_argument("--upload-workers", type=int, default=4, help="Parallel uploads to presigned URLs")
+    parser.add_argument("--upload-retries", type=int, default=3, help="Retries per file before an upload is given up")
+    parser.add_argument("--download-workers", type=int, default=4, help="Parallel result downloads and extractions")
+    parser.add_argument("--telemetry", type=Path, default=None, help="Append per-stage timings and request latencies to this JSONL file and print a summary")
+    parser.add_argument("--profile", type=Path, default=None, help="Run the main thread under cProfile and write the stats here")
     return parser.parse_args()
 
 
 def main():
     args = _parse_args()
+    http_pool.configure(pool_size=args.pool_size, timeout=args.timeout, rpm=args.rpm, rate_limit=not args.no_rate_limit)
+    if args.telemetry or args.profile:
+        telemetry.enable(args.telemetry or Path("./output/telemetry.jsonl"), profile=args.profile)
     global token, header
     token = args.api_key if args.api_key else token
     header = {
@@ -176,12 +450,12 @@ def main():
         "Authorization": f"Bearer {token}"
     }
     
-    file_path, data = construct_pdf_data()
-    batch_id = upload_pdfs(file_path, data)
+    with telemetry.span("ocr.scan"):
+        file_path, data = construct_pdf_data(hash_workers=args.hash_workers)
+    batch_id = upload_pdfs(file_path, data, workers=args.upload_workers, retries=args.upload_retries)
     if batch_id:
-        result = get_resolve_result(batch_id)
-        if result:
-            download_results(result)
+        download_results(iter_resolved_results(batch_id), workers=args.download_workers)
+        clear_upload_state()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,94 +6,517 @@ Usage (from repo root):
 Examples:
     python -m raw.SlicePDF "example.pdf"
     python -m raw.SlicePDF path/to/pdf/dir/
+    python -m raw.SlicePDF --dir path/to/pdf/dir/ --jobs 8
+    python -m raw.SlicePDF --dir "example.pdf" --pages-per-file 20
 """
 
 from __future__ import annotations
 
 import argparse
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
-from pypdf import PdfReader, PdfWriter
+from pypdf import PageObject, PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    StreamObject,
+)
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import telemetry  # noqa: E402
 
-def split_pdf(pdf_path: Path, materials_dir: Optional[Path] = None, from_z_lib: bool = False) -> Path:
-    """Split a PDF into single-page PDFs inside a folder named after the file.
+DEFAULT_RANGE_SIZE = 50
+INDEX_NAME = "pages_index.json"
+READER_CACHE_BYTES = 32 * 1024 * 1024
+# StreamingPdfWriter copies encoded stream bytes through pypdf's private
+# ``StreamObject._data``; requirements.txt pins the pypdf versions it was tested
+# with, and the buffered PdfWriter path is used if a release drops the attribute.
+STREAMING_SUPPORTED = hasattr(StreamObject(), "_data")
 
-    Args:
-        pdf_path: Path to the PDF file. Can be absolute or relative. If relative,
-            it is resolved against the provided ``materials_dir`` or the default
-            ``materials`` folder at the repo root.
-        materials_dir: Base directory containing PDF materials. If omitted, the
-            repo's ``materials`` folder is used.
-
-    Returns:
-        Path to the output folder containing the per-page PDFs.
 
-    Raises:
-        FileNotFoundError: If the PDF file does not exist.
-        ValueError: If the path does not point to a PDF file.
-    """
-    
+def _resolve_pdf(pdf_path: Path, materials_dir: Optional[Path] = None) -> Path:
     base_dir = materials_dir or Path(__file__).resolve().parent.parent
     resolved_pdf = (base_dir / pdf_path).resolve() if not pdf_path.is_absolute() else pdf_path
-     
+
     if not resolved_pdf.exists():
         raise FileNotFoundError(f"PDF not found: {resolved_pdf}")
     if resolved_pdf.suffix.lower() != ".pdf":
         raise ValueError(f"Expected a PDF file, got: {resolved_pdf.suffix}")
-    output_dir = resolved_pdf.parent.parent / "processed" / resolved_pdf.stem
-    output_dir.mkdir(parents=True, exist_ok=True)
-    reader = PdfReader(resolved_pdf)
-    idx = 0
-    
-    fullpage = PdfWriter()
+    return resolved_pdf
+
+
+def select_pages(reader: PdfReader, from_z_lib: bool = False) -> list[int]:
+    """Return the source page indices to keep, in output order.
+
+    With ``from_z_lib`` landscape pages are dropped, together with the portrait
+    page right before each run of landscape pages (Z-Library duplicate scans).
+    """
+    kept: list[int] = []
     about_to_remove = False
-    for page in reader.pages:
+    for i, page in enumerate(reader.pages):
         if from_z_lib:
             if page.mediabox.width > page.mediabox.height:
                 about_to_remove = True
                 continue
-            if about_to_remove and page.mediabox.width <= page.mediabox.height:
-                fullpage.remove_page(idx-1)
-                idx -= 1
+            if about_to_remove:
+                if kept:
+                    kept.pop()
                 about_to_remove = False
-        idx += 1
-        writer = PdfWriter()
-        writer.add_page(page)
-        fullpage.add_page(page)
-        out_path = output_dir / f"page_{idx:03d}.pdf"
-        with out_path.open("wb") as f:
-            writer.write(f)
-
-    fullpage_path = output_dir.parent / f"{resolved_pdf.stem}_fullpages.pdf"
-    with fullpage_path.open("wb") as f:
-        fullpage.write(f)
+        kept.append(i)
+    return kept
+
+
+def _stream_length(obj) -> int:
+    obj = obj.get_object()
+    if isinstance(obj, ArrayObject):
+        return sum(_stream_length(item) for item in obj)
+    if isinstance(obj, StreamObject):
+        # pypdf drops /Length once the stream is read; the raw encoded bytes are kept instead
+        data = getattr(obj, "_data", None)
+        return len(data) if data is not None else int(obj.get("/Length", 0))
+    return 0
+
+
+def estimate_page_bytes(page) -> int:
+    """Rough encoded size of a page: its content streams plus image/form XObjects."""
+    size = _stream_length(page["/Contents"]) if "/Contents" in page else 0
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is not None:
+        size += sum(_stream_length(x) for x in xobjects.get_object().values())
+    return size
+
+
+def group_pages(
+    pdf_path: Path,
+    kept: list[int],
+    pages_per_file: int = 1,
+    max_file_mb: Optional[float] = None,
+) -> list[tuple[str, list[int]]]:
+    """Group kept pages into output files.
+
+    Each group holds at most ``pages_per_file`` pages and, if ``max_file_mb`` is
+    set, stops before its estimated size exceeds the cap. Single-page groups keep
+    the ``page_NNN.pdf`` name; larger groups are named ``pages_NNN-MMM.pdf`` after
+    their first and last output page numbers.
+
+    Returns:
+        ``(file_name, source_page_indices)`` for each output file, in order.
+    """
+    batching = pages_per_file > 1 or max_file_mb is not None
+    limit = pages_per_file if pages_per_file > 1 else (len(kept) if batching else 1)
+    max_bytes = max_file_mb * 1024 * 1024 if max_file_mb else None
+    pages = iter_pages(pdf_path, kept) if max_bytes else None
+
+    groups: list[tuple[str, list[int]]] = []
+    current: list[int] = []
+    current_bytes = 0
+    first = 1
+
+    def flush() -> None:
+        last = first + len(current) - 1
+        name = f"page_{first:03d}.pdf" if not batching else f"pages_{first:03d}-{last:03d}.pdf"
+        groups.append((name, current))
+
+    for src_idx in kept:
+        page_bytes = estimate_page_bytes(next(pages)) if pages is not None else 0
+        if current and (len(current) >= limit or (max_bytes and current_bytes + page_bytes > max_bytes)):
+            flush()
+            first += len(current)
+            current, current_bytes = [], 0
+        current.append(src_idx)
+        current_bytes += page_bytes
+    if current:
+        flush()
+    return groups
+
+
+class StreamingPdfWriter:
+    """Write a PDF page by page, flushing each copied object to disk immediately.
+
+    Unlike :class:`pypdf.PdfWriter`, which keeps every page and resource in memory
+    until :meth:`~pypdf.PdfWriter.write`, only object numbers and file offsets are
+    retained, so memory does not grow with the size of the page content. Objects
+    shared between pages (fonts, ...) are written once. References to other
+    pages or the source page tree (e.g. link destinations) are dropped.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._f = path.open("wb")
+        self._f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self._offsets: dict[int, int] = {}
+        self._numbers: dict[tuple[int, int], int] = {}
+        self._kids: list[int] = []
+        self._next = 3  # 1 = catalog, 2 = page tree root; both written on close
+
+    def add_page(self, page: PageObject) -> None:
+        pending: deque = deque()
+        page_num = self._allocate(page.indirect_reference, pending, queue=False)
+        copy = self._copy(page, pending, skip=("/Parent",))
+        copy[NameObject("/Parent")] = IndirectObject(2, 0, None)
+        self._write(page_num, copy)
+        while pending:
+            num, obj = pending.popleft()
+            self._write(num, self._copy(obj.get_object(), pending))
+        self._kids.append(page_num)
+
+    def close(self) -> None:
+        pages = DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(n, 0, None) for n in self._kids),
+            NameObject("/Count"): NumberObject(len(self._kids)),
+        })
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(2, 0, None),
+        })
+        self._write(2, pages)
+        self._write(1, catalog)
+
+        xref_offset = self._f.tell()
+        self._f.write(f"xref\n0 {self._next}\n0000000000 65535 f \n".encode())
+        for num in range(1, self._next):
+            self._f.write(f"{self._offsets[num]:010d} 00000 n \n".encode())
+        self._f.write(
+            f"trailer\n<< /Size {self._next} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+        self._f.close()
+
+    def __enter__(self) -> "StreamingPdfWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+    def _allocate(self, ref: IndirectObject, pending: deque, queue: bool = True) -> int:
+        key = (ref.idnum, ref.generation)
+        num = self._numbers.get(key)
+        if num is None:
+            num = self._numbers[key] = self._next
+            self._next += 1
+            if queue:
+                pending.append((num, ref))
+        return num
+
+    def _copy(self, obj, pending: deque, skip: tuple[str, ...] = ()):
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in self._numbers:
+                target = obj.get_object()
+                if isinstance(target, DictionaryObject) and target.get("/Type") in ("/Page", "/Pages"):
+                    return NullObject()
+            return IndirectObject(self._allocate(obj, pending), 0, None)
+        if isinstance(obj, StreamObject):
+            copy = StreamObject()
+            copy._data = obj._data
+            for key, value in obj.items():
+                if key != "/Length":
+                    copy[NameObject(key)] = self._copy(value, pending)
+            return copy
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({
+                NameObject(key): self._copy(value, pending)
+                for key, value in obj.items() if key not in skip
+            })
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(item, pending) for item in obj)
+        return obj
+
+    def _write(self, num: int, obj) -> None:
+        self._offsets[num] = self._f.tell()
+        self._f.write(f"{num} 0 obj\n".encode())
+        obj.write_to_stream(self._f)
+        self._f.write(b"\nendobj\n")
+
+
+class BufferedPdfWriter:
+    """:class:`StreamingPdfWriter` stand-in backed by :class:`pypdf.PdfWriter`.
+
+    Keeps every page in memory until :meth:`close`; used when the installed
+    pypdf lacks the internals the streaming writer relies on.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._writer = PdfWriter()
+
+    def add_page(self, page: PageObject) -> None:
+        self._writer.add_page(page)
+
+    def close(self) -> None:
+        with self._path.open("wb") as f:
+            self._writer.write(f)
+
+    def __enter__(self) -> "BufferedPdfWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+
+
+def open_page_writer(path: Path) -> StreamingPdfWriter | BufferedPdfWriter:
+    """Return a streaming writer for ``path``, or a buffered one on unsupported pypdf versions."""
+    return StreamingPdfWriter(path) if STREAMING_SUPPORTED else BufferedPdfWriter(path)
+
+
+def iter_pages(pdf_path: Path, src_indices: Iterable[int]) -> Iterator[PageObject]:
+    """Yield source pages while keeping the reader's memory bounded.
+
+    The reader is given an open file rather than a path, because pypdf reads a
+    path fully into memory. It also caches every object it resolves, so once the
+    pages read exceed ``READER_CACHE_BYTES`` that cache is dropped; objects are
+    re-read from disk on demand and the already parsed page tree is kept. The
+    cache is pypdf's private ``resolved_objects``; if it is missing, nothing is
+    dropped and the reader's memory grows with the pages read.
+    """
+    with pdf_path.open("rb") as fh:
+        reader = PdfReader(fh)
+        resolved = getattr(reader, "resolved_objects", None)
+        cached = 0
+        for src_idx in src_indices:
+            if cached >= READER_CACHE_BYTES and isinstance(resolved, dict):
+                resolved.clear()
+                cached = 0
+            page = reader.pages[src_idx]
+            cached += estimate_page_bytes(page)
+            yield page
+
+
+def write_groups(
+    pdf_path: Path,
+    output_dir: Path,
+    groups: list[tuple[str, list[int]]],
+    fullpage_path: Optional[Path] = None,
+) -> float:
+    """Write one PDF per ``(file_name, source_page_indices)`` group.
+
+    If ``fullpage_path`` is given, the same pages are streamed into it in the
+    same pass. Returns the elapsed time so process-pool callers can report
+    per-book CPU time.
+    """
+    start = time.perf_counter()
+    fullpage = open_page_writer(fullpage_path) if fullpage_path else None
+    pages = iter_pages(pdf_path, (i for _, src_indices in groups for i in src_indices))
+    try:
+        for file_name, src_indices in groups:
+            writer = PdfWriter()
+            for _ in src_indices:
+                page = next(pages)
+                if fullpage is not None:
+                    fullpage.add_page(page)
+                writer.add_page(page)
+            with (output_dir / file_name).open("wb") as f:
+                writer.write(f)
+    finally:
+        if fullpage is not None:
+            fullpage.close()
+    return time.perf_counter() - start
+
+
+def write_index(pdf_path: Path, output_dir: Path, groups: list[tuple[str, list[int]]]) -> Path:
+    """Write ``pages_index.json`` mapping each output file to its 1-based source page numbers."""
+    index = {
+        "source": pdf_path.name,
+        "files": {name: [i + 1 for i in src_indices] for name, src_indices in groups},
+    }
+    index_path = output_dir / INDEX_NAME
+    index_path.write_text(json.dumps(index, ensure_ascii=False, indent=4), encoding="utf-8")
+    return index_path
+
+
+def write_fullpages(pdf_path: Path, fullpage_path: Path, kept: list[int]) -> float:
+    """Stream the kept pages into a single ``<stem>_fullpages.pdf``."""
+    start = time.perf_counter()
+    with open_page_writer(fullpage_path) as fullpage:
+        for page in iter_pages(pdf_path, kept):
+            fullpage.add_page(page)
+    return time.perf_counter() - start
+
+
+def plan_split(
+    pdf_path: Path,
+    materials_dir: Optional[Path] = None,
+    from_z_lib: bool = False,
+    pages_per_file: int = 1,
+    max_file_mb: Optional[float] = None,
+) -> tuple[Path, Path, list[int], list[tuple[str, list[int]]]]:
+    """Resolve the PDF, create its output folder, pick the pages to keep and group them."""
+    resolved_pdf = _resolve_pdf(pdf_path, materials_dir)
+    output_dir = resolved_pdf.parent.parent / "processed" / resolved_pdf.stem
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with resolved_pdf.open("rb") as fh:
+        kept = select_pages(PdfReader(fh), from_z_lib)
+    groups = group_pages(resolved_pdf, kept, pages_per_file, max_file_mb)
+    return resolved_pdf, output_dir, kept, groups
+
+
+def split_pdf(
+    pdf_path: Path,
+    materials_dir: Optional[Path] = None,
+    from_z_lib: bool = False,
+    pages_per_file: int = 1,
+    max_file_mb: Optional[float] = None,
+) -> Path:
+    """Split a PDF into single-page (or page-range) PDFs inside a folder named after the file.
+
+    Args:
+        pdf_path: Path to the PDF file. Can be absolute or relative. If relative,
+            it is resolved against the provided ``materials_dir`` or the default
+            ``materials`` folder at the repo root.
+        materials_dir: Base directory containing PDF materials. If omitted, the
+            repo's ``materials`` folder is used.
+        from_z_lib: Remove redundant landscape scans from Z-Library PDFs.
+        pages_per_file: Pages per output file; see :func:`group_pages`.
+        max_file_mb: Optional estimated size cap per output file.
+
+    Returns:
+        Path to the output folder containing the per-page PDFs and ``pages_index.json``.
+
+    Raises:
+        FileNotFoundError: If the PDF file does not exist.
+        ValueError: If the path does not point to a PDF file.
+    """
+    resolved_pdf, output_dir, kept, groups = plan_split(
+        pdf_path, materials_dir, from_z_lib, pages_per_file, max_file_mb
+    )
+    write_index(resolved_pdf, output_dir, groups)
+    write_groups(resolved_pdf, output_dir, groups, output_dir.parent / f"{resolved_pdf.stem}_fullpages.pdf")
     return output_dir
 
 
+def _timed_task(fn, *args) -> tuple[float, float, float]:
+    """Run one pool task and return its ``(start, end, seconds)`` measured inside the worker.
+
+    ``start``/``end`` are wall-clock timestamps so they compare across processes;
+    ``seconds`` excludes the time the task spent queued behind other tasks.
+    """
+    start = time.time()
+    _, seconds = telemetry.timed_call(fn, *args)
+    return start, time.time(), seconds
+
+
+def split_pdfs_parallel(
+    pdf_files: list[Path],
+    jobs: int,
+    from_z_lib: bool = False,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    pages_per_file: int = 1,
+    max_file_mb: Optional[float] = None,
+) -> dict[Path, tuple[float, float]]:
+    """Split several PDFs with a process pool, in parallel across and within books.
+
+    Each book's output files are cut into tasks of about ``range_size`` pages, and
+    every task plus the book's fullpages file runs independently in one shared pool.
+    Output file names are identical to :func:`split_pdf`.
+
+    Returns:
+        ``{pdf_file: (wall_seconds, task_seconds)}`` for each book that succeeded.
+        ``wall_seconds`` runs from the first of the book's tasks starting to the last
+        one finishing; ``task_seconds`` is the sum of the tasks' own run times.
+    """
+    timings: dict[Path, tuple[float, float]] = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        book_futures = {}
+        for pdf_file in pdf_files:
+            try:
+                resolved_pdf, output_dir, kept, groups = plan_split(
+                    pdf_file, from_z_lib=from_z_lib, pages_per_file=pages_per_file, max_file_mb=max_file_mb
+                )
+            except (FileNotFoundError, ValueError) as e:
+                print(f"  -> Error processing {pdf_file.name}: {e}")
+                continue
+            write_index(resolved_pdf, output_dir, groups)
+            futures = []
+            task: list[tuple[str, list[int]]] = []
+            for group in groups:
+                task.append(group)
+                if sum(len(g[1]) for g in task) >= range_size:
+                    futures.append(pool.submit(_timed_task, write_groups, resolved_pdf, output_dir, task))
+                    task = []
+            if task:
+                futures.append(pool.submit(_timed_task, write_groups, resolved_pdf, output_dir, task))
+            fullpage_path = output_dir.parent / f"{resolved_pdf.stem}_fullpages.pdf"
+            futures.append(pool.submit(_timed_task, write_fullpages, resolved_pdf, fullpage_path, kept))
+            book_futures[pdf_file] = (output_dir, futures)
+
+        for pdf_file, (output_dir, futures) in book_futures.items():
+            try:
+                spans = [f.result() for f in futures]
+            except Exception as e:
+                print(f"  -> Error processing {pdf_file.name}: {e}")
+                continue
+            wall = max(end for _, end, _ in spans) - min(start for start, _, _ in spans)
+            busy = sum(seconds for _, _, seconds in spans)
+            timings[pdf_file] = (wall, busy)
+            telemetry.record("slice", wall, item=pdf_file.name, task_seconds=round(busy, 3), tasks=len(spans))
+            print(f"  -> {pdf_file.name}: pages saved to {output_dir} "
+                  f"(wall {wall:.1f}s, {len(spans)} tasks {busy:.1f}s)")
+    return timings
+
+
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Split a PDF into single-page PDFs in a folder named after the file.")
     parser.add_argument("--dir", default="./materials/raw/", help="Path to the PDF inside materials/ (can be absolute).")
     parser.add_argument("--z-library", type=bool, default=False, help="Remove redundant scans from Z-Library PDFs.")
+    parser.add_argument("--jobs", type=int, default=1, help="Worker processes; >1 splits books and page ranges in parallel.")
+    parser.add_argument("--range-size", type=int, default=DEFAULT_RANGE_SIZE, help="Pages per parallel task within one book.")
+    parser.add_argument("--pages-per-file", type=int, default=1, help="Write page-range PDFs (pages_001-020.pdf) with up to K pages each.")
+    parser.add_argument("--max-file-mb", type=float, default=None, help="Start a new page-range PDF before the estimated size exceeds this cap.")
+    parser.add_argument("--telemetry", type=Path, default=None, help="Append per-book timings to this JSONL file and print a summary.")
+    parser.add_argument("--profile", type=Path, default=None, help="Run the main process under cProfile and write the stats here.")
     return parser.parse_args()
 
 
 def main() -> None:
     args = _parse_args()
+    if args.telemetry or args.profile:
+        telemetry.enable(args.telemetry or Path("./output/telemetry.jsonl"), profile=args.profile)
     pdf_path = Path(args.dir)
     if pdf_path.is_dir():
-        for pdf_file in pdf_path.glob("*.pdf"):
+        pdf_files = sorted(pdf_path.glob("*.pdf"))
+        if args.jobs > 1:
+            print(f"Processing {len(pdf_files)} PDFs with {args.jobs} processes...")
+            start = time.perf_counter()
+            split_pdfs_parallel(
+                pdf_files, args.jobs, from_z_lib=args.z_library, range_size=args.range_size,
+                pages_per_file=args.pages_per_file, max_file_mb=args.max_file_mb,
+            )
+            print(f"Done in {time.perf_counter() - start:.1f}s")
+            return
+        for pdf_file in pdf_files:
             print(f"Processing {pdf_file.name}...")
+            start = time.perf_counter()
             try:
-                output_dir = split_pdf(pdf_file, from_z_lib=args.z_library)
-                print(f"  -> Split complete. Pages saved to: {output_dir}")
+                with telemetry.span("slice", item=pdf_file.name):
+                    output_dir = split_pdf(
+                        pdf_file, from_z_lib=args.z_library,
+                        pages_per_file=args.pages_per_file, max_file_mb=args.max_file_mb,
+                    )
+                print(f"  -> Split complete. Pages saved to: {output_dir} ({time.perf_counter() - start:.1f}s)")
             except (FileNotFoundError, ValueError) as e:
                 print(f"  -> Error processing {pdf_file.name}: {e}")
         return
     else:
         try:
-            output_dir = split_pdf(pdf_path, from_z_lib=args.z_library)
+            with telemetry.span("slice", item=pdf_path.name):
+                output_dir = split_pdf(
+                    pdf_path, from_z_lib=args.z_library,
+                    pages_per_file=args.pages_per_file, max_file_mb=args.max_file_mb,
+                )
             print(f"Split complete. Pages saved to: {output_dir}")
         except (FileNotFoundError, ValueError) as e:
             print(f"Error: {e}")
@@ -1,41 +1,180 @@
-from langchain_text_splitters import MarkdownHeaderTextSplitter
-from pathlib import Path
+"""Split OCR markdown into header-based chunks.
+
+Usage (from repo root):
+    python raw/splitter.py materials/ocr/book_fullpages.pdf/full.md
+    python raw/splitter.py materials/ocr/ --jobs 8 --max-chunk-size 2000 --chunk-overlap 200
+
+Each chunk is ``{"content": ..., "metadata": {"H1": ..., "H2": ..., "H3": ...}}``,
+the same layout MarkdownHeaderTextSplitter produced, so downstream consumers
+(``dataset/dataset.py --batch``) are unaffected.
+"""
+
+from __future__ import annotations
+
 import argparse
+import json
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import telemetry  # noqa: E402
+
+HEADERS_TO_SPLIT_ON = [
+    ("###", "H3"),
+    ("##", "H2"),
+    ("#", "H1"),
+]
+HEADER_LEVELS = {name: len(sep) for sep, name in HEADERS_TO_SPLIT_ON}
+# Preferred break points for oversized chunks, strongest first.
+BREAK_PATTERNS = [re.compile(p) for p in (r"\n\s*\n", r"\n", r"[。！？；.!?;]")]
+
+
+def _match_header(line: str) -> Optional[tuple[str, str]]:
+    for sep, name in HEADERS_TO_SPLIT_ON:
+        if line.startswith(sep) and (len(line) == len(sep) or line[len(sep)] == " "):
+            return name, line[len(sep):].strip()
+    return None
+
+
+def iter_markdown_chunks(lines: Iterable[str]) -> Iterator[dict]:
+    """Yield header-based chunks from markdown lines, one section at a time.
+
+    Header lines are stripped from the content. Lines of a paragraph are joined
+    with ``"\\n"`` and paragraphs of one section with ``"  \\n"``; lines inside
+    fenced code blocks are never treated as headers.
+    """
+    headers: dict[str, str] = {}
+    paragraphs: list[str] = []
+    paragraph: list[str] = []
+    fence: Optional[str] = None
+
+    def flush_paragraph() -> None:
+        if paragraph:
+            paragraphs.append("\n".join(paragraph))
+            paragraph.clear()
+
+    def section() -> Optional[dict]:
+        flush_paragraph()
+        if not paragraphs:
+            return None
+        chunk = {"content": "  \n".join(paragraphs), "metadata": dict(headers)}
+        paragraphs.clear()
+        return chunk
+
+    for raw_line in lines:
+        line = raw_line.strip()
+
+        if fence is None and (line.startswith("```") or line.startswith("~~~")):
+            fence = line[:3]
+        elif fence is not None and line.startswith(fence):
+            fence = None
+        elif fence is None:
+            header = _match_header(line)
+            if header is not None:
+                chunk = section()
+                if chunk is not None:
+                    yield chunk
+                name, text = header
+                level = HEADER_LEVELS[name]
+                for other in [n for n in headers if HEADER_LEVELS[n] >= level]:
+                    del headers[other]
+                headers[name] = text
+                continue
+
+        if line:
+            paragraph.append(line)
+        else:
+            flush_paragraph()
+
+    chunk = section()
+    if chunk is not None:
+        yield chunk
+
+
+def _find_break(text: str, start: int, end: int) -> int:
+    """Last strong break point in ``text[start:end]``, or ``end`` if there is none."""
+    window = text[start:end]
+    for pattern in BREAK_PATTERNS:
+        matches = list(pattern.finditer(window))
+        # avoid tiny pieces: only accept a break in the second half of the window
+        candidates = [m.end() for m in matches if m.end() > len(window) // 2]
+        if candidates:
+            return start + candidates[-1]
+    return end
+
+
+def limit_chunk_size(chunks: Iterable[dict], max_chunk_size: int, chunk_overlap: int = 0) -> Iterator[dict]:
+    """Split chunks longer than ``max_chunk_size`` characters.
+
+    Pieces break at paragraph, line or sentence boundaries where possible and
+    repeat the last ``chunk_overlap`` characters of the previous piece. Metadata
+    is copied to every piece.
+    """
+    if chunk_overlap >= max_chunk_size:
+        raise ValueError("chunk_overlap must be smaller than max_chunk_size")
+    for chunk in chunks:
+        text = chunk["content"]
+        if len(text) <= max_chunk_size:
+            yield chunk
+            continue
+        start = 0
+        while start < len(text):
+            end = min(len(text), start + max_chunk_size)
+            if end < len(text):
+                end = _find_break(text, start, end)
+            yield {"content": text[start:end].strip(), "metadata": dict(chunk["metadata"])}
+            if end >= len(text):
+                break
+            start = max(end - chunk_overlap, start + 1)
+
 
 def split_markdown_text(
     text: str,
-) -> list[str]:
+    max_chunk_size: Optional[int] = None,
+    chunk_overlap: int = 0,
+) -> list[dict]:
     """Split markdown text into chunks based on headers.
 
     Args:
         text: The markdown text to split.
-        chunk_size: The maximum size of each chunk.
-        chunk_overlap: The number of overlapping characters between chunks.
-        headers: A list of tuples defining header prefixes and their levels.
+        max_chunk_size: If set, sections longer than this many characters are
+            split further.
+        chunk_overlap: Characters repeated between consecutive pieces of a
+            split section.
 
     Returns:
-        A list of text chunks.
+        A list of ``{"content", "metadata"}`` chunks.
     """
-    
-    headers_to_split_on = [
-        ("#", "H1"),
-        ("##", "H2"),
-        ("###", "H3"),
-    ]
-    
-    splitter = MarkdownHeaderTextSplitter(
-        headers_to_split_on=headers_to_split_on,
-    )
-    return splitter.split_text(text)
+    chunks = iter_markdown_chunks(text.splitlines())
+    if max_chunk_size:
+        chunks = limit_chunk_size(chunks, max_chunk_size, chunk_overlap)
+    return list(chunks)
+
+
+def split_markdown_file(
+    markdown_file: Path,
+    max_chunk_size: Optional[int] = None,
+    chunk_overlap: int = 0,
+) -> list[dict]:
+    """Like :func:`split_markdown_text`, but reads the file line by line."""
+    with markdown_file.open("r", encoding="utf-8") as f:
+        chunks = iter_markdown_chunks(f)
+        if max_chunk_size:
+            chunks = limit_chunk_size(chunks, max_chunk_size, chunk_overlap)
+        return list(chunks)
+
 
 def _parse_args():
     parser = argparse.ArgumentParser(
-        description="Split a markdown file into chunks based on headers."
+        description="Split a markdown file (or every .md under a directory) into chunks based on headers."
     )
     parser.add_argument(
         "markdown_file",
         type=Path,
-        help="Path to the markdown file to split.",
+        help="Path to the markdown file to split, or a directory searched recursively for .md files.",
     )
     parser.add_argument(
         "--output",
@@ -43,36 +182,106 @@ def _parse_args():
         default=Path("./materials/split_markdown/"),
         help="Output file or path to store the split markdown chunks.",
     )
+    parser.add_argument(
+        "--max-chunk-size",
+        type=int,
+        default=None,
+        help="Split sections longer than this many characters.",
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=int,
+        default=0,
+        help="Characters repeated between pieces of a split section.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes when splitting a directory.",
+    )
+    parser.add_argument(
+        "--telemetry",
+        type=Path,
+        default=None,
+        help="Append per-file timings to this JSONL file and print a summary.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=None,
+        help="Run the main process under cProfile and write the stats here.",
+    )
     return parser.parse_args()
 
-def write_chunks_to_file(chunks: list[str], output_file: Path):
+def write_chunks_to_file(chunks: list[dict], output_file: Path):
     output_file.parent.mkdir(parents=True, exist_ok=True)
     data_to_save = [
         {
-            "content": doc.page_content,
-            "metadata": doc.metadata
+            "content": doc["content"],
+            "metadata": doc["metadata"]
         }
         for doc in chunks
     ]
     with output_file.open("w", encoding="utf-8") as f:
-        import json
         json.dump(data_to_save, f, ensure_ascii=False, indent=4)
-        
-        
+
+
+def output_name(markdown_file: Path, root: Optional[Path] = None) -> str:
+    """``<stem>_chunks.json``; under a directory the relative path is folded in.
+
+    MinerU names every result ``full.md``, so for directory input the name is
+    built from the path relative to ``root`` (``book/page_001.pdf/full.md`` ->
+    ``book__page_001.pdf__full_chunks.json``).
+    """
+    if root is None:
+        return f"{markdown_file.stem}_chunks.json"
+    rel = markdown_file.relative_to(root).with_suffix("")
+    return f"{'__'.join(rel.parts)}_chunks.json"
+
+
+def split_to_file(
+    markdown_file: Path,
+    output_file: Path,
+    max_chunk_size: Optional[int] = None,
+    chunk_overlap: int = 0,
+) -> int:
+    chunks = split_markdown_file(markdown_file, max_chunk_size, chunk_overlap)
+    write_chunks_to_file(chunks, output_file)
+    return len(chunks)
+
+
 def main():
     args = _parse_args()
-    
-    markdown_file = Path(args.markdown_file).read_text(encoding="utf-8")
-    chunks = split_markdown_text(markdown_file)
-    
+    if args.telemetry or args.profile:
+        telemetry.enable(args.telemetry or Path("./output/telemetry.jsonl"), profile=args.profile)
+
+    if args.markdown_file.is_dir():
+        markdown_files = sorted(args.markdown_file.rglob("*.md"))
+        outputs = [args.output / output_name(md, args.markdown_file) for md in markdown_files]
+        with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            results = pool.map(
+                telemetry.timed_call,
+                [split_to_file] * len(markdown_files),
+                markdown_files,
+                outputs,
+                [args.max_chunk_size] * len(markdown_files),
+                [args.chunk_overlap] * len(markdown_files),
+            )
+            for md, (count, seconds) in zip(markdown_files, results):
+                telemetry.record("split", seconds, item=str(md), chunks=count)
+                print(f"{md}: {count} chunks")
+        return
+
     output_file = Path()
     if args.output.is_dir() or not args.output.suffix:
-        output_file = args.output / f"{Path(args.markdown_file).stem}_chunks.json"
+        output_file = args.output / output_name(Path(args.markdown_file))
     else:
         output_file = args.output
-        
-    write_chunks_to_file(chunks, output_file)
-        
-    
+
+    with telemetry.span("split", item=str(args.markdown_file)) as fields:
+        fields["chunks"] = split_to_file(args.markdown_file, output_file, args.max_chunk_size, args.chunk_overlap)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,41 @@
+import json
+
+from dataset.dataset import combine_batch_results, load_chunks, pack_chunks
+
+
+def write_chunks(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps([{"content": c, "metadata": {"H1": "章"}} for c in contents], ensure_ascii=False),
+                    encoding="utf-8")
+
+
+def test_same_named_files_in_different_books_keep_distinct_provenance(tmp_path):
+    root = tmp_path / "split_markdown"
+    for book in ("书A", "书B"):
+        write_chunks(root / book / "pages_001-004.pdf__full_chunks.json", [f"{book}的内容", "  "])
+    chunks = load_chunks(root)
+    assert [(file.parent.name, idx) for file, idx, _ in chunks] == [("书A", 0), ("书B", 0)]
+
+    results = [[{"question": "同一道题", "answer": "A"}], [{"question": "同一道题", "answer": "A"}]]
+    questions = combine_batch_results(chunks, results, root)
+    assert [q["chunk"]["file"] for q in questions] == [
+        "书A/pages_001-004.pdf__full_chunks.json",
+        "书B/pages_001-004.pdf__full_chunks.json",
+    ]
+    assert [q["id"] for q in questions] == [1, 2]
+    assert questions[0]["uid"] != questions[1]["uid"]
+
+    # 只给出一本书的目录时，出处仍相对分块根目录
+    per_book = combine_batch_results(load_chunks(root / "书B"), results[:1], root)
+    assert per_book[0]["chunk"]["file"] == "书B/pages_001-004.pdf__full_chunks.json"
+
+
+def test_failed_chunks_are_skipped_and_packing_keeps_sources(tmp_path):
+    root = tmp_path / "split_markdown"
+    write_chunks(root / "book_chunks.json", ["第一段。", "第二段。", "第三段。"])
+    chunks = pack_chunks(load_chunks(root), budget=100)
+    assert len(chunks) == 1 and [s["index"] for s in chunks[0][2]["sources"]] == [0, 1, 2]
+    questions = combine_batch_results(chunks + chunks, [RuntimeError("失败"), [{"question": "q"}, "不是题目"]], root)
+    assert len(questions) == 1
+    assert questions[0]["chunk"]["file"] == "book_chunks.json"
+    assert questions[0]["chunk"]["sources"] == chunks[0][2]["sources"]
@@ -0,0 +1,87 @@
+import pytest
+
+from dataset.dataset import JsonArrayStream
+
+FENCED = (
+    '```json\n'
+    '[{"question": "含 \\"引号\\" 与 } 的题干", "answer": "A"},\n'
+    ' {"question": "嵌套 {[", "options": ["A. 1", "B. 2"], "answer": "B"}]\n'
+    '```'
+)
+
+
+def feed_all(stream, pieces):
+    found = []
+    for piece in pieces:
+        found += stream.feed(piece)
+    return found
+
+
+def test_whole_array():
+    stream = JsonArrayStream()
+    found = stream.feed(FENCED)
+    assert [q["answer"] for q in found] == ["A", "B"]
+    assert found[0]["question"] == '含 "引号" 与 } 的题干'
+    assert stream.started and stream.closed
+
+
+def test_char_by_char_matches_whole():
+    stream = JsonArrayStream()
+    found = feed_all(stream, FENCED)
+    assert found == JsonArrayStream().feed(FENCED)
+    assert stream.questions == found and stream.closed
+
+
+@pytest.mark.parametrize("split", range(1, 40))
+def test_split_inside_escape_and_string(split):
+    text = '[{"question": "a\\\\\\"b\\u4e2d", "answer": "x"}]'
+    stream = JsonArrayStream()
+    found = feed_all(stream, [text[:split], text[split:]])
+    assert found == [{"question": 'a\\"b中', "answer": "x"}]
+
+
+def test_questions_yielded_as_soon_as_closed():
+    stream = JsonArrayStream()
+    assert stream.feed('[{"question": "一", "answer": "A"}, {"quest') == [{"question": "一", "answer": "A"}]
+    assert not stream.closed
+    # 被截断时已闭合的题目仍然保留
+    assert stream.feed('ion": "二"') == []
+    assert len(stream.questions) == 1
+
+
+def test_single_object_and_null():
+    stream = JsonArrayStream()
+    assert stream.feed('{"question": "q"} trailing') == [{"question": "q"}]
+    assert stream.closed
+
+    stream = JsonArrayStream()
+    assert feed_all(stream, ["nu", "ll"]) == []
+    assert stream.started and stream.closed
+
+
+def test_waits_for_fence_header():
+    stream = JsonArrayStream()
+    assert stream.feed("``") == []
+    assert not stream.started
+    assert stream.feed('`json\n[{"question": "q"}]') == [{"question": "q"}]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "以下是题目：[]",
+        '[{"question": "q"}, 1]',
+        '[{"answer": "A"}]',
+        '[{"question": "q",}]',
+    ],
+)
+def test_rejects_malformed_output(text):
+    with pytest.raises(ValueError):
+        JsonArrayStream().feed(text)
+
+
+def test_ignores_input_after_close():
+    stream = JsonArrayStream()
+    stream.feed('[{"question": "q"}]')
+    assert stream.feed('[{"question": "again"}]') == []
+    assert stream.questions == [{"question": "q"}]
@@ -0,0 +1,74 @@
+import json
+import random
+import sys
+from array import array
+
+from utils import dedup
+from utils.dedup import MAX_HASH, MERSENNE_PRIME, DedupIndex, MinHasher, shingles
+
+
+def reference_signature(hasher, features):
+    """逐个用 Python 大整数计算的签名，即向量化之前的实现。"""
+
+    values = list(features)
+    return array("Q", [min((a * x + b) % MERSENNE_PRIME for x in values) & MAX_HASH for a, b in hasher._params])
+
+
+def test_signature_matches_reference():
+    hasher = MinHasher()
+    rng = random.Random(0)
+    for size in (1, 2, 7, 64, 500):
+        features = {rng.randint(0, MAX_HASH) for _ in range(size)} | {0, MAX_HASH}
+        assert hasher.signature(features) == reference_signature(hasher, features)
+    features = shingles("阳极效应发生时槽电压急剧升高，需要及时熄灭")
+    assert hasher.signature(features) == reference_signature(hasher, features)
+
+
+def test_empty_signature():
+    assert MinHasher(16).signature(set()) == array("Q", [MAX_HASH] * 16)
+
+
+def question(text, explanation=""):
+    return {"question": text, "answer": "A", "explanation": explanation}
+
+
+def test_index_detects_duplicates_across_runs(tmp_path):
+    path = tmp_path / "index.sqlite"
+    index = DedupIndex(path)
+    results = [result for _, result in index.add_many(iter([
+        question("电解槽发生阳极效应时，槽电压会如何变化？"),
+        question("氧化铝的溶解速度受哪些因素影响？"),
+    ]))]
+    index.close()
+    assert [r["status"] for r in results] == ["unique", "unique"]
+
+    index = DedupIndex(path)
+    results = [result for _, result in index.add_many([
+        question("电解槽发生阳极效应时，槽电压会怎样变化？", explanation="槽电压急剧升高"),
+        question("氧化铝的溶解速度受哪些因素影响？"),
+    ])]
+    kept = list(index.representatives())
+    index.close()
+    assert results[0]["status"] == "replaced"
+    assert results[1]["status"] == "seen"
+    assert [q["question"] for q in kept] == ["电解槽发生阳极效应时，槽电压会怎样变化？", "氧化铝的溶解速度受哪些因素影响？"]
+
+
+def test_main_streams_jsonl_and_json(tmp_path, monkeypatch):
+    batch_a, batch_b = tmp_path / "a.jsonl", tmp_path / "b.json"
+    batch_a.write_text("\n".join(json.dumps(q, ensure_ascii=False) for q in [
+        question("电解槽发生阳极效应时，槽电压会如何变化？"),
+        question("氧化铝的溶解速度受哪些因素影响？"),
+    ]) + "\n", encoding="utf-8")
+    batch_b.write_text(json.dumps([question("电解槽发生阳极效应的时候，槽电压会如何变化？")], ensure_ascii=False),
+                       encoding="utf-8")
+    output, report = tmp_path / "out.json", tmp_path / "report.json"
+    monkeypatch.setattr(sys, "argv", [
+        "dedup.py", str(batch_a), str(batch_b), "--index", str(tmp_path / "index.sqlite"),
+        "--output", str(output), "--report", str(report),
+    ])
+    dedup.main()
+
+    assert len(json.loads(output.read_text(encoding="utf-8"))) == 2
+    duplicates = json.loads(report.read_text(encoding="utf-8"))
+    assert [d["file"] for d in duplicates] == [str(batch_b)]
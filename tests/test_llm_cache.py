@@ -0,0 +1,58 @@
+import itertools
+
+import pytest
+
+from utils import llm_cache
+from utils.llm_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = itertools.count(1_000_000)
+    monkeypatch.setattr(llm_cache.time, "time", lambda: float(next(now)))
+
+
+def test_make_key_covers_every_parameter():
+    key = ResponseCache.make_key("p", "m", 0.7, 100)
+    assert key == ResponseCache.make_key("p", "m", 0.7, 100)
+    assert len({key, *(ResponseCache.make_key(*args) for args in [
+        ("p2", "m", 0.7, 100), ("p", "m2", 0.7, 100), ("p", "m", 0.2, 100), ("p", "m", 0.7, 200),
+    ])}) == 5
+
+
+def test_get_set_delete_and_counters(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    assert cache.get("k") is None
+    cache.set("k", "内容")
+    assert cache.get("k") == "内容"
+    cache.delete("k")
+    assert cache.get("k") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+
+def test_evicts_least_recently_accessed(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "cache.sqlite", max_bytes=10, max_age_days=0)
+    for key in ("a", "b", "c"):
+        cache.set(key, "xxxx")
+    cache.get("a")  # a 变为最近访问
+    assert cache.evict() == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == cache.get("c") == "xxxx"
+    cache.close()
+
+
+def test_evicts_expired_entries_and_persists(tmp_path, monkeypatch):
+    path = tmp_path / "cache.sqlite"
+    cache = ResponseCache(path, max_age_days=1)
+    monkeypatch.setattr(llm_cache.time, "time", lambda: 0.0)
+    cache.set("old", "x")
+    monkeypatch.undo()
+    cache.set("new", "y")
+    assert cache.get("old") is None
+    cache.close()
+
+    reopened = ResponseCache(path, max_age_days=1)
+    assert reopened.get("new") == "y"
+    assert reopened._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 1
+    reopened.close()
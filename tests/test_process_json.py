@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from utils import process_json
+from utils.process_json import chunk_ref, convert, iter_json_array, iter_records, make_uid, merge_data, write_records
+
+QUESTION = {"question": "铝电解的主要原料是什么？", "answer": "氧化铝"}
+
+
+def test_uid_is_stable():
+    # 已发布的数据集依赖这些值，哈希方式改变会导致 uid 全部变化
+    assert make_uid(QUESTION, "分块原文") == "0c833cb32b0e-eea5563e"
+    assert make_uid({"question": "q", "answer": "a", "chunk": {"file": "f.json", "index": 3}}) == "cc21a28e7e6c-56163f22"
+
+
+def test_uid_ignores_other_fields():
+    assert make_uid({**QUESTION, "id": 7, "type": "T1"}, "分块原文") == make_uid(QUESTION, "分块原文")
+
+
+def test_uid_depends_on_chunk_and_content():
+    uid = make_uid(QUESTION, "分块原文")
+    assert make_uid(QUESTION, "另一个分块") != uid
+    assert make_uid({**QUESTION, "answer": "冰晶石"}, "分块原文") != uid
+    assert make_uid(QUESTION, "分块原文").split("-")[0] == make_uid({**QUESTION, "answer": "x"}, "分块原文").split("-")[0]
+
+
+def test_uid_falls_back_to_chunk_ref_then_source():
+    ref = {**QUESTION, "chunk": {"file": "book.json", "index": 2}}
+    assert make_uid(ref) == make_uid(QUESTION, "book.json#2")
+    assert make_uid(QUESTION, source="questions.json") == make_uid(QUESTION, "questions.json")
+
+
+def write_array(path, items):
+    path.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("shift", range(-24, 24))
+def test_json_array_values_across_block_boundary(tmp_path, shift):
+    tail = [1234567890123, True, None, False, -12.5e3, 'a\\"b', {"n": 7}, 5]
+    # 让块边界依次落在尾部各个值的内部
+    pad = process_json.READ_BLOCK_SIZE - len('[{"a": "') - 16 + shift
+    items = [{"a": "x" * pad}, *tail]
+    assert list(iter_json_array(write_array(tmp_path / "q.json", items))) == items
+
+
+def test_json_array_small_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_json, "READ_BLOCK_SIZE", 3)
+    items = [{"question": "题干", "id": 12345}, [1, 2], "字符串\\n", 0.25, True, None, 678]
+    assert list(iter_json_array(write_array(tmp_path / "q.json", items))) == items
+    assert list(iter_json_array(write_array(tmp_path / "e.json", []))) == []
+
+
+@pytest.mark.parametrize("text", ["{}", "[1, 2", '[{"a": 1}'])
+def test_json_array_rejects_bad_files(tmp_path, text):
+    path = tmp_path / "bad.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_array(path))
+
+
+@pytest.mark.parametrize("suffix", [".json", ".jsonl"])
+def test_write_records_round_trip(tmp_path, suffix):
+    records = [{"id": i, "question": f"题{i}"} for i in range(3)]
+    path = tmp_path / f"out{suffix}"
+    assert write_records(iter(records), path) == 3
+    assert list(iter_records(path)) == records
+    assert write_records([], tmp_path / f"empty{suffix}") == 0
+    assert list(iter_records(tmp_path / f"empty{suffix}")) == []
+
+
+def test_write_records_appends_only_to_jsonl(tmp_path):
+    path = tmp_path / "out.jsonl"
+    write_records([{"id": 1}], path)
+    write_records([{"id": 2}], path, append=True)
+    assert [r["id"] for r in iter_records(path)] == [1, 2]
+    with pytest.raises(ValueError):
+        write_records([{"id": 1}], tmp_path / "out.json", append=True)
+
+
+@pytest.mark.parametrize("max_memory_mb", [64, 0])
+def test_merge_data_joins_labels(tmp_path, max_memory_mb, capsys):
+    questions = write_array(tmp_path / "q.json", [{"uid": "a", "question": "一"}, {"uid": "b", "question": "二"},
+                                                  {"uid": "c", "question": "三"}])
+    labels = tmp_path / "labels.jsonl"
+    write_records([{"uid": "c", "level_1_tag": "电解"}, {"uid": "a", "level_1_tag": "铸造"}], labels)
+    output = tmp_path / "merged.jsonl"
+    merge_data(questions, labels, output, max_memory_mb=max_memory_mb)
+    assert list(iter_records(output)) == [
+        {"uid": "a", "question": "一", "level_1_tag": "铸造"},
+        {"uid": "c", "question": "三", "level_1_tag": "电解"},
+    ]
+    assert "b" in capsys.readouterr().out
+
+
+def test_merge_data_falls_back_to_id(tmp_path):
+    questions = write_array(tmp_path / "q.json", [{"id": 1, "question": "一"}])
+    labels = write_array(tmp_path / "l.json", [{"id": 1, "tag": "x"}])
+    merge_data(questions, labels, tmp_path / "m.json")
+    assert list(iter_records(tmp_path / "m.json")) == [{"id": 1, "question": "一", "tag": "x"}]
+
+
+def test_convert_adds_missing_uids(tmp_path):
+    source = write_array(tmp_path / "q.json", [{"question": "一", "answer": "A"}, {"question": "二", "uid": "keep"}])
+    output = tmp_path / "q.jsonl"
+    convert(source, output)
+    convert(source, output, append=True)
+    records = list(iter_records(output))
+    assert len(records) == 4
+    assert records[0]["uid"] == make_uid({"question": "一", "answer": "A"}, source="q.json") == records[2]["uid"]
+    assert records[1]["uid"] == "keep"
+
+    back = tmp_path / "back.json"
+    convert(output, back)
+    assert list(iter_records(back)) == records
+
+
+def test_chunk_ref_is_relative_to_the_chunks_root(tmp_path):
+    root = tmp_path / "split_markdown"
+    assert chunk_ref(root / "书A" / "pages_001-004.pdf__full_chunks.json", root) == "书A/pages_001-004.pdf__full_chunks.json"
+    assert chunk_ref(root / "flat_chunks.json", root) == "flat_chunks.json"
+    assert chunk_ref(tmp_path / "elsewhere" / "x_chunks.json", root) == "x_chunks.json"
+    assert chunk_ref(root / "书A" / "x_chunks.json") == "x_chunks.json"
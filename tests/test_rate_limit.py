@@ -0,0 +1,228 @@
+import asyncio
+import io
+import sqlite3
+import threading
+
+import httpx
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import http_pool, rate_limit
+from utils.rate_limit import (
+    AsyncRateLimitedTransport,
+    RateLimitedAdapter,
+    RateLimitedTransport,
+    RateLimiter,
+    parse_duration,
+    retry_after,
+)
+
+KEY = "api.example.com/v1/chat#model"
+
+
+def bucket(limiter, key=KEY):
+    conn = sqlite3.connect(limiter.path)
+    row = conn.execute("SELECT rpm, tpm, max_rpm, blocked_until FROM buckets WHERE key = ?", (key,)).fetchone()
+    conn.close()
+    return dict(zip(("rpm", "tpm", "max_rpm", "blocked_until"), row))
+
+
+def test_unlimited_by_default(tmp_path):
+    limiter = RateLimiter(tmp_path / "limits.sqlite")
+    assert all(limiter.reserve(KEY, tokens=10_000) == 0 for _ in range(100))
+
+
+def test_rpm_burst_then_wait(tmp_path):
+    limiter = RateLimiter(tmp_path / "limits.sqlite", rpm=60)
+    # 新的桶只有一个请求的余量
+    assert limiter.reserve(KEY) == 0
+    assert 0.9 < limiter.reserve(KEY) <= 1.0
+    assert limiter.reserve("other") == 0
+
+
+def test_tpm_limits_large_requests(tmp_path):
+    limiter = RateLimiter(tmp_path / "limits.sqlite", tpm=6000)
+    assert limiter.reserve(KEY, tokens=200) == 0
+    assert limiter.reserve(KEY, tokens=100) > 0
+    # 超过桶容量的单个请求只需等桶满
+    assert limiter.reserve(KEY, tokens=10**6) <= 6000 / 60 * rate_limit.BURST_SECONDS / 100 + 1e-6
+
+
+def test_state_is_shared_between_instances(tmp_path):
+    first = RateLimiter(tmp_path / "limits.sqlite", rpm=60)
+    second = RateLimiter(tmp_path / "limits.sqlite")
+    assert first.reserve(KEY) == 0
+    assert second.reserve(KEY) > 0
+
+
+def test_429_backs_off_and_slows_down(tmp_path):
+    limiter = RateLimiter(tmp_path / "limits.sqlite", rpm=100)
+    limiter.reserve(KEY)
+    limiter.feedback(KEY, 429, {"retry-after": "3"})
+    assert bucket(limiter)["rpm"] == pytest.approx(100 * rate_limit.DECREASE)
+    assert 2 < limiter.reserve(KEY) <= 3
+    # 暂停期间的其它 429 不再降速
+    limiter.feedback(KEY, 429, {})
+    assert bucket(limiter)["rpm"] == pytest.approx(100 * rate_limit.DECREASE)
+
+
+def test_429_without_configured_rate_starts_from_observed_rate(tmp_path):
+    limiter = RateLimiter(tmp_path / "limits.sqlite")
+    for _ in range(30):
+        limiter.reserve(KEY)
+    limiter.feedback(KEY, 429, {})
+    assert bucket(limiter)["rpm"] == pytest.approx(30 * 60 * rate_limit.DECREASE)
+
+
+def test_success_recovers_up_to_the_cap(tmp_path):
+    limiter = RateLimiter(tmp_path / "limits.sqlite", rpm=100)
+    limiter.reserve(KEY)
+    limiter.feedback(KEY, 429, {"retry-after-ms": "1"})
+    for _ in range(20):
+        limiter.feedback(KEY, 200, {})
+    assert bucket(limiter)["rpm"] == 100
+
+
+def test_server_headers_set_the_cap(tmp_path):
+    limiter = RateLimiter(tmp_path / "limits.sqlite")
+    limiter.reserve(KEY)
+    limiter.feedback(KEY, 200, {"x-ratelimit-limit-requests": "500", "x-ratelimit-remaining-requests": "0",
+                                "x-ratelimit-reset-requests": "2s"})
+    state = bucket(limiter)
+    assert state["max_rpm"] == state["rpm"] == pytest.approx(500 * rate_limit.SAFETY)
+    assert 1 < limiter.reserve(KEY) <= 2
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [("1.5", 1.5), ("6m0s", 360.0), ("20ms", 0.02), ("1h2m", 3720.0), (None, None), ("soon", None)],
+)
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == (pytest.approx(seconds) if seconds is not None else None)
+
+
+def test_retry_after_prefers_milliseconds():
+    assert retry_after({"retry-after-ms": "250", "retry-after": "5"}) == 0.25
+    assert retry_after({"retry-after": "1", "x-ratelimit-reset-tokens": "4s"}) == 4.0
+    assert retry_after({}) is None
+
+
+@pytest.mark.parametrize(
+    "status, method, url, headers, expected",
+    [
+        (429, "POST", "https://mineru.net/api/v4/file-urls/batch", {}, True),
+        (503, "POST", "https://mineru.net/api/v4/file-urls/batch", {}, False),
+        (503, "POST", "https://mineru.net/api/v4/extract/task", {"Idempotency-Key": "k"}, True),
+        (502, "GET", "https://mineru.net/api/v4/extract-results/batch/1", {}, True),
+        (500, "PUT", "https://oss.example.com/upload?sig=1", {}, True),
+        (500, "POST", "https://api.openai.com/v1/chat/completions", {}, True),
+        (500, "POST", "https://api.openai.com/v1/batches", {}, False),
+        (400, "GET", "https://api.openai.com/v1/models", {}, False),
+    ],
+)
+def test_should_retry(status, method, url, headers, expected):
+    assert rate_limit.should_retry(status, method, url, httpx.Headers(headers)) is expected
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(rate_limit, "backoff", lambda attempt, headers=None: 0.0)
+
+
+def scripted(statuses):
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1])
+
+    return handler, calls
+
+
+def test_transport_retries_only_idempotent_5xx(tmp_path, no_sleep):
+    handler, calls = scripted([503, 200])
+    limiter = RateLimiter(tmp_path / "limits.sqlite")
+    with httpx.Client(transport=RateLimitedTransport(limiter, httpx.MockTransport(handler))) as client:
+        assert client.get("https://api.example.com/v1/files/1").status_code == 200
+        assert calls == ["GET", "GET"]
+        calls.clear()
+        assert client.post("https://api.example.com/v1/batches", json={}).status_code == 503
+        assert calls == ["POST"]
+
+
+def test_transport_retries_connection_errors(tmp_path, no_sleep):
+    attempts = []
+
+    def handler(request):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200)
+
+    limiter = RateLimiter(tmp_path / "limits.sqlite")
+    with httpx.Client(transport=RateLimitedTransport(limiter, httpx.MockTransport(handler))) as client:
+        assert client.post("https://api.example.com/v1/batches", json={}).status_code == 200
+    assert len(attempts) == 3
+
+
+def test_async_transport_keeps_sqlite_off_the_event_loop(tmp_path, monkeypatch):
+    limiter = RateLimiter(tmp_path / "limits.sqlite")
+    loop_threads = []
+    for name in ("reserve", "feedback"):
+        original = getattr(limiter, name)
+
+        def traced(*args, _original=original, **kwargs):
+            loop_threads.append(threading.get_ident())
+            return _original(*args, **kwargs)
+
+        monkeypatch.setattr(limiter, name, traced)
+
+    async def run():
+        transport = AsyncRateLimitedTransport(limiter, httpx.MockTransport(lambda request: httpx.Response(200)))
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.post("https://api.example.com/v1/chat/completions", json={"model": "m"})
+        return response.status_code, threading.get_ident()
+
+    status, loop_thread = asyncio.run(run())
+    assert status == 200
+    assert len(loop_threads) == 2 and loop_thread not in loop_threads
+
+
+class FakeAdapter(HTTPAdapter):
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = statuses
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(request.method)
+        response = requests.Response()
+        response.raw = io.BytesIO(b"")
+        response.status_code = self.statuses[min(len(self.sent), len(self.statuses)) - 1]
+        return response
+
+
+def test_adapter_does_not_replay_non_idempotent_posts(tmp_path, no_sleep, monkeypatch):
+    fake = FakeAdapter([503, 200])
+    monkeypatch.setattr(HTTPAdapter, "send", lambda self, request, **kwargs: fake.send(request, **kwargs))
+    adapter = RateLimitedAdapter(RateLimiter(tmp_path / "limits.sqlite"))
+    batch = requests.Request("POST", "https://mineru.net/api/v4/file-urls/batch", json={"files": []}).prepare()
+    assert adapter.send(batch).status_code == 503
+    assert fake.sent == ["POST"]
+
+    fake.sent.clear()
+    poll = requests.Request("GET", "https://mineru.net/api/v4/extract-results/batch/1").prepare()
+    assert adapter.send(poll).status_code == 200
+    assert fake.sent == ["GET", "GET"]
+
+
+def test_pooled_openai_clients_leave_retries_to_the_transport(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_pool, "_config", {**http_pool._config, "rate_limit_path": tmp_path / "limits.sqlite"})
+    monkeypatch.setattr(http_pool, "_limiter", None)
+    monkeypatch.setattr(http_pool, "_openai_clients", {})
+    assert http_pool.get_openai_client("http://127.0.0.1:1/v1", "key").max_retries == 0
+
+    http_pool.configure(rate_limit=False)
+    monkeypatch.setattr(http_pool, "_openai_clients", {})
+    assert http_pool.get_openai_client("http://127.0.0.1:1/v1", "key").max_retries > 0
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from utils import retrieval
+from utils.retrieval import BM25Index, tokenize
+
+
+def write_chunks(path, contents):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps([{"content": c, "metadata": {"H1": path.stem}} for c in contents], ensure_ascii=False),
+                    encoding="utf-8")
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / "chunks"
+    write_chunks(root / "a_full_chunks.json", ["铝电解槽的阳极效应", "氧化铝浓度控制", ""])
+    write_chunks(root / "b_full_chunks.json", ["阴极破损与槽寿命", "电解质分子比"])
+    return root
+
+
+def files_of(hits):
+    return [(hit["file"].rsplit("/", 1)[-1], hit["index"]) for hit in hits]
+
+
+def test_tokenize_bigrams_and_words():
+    assert tokenize("阳极效应 AL2O3 3.5kA") == ["阳极", "极效", "效应", "al2o3", "3.5", "ka"]
+
+
+def test_update_is_incremental(tmp_path, corpus):
+    index = BM25Index(tmp_path / "index")
+    assert index.update([corpus]) == (4, 0)
+    assert index.stats()[0] == 4
+    assert index.update([corpus]) == (0, 0)
+    assert files_of(index.search("阳极效应", k=1)) == [("a_full_chunks.json", 0)]
+
+    # 修改文件：旧分块标记删除，新分块写入新段
+    write_chunks(corpus / "a_full_chunks.json", ["阳极效应的熄灭方法"])
+    assert index.update([corpus]) == (1, 2)
+    assert index.stats()[0] == 3
+    assert [hit["content"] for hit in index.search("阳极效应")] == ["阳极效应的熄灭方法"]
+
+    # 删除文件
+    (corpus / "b_full_chunks.json").unlink()
+    assert index.update([corpus]) == (0, 2)
+    assert index.search("槽寿命") == []
+    index.close()
+
+
+def test_reopen_reads_manifest(tmp_path, corpus):
+    BM25Index(tmp_path / "index").update([corpus])
+    reopened = BM25Index(tmp_path / "index")
+    assert files_of(reopened.search("分子比", k=1)) == [("b_full_chunks.json", 1)]
+    reopened.close()
+
+
+def test_compact_drops_deleted_docs(tmp_path, corpus):
+    index = BM25Index(tmp_path / "index")
+    index.update([corpus])
+    write_chunks(corpus / "a_full_chunks.json", ["阳极效应的熄灭方法", "氧化铝浓度控制"])
+    index.update([corpus])
+    before = {q: files_of(index.search(q)) for q in ("阳极效应", "氧化铝", "槽寿命")}
+    stats = index.stats()
+    assert len(index.manifest["segments"]) == 2 and index.manifest["deleted"]
+
+    index.compact()
+    assert len(index.manifest["segments"]) == 1 and index.manifest["deleted"] == {}
+    assert index.manifest["segments"][0]["docs"] == 4
+    assert index.stats() == pytest.approx(stats)
+    assert {q: files_of(index.search(q)) for q in before} == before
+    assert sorted(p.name for p in (tmp_path / "index").iterdir() if p.is_dir()) == [index.manifest["segments"][0]["name"]]
+    index.close()
+
+
+def test_segment_limit_triggers_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "MAX_SEGMENTS", 2)
+    index = BM25Index(tmp_path / "index")
+    for i in range(3):
+        path = tmp_path / f"c{i}_full_chunks.json"
+        write_chunks(path, [f"第{i}号分块 阳极"])
+        index.update([path])
+    assert len(index.manifest["segments"]) == 1
+    assert len(index.search("阳极")) == 3
+    index.close()
+
+
+def test_fully_deleted_segment_is_removed(tmp_path, corpus):
+    index = BM25Index(tmp_path / "index")
+    index.update([corpus])
+    for path in corpus.iterdir():
+        path.unlink()
+    index.update([corpus])
+    assert index.manifest["segments"] == [] and index.stats() == (0, 0.0)
+    index.close()
@@ -0,0 +1,95 @@
+import json
+from collections import Counter
+
+import pytest
+
+from utils.scheduler import ScheduleState, cell_key, compute_targets, load_tagged_chunks, plan_requests
+
+TAXONOMY = {
+    "category_quotas": {"电解": 10, "铸造": 7},
+    "difficulty_ratio": {"易": 0.5, "难": 0.5},
+    "type_distribution": {"易": {"T1": 0.6, "T3": 0.4}, "难": {"T1": 0.3, "T5": 0.7}},
+}
+
+
+def chunks(category, n):
+    return [{"id": f"{category}.json#{i}", "file": f"{category}.json", "index": i, "chunk": {"content": str(i)}}
+            for i in range(n)]
+
+
+@pytest.fixture
+def state(tmp_path):
+    return ScheduleState(tmp_path / "state.json", compute_targets(TAXONOMY))
+
+
+def test_targets_add_up_to_quotas():
+    targets = compute_targets(TAXONOMY)
+    per_category = Counter()
+    for key, n in targets.items():
+        per_category[key.split("|")[0]] += n
+    assert per_category == TAXONOMY["category_quotas"]
+    assert targets[cell_key("电解", "易", "T1")] == 3
+
+
+def test_plan_fills_each_cell_up_to_its_deficit(state):
+    state.filled[cell_key("电解", "易", "T1")] = 3
+    requests = plan_requests(state, {"电解": chunks("电解", 20), "铸造": chunks("铸造", 20)}, 100, 2)
+    planned = Counter()
+    for request in requests:
+        planned[request["cell"]] += request["count"]
+    assert planned == {key: state.deficit(key) for key in state.targets if state.deficit(key)}
+    assert all(r["chunk"]["id"].startswith(r["cell"].split("|")[0]) for r in requests)
+
+
+def test_plan_never_repeats_a_chunk_for_a_cell(state):
+    key = cell_key("电解", "难", "T5")
+    state.attempted.add(f"电解.json#0@{key}")
+    requests = plan_requests(state, {"电解": chunks("电解", 3)}, 100, 1)
+    pairs = [(r["chunk"]["id"], r["cell"]) for r in requests]
+    assert len(pairs) == len(set(pairs))
+    assert sorted(r["chunk"]["id"] for r in requests if r["cell"] == key) == ["电解.json#1", "电解.json#2"]
+
+
+def test_plan_spreads_work_over_least_used_chunks(state):
+    requests = plan_requests(state, {"电解": chunks("电解", 4)}, 4, 1)
+    assert sorted(r["chunk"]["id"] for r in requests) == [f"电解.json#{i}" for i in range(4)]
+    # 缺口比例相同时先补缺口最多的单元格
+    assert requests[0]["cell"] == max(state.targets, key=lambda key: (key.startswith("电解"), state.deficit(key)))
+
+
+def test_plan_respects_max_requests_and_missing_chunks(state):
+    assert len(plan_requests(state, {"电解": chunks("电解", 50)}, 3, 1)) == 3
+    assert plan_requests(state, {}, 10, 5) == []
+
+
+def test_state_round_trip(state):
+    state.filled[cell_key("电解", "易", "T1")] = 2
+    state.attempted.add("x@y")
+    state.save()
+    reloaded = ScheduleState(state.path, state.targets)
+    assert reloaded.filled == state.filled and reloaded.attempted == {"x@y"}
+
+
+def test_reconcile_trusts_the_output(state, tmp_path):
+    output = tmp_path / "questions.jsonl"
+    key = cell_key("铸造", "难", "T5")
+    question = {"level_2_tag": "铸造", "difficulty": "难", "type": "T5", "uid": "u1", "id": 4,
+                "chunk": {"file": "铸造.json", "index": 2}}
+    output.write_text(json.dumps(question, ensure_ascii=False) + "\n" + '{"level_2_tag": "铸', encoding="utf-8")
+    state.reconcile(output)
+    assert state.filled[key] == 1 and sum(state.filled.values()) == 1
+    assert state.attempted == {f"铸造.json#2@{key}"}
+    assert state.uids == {"u1"} and state.next_id == 5
+
+
+def test_tagged_chunks_are_keyed_by_relative_path(tmp_path):
+    for book in ("书A", "书B"):
+        path = tmp_path / book / "pages_001-004.pdf__full_chunks.json"
+        path.parent.mkdir()
+        path.write_text(json.dumps([{"content": "x", "metadata": {"level_2_tag": "电解"}},
+                                    {"content": "y", "metadata": {}}]), encoding="utf-8")
+    loaded = load_tagged_chunks(tmp_path)
+    assert [c["id"] for c in loaded["电解"]] == [
+        "书A/pages_001-004.pdf__full_chunks.json#0",
+        "书B/pages_001-004.pdf__full_chunks.json#0",
+    ]
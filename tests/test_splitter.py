@@ -0,0 +1,49 @@
+import pytest
+
+from raw.splitter import HEADERS_TO_SPLIT_ON, iter_markdown_chunks, limit_chunk_size, split_markdown_text
+
+SAMPLES = [
+    "前言文字\n第二行\n\n# 第一章 概述\n铝电解概述。\n续行\n\n## 1.1 原理\n冰晶石-氧化铝熔盐电解。\n"
+    "```python\n# 不是标题\nx = 1\n```\n### 1.1.1 细节\n细节内容\n## 1.2 设备\n#不是标题\n设备内容\n"
+    "# 第二章\n##\n空标题后的内容\n~~~\n## fenced\n~~~\n",
+    "",
+    "# 只有标题\n",
+    "没有标题\n\n\n多段\n  缩进行  \n",
+    "# A\n## B\n### C\n正文\n# D\n### E\n正文二\n",
+]
+
+
+def test_header_levels_and_content():
+    chunks = list(iter_markdown_chunks("# A\n## B\n正文一\n续行\n\n第二段\n# C\n正文二\n".splitlines()))
+    assert chunks == [
+        {"content": "正文一\n续行  \n第二段", "metadata": {"H1": "A", "H2": "B"}},
+        {"content": "正文二", "metadata": {"H1": "C"}},
+    ]
+
+
+def test_fenced_code_is_not_split():
+    chunks = list(iter_markdown_chunks(["# A", "```", "# comment", "```"]))
+    assert chunks == [{"content": "```\n# comment\n```", "metadata": {"H1": "A"}}]
+
+
+def test_accepts_a_lazy_line_iterator():
+    lines = iter(["# A", "x"])
+    assert next(iter_markdown_chunks(lines)) == {"content": "x", "metadata": {"H1": "A"}}
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_matches_langchain(text):
+    splitters = pytest.importorskip("langchain_text_splitters")
+    splitter = splitters.MarkdownHeaderTextSplitter(headers_to_split_on=sorted(HEADERS_TO_SPLIT_ON, key=lambda h: len(h[0])))
+    expected = [{"content": doc.page_content, "metadata": doc.metadata} for doc in splitter.split_text(text)]
+    assert split_markdown_text(text) == expected
+
+
+def test_limit_chunk_size():
+    text = "第一句。" * 30 + "\n\n" + "第二段。" * 30
+    pieces = list(limit_chunk_size([{"content": text, "metadata": {"H1": "A"}}], 150, 20))
+    assert all(len(p["content"]) <= 150 for p in pieces)
+    assert all(p["metadata"] == {"H1": "A"} for p in pieces)
+    assert pieces[0]["content"] == "第一句。" * 30
+    with pytest.raises(ValueError):
+        list(limit_chunk_size([], 10, 10))
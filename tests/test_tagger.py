@@ -0,0 +1,46 @@
+import argparse
+
+import pytest
+
+import dataset.dataset
+from utils.tagger import TaxonomyTagger, load_taxonomy, tag_with_llm
+
+
+@pytest.fixture(scope="module")
+def taxonomy():
+    return load_taxonomy()
+
+
+@pytest.fixture
+def tagger(taxonomy):
+    return TaxonomyTagger(taxonomy)
+
+
+def test_unrelated_chunk_is_not_confident(tagger):
+    result = tagger.tag({"content": "今天天气很好。", "metadata": {}})
+    assert result["level_3_tag"] is None and result["confident"] is False
+
+
+def test_llm_result_replaces_keyword_scores(tagger, taxonomy, monkeypatch):
+    level_3 = next(iter(tagger.paths))
+    chunks = [
+        {"content": "甲", "metadata": {"level_3_tag": None, "tag_score": 0.7, "tag_confidence": 0.1,
+                                       "confident": False, "tag_source": "unresolved"}},
+        {"content": "乙", "metadata": {"level_3_tag": None, "tag_score": 0.5, "tag_confidence": 0.0,
+                                       "confident": False, "tag_source": "unresolved"}},
+    ]
+
+    async def fake_generate_batch(prompts, **kwargs):
+        assert len(prompts) == 2
+        return [[{"level_3_tag": level_3}], [{"level_3_tag": "不存在的考点"}]]
+
+    monkeypatch.setattr(dataset.dataset, "generate_batch", fake_generate_batch)
+    args = argparse.Namespace(model="m", api_key="k", base_url="http://127.0.0.1:1/v1", concurrency=1, no_cache=True)
+    assert tag_with_llm(chunks, tagger, taxonomy, args) == 1
+
+    tagged = chunks[0]["metadata"]
+    assert tagged["level_3_tag"] == level_3
+    assert (tagged["level_1_tag"], tagged["level_2_tag"]) == tagger.paths[level_3]
+    assert tagged["tag_source"] == "llm" and tagged["confident"] is True
+    assert tagged["tag_score"] is None and tagged["tag_confidence"] is None
+    assert chunks[1]["metadata"]["confident"] is False and chunks[1]["metadata"]["tag_source"] == "unresolved"
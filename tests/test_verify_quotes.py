@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from utils.verify_quotes import INDEX_NAME, build_index, page_range, verify_questions
+
+NAME = "pages_001-002.pdf__full_chunks.json"
+
+
+@pytest.fixture
+def layout(tmp_path):
+    """流水线布局：split_markdown/<书>/ 下同名的分块文件，processed/<书>/ 下的页码对照表。"""
+
+    chunks_root, pages_dir = tmp_path / "split_markdown", tmp_path / "processed"
+    for book, text, pages in (("书A", "阳极效应发生时槽电压急剧升高", [4, 5]), ("书B", "阳极效应发生时槽电压急剧升高", [10, 12])):
+        (chunks_root / book).mkdir(parents=True)
+        (chunks_root / book / NAME).write_text(json.dumps([{"content": "前言"}, {"content": text}], ensure_ascii=False),
+                                               encoding="utf-8")
+        (pages_dir / book).mkdir(parents=True)
+        (pages_dir / book / INDEX_NAME).write_text(json.dumps({"files": {"pages_001-002.pdf": pages}}), encoding="utf-8")
+    return chunks_root, pages_dir
+
+
+def test_index_name_matches_slicepdf():
+    pytest.importorskip("pypdf")
+    from raw.SlicePDF import INDEX_NAME as SLICE_INDEX_NAME
+
+    assert INDEX_NAME == SLICE_INDEX_NAME
+
+
+def test_build_index_recurses_and_keys_on_relative_path(layout):
+    chunks_root, pages_dir = layout
+    index = build_index([chunks_root], pages_dir=pages_dir)
+    assert [(c["file"], c["chunk_index"], c["pages"]) for c in index.chunks] == [
+        (f"书A/{NAME}", 0, [4, 5]), (f"书A/{NAME}", 1, [4, 5]),
+        (f"书B/{NAME}", 0, [10, 12]), (f"书B/{NAME}", 1, [10, 12]),
+    ]
+
+
+def test_hint_selects_the_right_book(layout):
+    chunks_root, pages_dir = layout
+    index = build_index([chunks_root], pages_dir=pages_dir)
+    questions = [
+        {"source_quote": "阳极效应发生时槽电压急剧升高", "chunk": {"file": f"书B/{NAME}", "index": 1}},
+        {"source_quote": "阳极效应发生时，槽电压急剧升高", "chunk": {"file": f"书A/{NAME}", "index": 1}},
+        {"source_quote": "完全无关的引文内容"},
+        {"question": "没有引文"},
+    ]
+    counts = verify_questions(questions, index)
+    assert [q["quote_check"]["status"] for q in questions] == ["verbatim", "exact", "unmatched", "missing"]
+    assert questions[0]["quote_check"]["pages"] == [10, 12]
+    assert questions[1]["quote_check"]["file"] == f"书A/{NAME}"
+    assert counts == {"verbatim": 1, "exact": 1, "unmatched": 1, "missing": 1}
+
+
+def test_page_range_falls_back_to_the_file_name(tmp_path):
+    assert page_range(tmp_path / "书C" / NAME, tmp_path) == [1, 2]
+    assert page_range(tmp_path / "book__page_007.pdf__full_chunks.json", None) == [7, 7]
+    assert page_range(tmp_path / "notes_chunks.json") is None
@@ -0,0 +1 @@
+"""项目内共享的工具模块。"""
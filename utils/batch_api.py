@@ -0,0 +1,168 @@
+"""OpenAI 兼容 Batch API 的提交、轮询与结果读取
+
+整本书的生成不需要交互式延迟，走 Batch API（Files + Batches 接口）可以换取更低的单价与
+更高的吞吐。本模块只负责与接口打交道，不关心提示词与题目格式：
+
+    path = write_requests(items, "output/batch_api/requests.jsonl", model, temperature, max_tokens)
+    batch = submit(client, path)
+    batch = wait(client, batch.id)
+    for custom_id, content, error in iter_results(client, batch):
+        ...
+
+``BatchJob`` 把已提交但尚未取回的批次与每个请求的结果记在磁盘上：中断后重跑会继续轮询
+未完成的批次，而不是重复提交；只有失败（或尚未提交）的请求才会进入下一次提交。
+
+用法见 dataset/dataset.py 的 ``--batch-api`` 选项。
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from openai import OpenAI
+
+from utils import telemetry
+
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+DEFAULT_POLL_INTERVAL = 30.0
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def write_requests(
+    items: Iterable[tuple[str, str]],
+    path: str | Path,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+) -> int:
+    """把 (custom_id, prompt) 写成 Batch 输入文件（每行一个请求），返回请求数。"""
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with path.open("w", encoding="utf-8") as f:
+        for custom_id, prompt in items:
+            request = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": ENDPOINT,
+                "body": {
+                    "model": model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": temperature,
+                    "max_tokens": max_tokens,
+                },
+            }
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def submit(client: OpenAI, path: str | Path, metadata: dict[str, str] | None = None):
+    """上传请求文件并创建批次。"""
+
+    with open(path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+        metadata=metadata,
+    )
+
+
+def wait(client: OpenAI, batch_id: str, interval: float = DEFAULT_POLL_INTERVAL):
+    """轮询直到批次结束（完成、失败、过期或取消），期间打印进度。"""
+
+    last = None
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = (batch.status, counts.completed, counts.failed, counts.total) if counts else (batch.status,)
+        if progress != last:
+            done = f"，完成 {counts.completed}/{counts.total}，失败 {counts.failed}" if counts else ""
+            print(f"批次 {batch_id}：{batch.status}{done}")
+            last = progress
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        time.sleep(interval)
+
+
+def _iter_file_lines(client: OpenAI, file_id: str) -> Iterator[dict[str, Any]]:
+    with client.files.with_streaming_response.content(file_id) as response:
+        for line in response.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_results(client: OpenAI, batch) -> Iterator[tuple[str, str | None, str | None]]:
+    """流式读取批次的输出与错误文件，逐条产出 (custom_id, content, error)。"""
+
+    if batch.output_file_id:
+        for record in _iter_file_lines(client, batch.output_file_id):
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                error = record.get("error") or body.get("error") or f"HTTP {response.get('status_code')}"
+                yield record["custom_id"], None, json.dumps(error, ensure_ascii=False)
+                continue
+            usage = body.get("usage") or {}
+            telemetry.request(
+                "llm.batch", None,
+                prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+            )
+            yield record["custom_id"], body["choices"][0]["message"].get("content") or "", None
+    if batch.error_file_id:
+        for record in _iter_file_lines(client, batch.error_file_id):
+            error = record.get("error") or (record.get("response") or {}).get("body")
+            yield record["custom_id"], None, json.dumps(error, ensure_ascii=False)
+
+
+class BatchJob:
+    """一次批量生成任务在磁盘上的状态。
+
+    ``state_path`` 记录已提交、尚未取回结果的批次；``results_path`` 为追加写入的 JSONL，
+    每行一个请求的结果（content 或 error），同一 custom_id 以最后一次成功的结果为准。
+    """
+
+    def __init__(self, state_path: str | Path, results_path: str | Path) -> None:
+        self.state_path = Path(state_path)
+        self.results_path = Path(results_path)
+        self.pending: list[str] = []
+        if self.state_path.exists():
+            self.pending = json.loads(self.state_path.read_text(encoding="utf-8")).get("pending", [])
+        self.contents: dict[str, str] = {}
+        self.errors: dict[str, str] = {}
+        if self.results_path.exists():
+            with self.results_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:  # 中断时可能留下半行
+                        continue
+                    self._remember(record)
+
+    def _remember(self, record: dict[str, Any]) -> None:
+        custom_id = record["custom_id"]
+        if record.get("error") is None:
+            self.contents[custom_id] = record["content"]
+            self.errors.pop(custom_id, None)
+        elif custom_id not in self.contents:
+            self.errors[custom_id] = record["error"]
+
+    def save(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"pending": self.pending}, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(self.state_path)
+
+    def record(self, out, custom_id: str, content: str | None, error: str | None) -> None:
+        """追加一条结果；``out`` 为以追加模式打开的 results 文件。"""
+
+        record = {"custom_id": custom_id, "content": content, "error": error}
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._remember(record)
@@ -0,0 +1,329 @@
+"""近重复题目检测（MinHash + LSH），支持增量去重
+
+对题干与答案做字符 n-gram 切片，计算 MinHash 签名并按 LSH 分桶，只有落入同一桶的题目才比较
+签名相似度，避免两两比较的 O(n²) 开销。相似度达到阈值的题目归为同一簇，每簇只保留质量
+得分最高的一道。
+
+签名、分桶与每道题的原始记录都保存在 SQLite 索引中，新一批题目只需与索引比对，
+无需重新读取以前的语料；每次运行后把所有簇的代表题导出为完整的去重结果。
+
+用法：
+    python utils/dedup.py output/scheduled_questions.jsonl --output output/questions_dedup.json
+    python utils/dedup.py output/batch_2.json --threshold 0.6 --report output/duplicates.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import sys
+import time
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.process_json import iter_records, write_records  # noqa: E402
+
+DEFAULT_INDEX_PATH = Path("./output/dedup_index.sqlite")
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32
+DEFAULT_NGRAM = 3
+DEFAULT_THRESHOLD = 0.5
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+LOW_MASK = (1 << 32) - 1
+SEED = 1
+# 去掉空白与标点后再切片，避免“？”“，”之类的差异影响相似度
+NOISE_PATTERN = re.compile(r"[\s\u2000-\u206f\u3000-\u303f\uff00-\uff0f\uff1a-\uff20\uff3b-\uff40\uff5b-\uff65!-/:-@\[-`{-~]+")
+
+
+def normalize_text(text: str) -> str:
+    return NOISE_PATTERN.sub("", text).lower()
+
+
+def shingles(text: str, n: int = DEFAULT_NGRAM) -> set[int]:
+    """字符 n-gram 切片（CRC32 编码）；不足 n 个字符的文本整体作为一个切片。"""
+
+    text = normalize_text(text)
+    if len(text) <= n:
+        return {zlib.crc32(text.encode("utf-8"))} if text else set()
+    return {zlib.crc32(text[i:i + n].encode("utf-8")) for i in range(len(text) - n + 1)}
+
+
+class MinHasher:
+    """用 ``num_perm`` 个 (a*x + b) mod p 哈希近似随机置换，参数由固定种子生成，跨进程稳定。
+
+    签名用 numpy 一次算出所有置换与切片的组合。a 最大约 2^61，直接乘 32 位的切片会溢出
+    uint64，因此把 a 拆成高低两段分别相乘，再利用 2^61 ≡ 1 (mod p) 折叠，结果与逐个用
+    Python 大整数计算完全一致，已有索引中的签名仍然可用。
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, seed: int = SEED) -> None:
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [
+            (rng.randint(1, MERSENNE_PRIME - 1), rng.randint(0, MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        a = np.array([a for a, _ in self._params], dtype=np.uint64)[:, None]
+        self._a_hi = a >> np.uint64(32)
+        self._a_lo = a & np.uint64(LOW_MASK)
+        self._b = np.array([b for _, b in self._params], dtype=np.uint64)[:, None]
+
+    @staticmethod
+    def _fold(values: np.ndarray) -> np.ndarray:
+        """把小于 2^64 的值折叠到 [0, 2^61 + 8)，与原值模 p 同余。"""
+
+        return (values & np.uint64(MERSENNE_PRIME)) + (values >> np.uint64(61))
+
+    def signature(self, features: set[int]) -> array:
+        if not features:
+            return array("Q", [MAX_HASH] * self.num_perm)
+        x = np.fromiter(features, dtype=np.uint64, count=len(features))[None, :]
+        # a*x = a_hi*x*2^32 + a_lo*x；a_hi*x < 2^61，记为 hi*2^29 + lo，
+        # 乘以 2^32 后等于 hi*2^61 + lo*2^32 ≡ hi + lo*2^32 (mod p)
+        high = self._a_hi * x
+        high = (high >> np.uint64(29)) + ((high & np.uint64((1 << 29) - 1)) << np.uint64(32))
+        values = self._fold(self._a_lo * x) + self._fold(high) + self._b
+        values = self._fold(values)
+        values = np.where(values >= np.uint64(MERSENNE_PRIME), values - np.uint64(MERSENNE_PRIME), values)
+        return array("Q", (values.min(axis=1) & np.uint64(MAX_HASH)).tolist())
+
+
+def similarity(sig_a: array, sig_b: array) -> float:
+    """两个签名相同位置取值相等的比例，即 Jaccard 相似度的估计。"""
+
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+def question_text(question: dict[str, Any]) -> str:
+    """参与切片的文本：题干加答案。只用题干时，套用同一模板（“如果发现……过高，会导致什么问题？”）
+    而考点不同的题目相似度偏高。"""
+
+    return f"{question.get('question', '')}\n{question.get('answer', '')}"
+
+
+def question_uid(question: dict[str, Any]) -> str:
+    """已有稳定 ``uid`` 时直接使用，否则取规范化题干与答案的哈希（完全相同视为同一题）。"""
+
+    if question.get("uid"):
+        return str(question["uid"])
+    return hashlib.sha1(normalize_text(question_text(question)).encode("utf-8")).hexdigest()
+
+
+def quality_score(question: dict[str, Any]) -> float:
+    """簇内择优用的启发式得分：字段完整度优先，其次解析与原文依据越充分越好。"""
+
+    fields = ("question", "answer", "explanation", "source_quote")
+    score = float(sum(bool(str(question.get(f, "")).strip()) for f in fields))
+    score += min(len(str(question.get("explanation", ""))), 400) / 400
+    score += min(len(str(question.get("source_quote", ""))), 200) / 400
+    if question.get("options"):
+        score += 0.5
+    return score
+
+
+class DedupIndex:
+    """持久化的 MinHash/LSH 索引。
+
+    ``add`` 依次插入题目：与已有题目（含同一批次中先插入的）相似度不低于阈值时并入最相似
+    题目所在的簇；得分更高的新题会成为该簇新的代表题。
+    """
+
+    def __init__(
+        self,
+        path: str | Path = DEFAULT_INDEX_PATH,
+        num_perm: int = DEFAULT_NUM_PERM,
+        bands: int = DEFAULT_BANDS,
+        ngram: int = DEFAULT_NGRAM,
+        threshold: float = DEFAULT_THRESHOLD,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        self.path = Path(path)
+        self.threshold = threshold
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS items (
+                uid TEXT PRIMARY KEY,
+                cluster TEXT NOT NULL,
+                score REAL NOT NULL,
+                signature BLOB NOT NULL,
+                record TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS clusters (cluster TEXT PRIMARY KEY, representative TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, hash INTEGER NOT NULL, uid TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_buckets ON buckets(band, hash);
+            """
+        )
+        params = {"num_perm": num_perm, "bands": bands, "ngram": ngram, "seed": SEED}
+        stored = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if stored:
+            stored = {k: int(v) for k, v in stored.items()}
+            if stored != params:
+                raise ValueError(f"索引参数 {stored} 与当前参数 {params} 不一致，请换一个索引文件")
+        else:
+            self._conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in params.items()])
+            self._conn.commit()
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        self._hasher = MinHasher(num_perm)
+
+    def _band_hashes(self, sig: array) -> list[int]:
+        hashes = []
+        for band in range(self.bands):
+            chunk = sig[band * self.rows:(band + 1) * self.rows].tobytes()
+            digest = hashlib.blake2b(chunk, digest_size=8).digest()
+            hashes.append(int.from_bytes(digest, "big", signed=True))
+        return hashes
+
+    def _candidates(self, band_hashes: list[int]) -> set[str]:
+        found: set[str] = set()
+        for band, value in enumerate(band_hashes):
+            found.update(row[0] for row in self._conn.execute(
+                "SELECT uid FROM buckets WHERE band = ? AND hash = ?", (band, value)
+            ))
+        return found
+
+    def add(self, question: dict[str, Any]) -> dict[str, Any]:
+        """插入一道题，返回 ``{"uid", "status", "cluster", "duplicate_of", "similarity"}``。
+
+        status 为 ``unique``（新簇）、``duplicate``（并入已有簇但未取代代表题）、
+        ``replaced``（并入已有簇并成为新的代表题）或 ``seen``（索引中已有同一 uid）。
+        """
+
+        uid = question_uid(question)
+        if self._conn.execute("SELECT 1 FROM items WHERE uid = ?", (uid,)).fetchone():
+            return {"uid": uid, "status": "seen", "cluster": None, "duplicate_of": None, "similarity": 1.0}
+
+        sig = self._hasher.signature(shingles(question_text(question), self.ngram))
+        band_hashes = self._band_hashes(sig)
+        best_uid, best_cluster, best_sim = None, None, 0.0
+        for other in self._candidates(band_hashes):
+            cluster, blob = self._conn.execute(
+                "SELECT cluster, signature FROM items WHERE uid = ?", (other,)
+            ).fetchone()
+            sim = similarity(sig, array("Q", blob))
+            if sim > best_sim:
+                best_uid, best_cluster, best_sim = other, cluster, sim
+
+        score = quality_score(question)
+        status, cluster, duplicate_of = "unique", uid, None
+        if best_uid is not None and best_sim >= self.threshold:
+            cluster = best_cluster
+            duplicate_of, rep_score = self._conn.execute(
+                "SELECT c.representative, i.score FROM clusters c JOIN items i ON i.uid = c.representative "
+                "WHERE c.cluster = ?", (cluster,)
+            ).fetchone()
+            status = "duplicate"
+            if score > rep_score:
+                status = "replaced"
+                self._conn.execute("UPDATE clusters SET representative = ? WHERE cluster = ?", (uid, cluster))
+        else:
+            self._conn.execute("INSERT INTO clusters VALUES (?, ?)", (uid, uid))
+
+        self._conn.execute(
+            "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?)",
+            (uid, cluster, score, sig.tobytes(), json.dumps(question, ensure_ascii=False), time.time()),
+        )
+        self._conn.executemany(
+            "INSERT INTO buckets VALUES (?, ?, ?)",
+            [(band, value, uid) for band, value in enumerate(band_hashes)],
+        )
+        return {
+            "uid": uid,
+            "status": status,
+            "cluster": cluster,
+            "duplicate_of": duplicate_of,
+            "similarity": round(best_sim, 3),
+        }
+
+    def add_many(self, questions: Iterable[dict[str, Any]]) -> Iterator[tuple[dict[str, Any], dict[str, Any]]]:
+        """逐条插入并产出 ``(题目, 结果)``，题目可以来自流式读取；全部插入后提交。"""
+
+        for question in questions:
+            yield question, self.add(question)
+        self._conn.commit()
+
+    def representatives(self) -> Iterator[dict[str, Any]]:
+        """按首次入库顺序逐条产出每个簇的代表题。"""
+
+        rows = self._conn.execute(
+            "SELECT i.record FROM clusters c JOIN items i ON i.uid = c.representative "
+            "JOIN items first ON first.uid = c.cluster ORDER BY first.rowid"
+        )
+        for row in rows:
+            yield json.loads(row[0])
+
+    def stats(self) -> tuple[int, int]:
+        items = self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        clusters = self._conn.execute("SELECT COUNT(*) FROM clusters").fetchone()[0]
+        return items, clusters
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="MinHash/LSH 近重复题目检测，新批次与持久化索引增量比对。")
+    parser.add_argument("inputs", type=Path, nargs="+", help="题目文件（JSON 数组或 JSONL）")
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX_PATH, help="持久化索引路径")
+    parser.add_argument("--output", type=Path, default=Path("./output/questions_dedup.json"), help="去重后的完整题目集")
+    parser.add_argument("--report", type=Path, default=None, help="本次发现的重复题目明细（JSON）")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="判定为近重复的估计 Jaccard 相似度")
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM, help="MinHash 签名长度")
+    parser.add_argument("--bands", type=int, default=DEFAULT_BANDS, help="LSH 分段数（num_perm 须能被整除）")
+    parser.add_argument("--ngram", type=int, default=DEFAULT_NGRAM, help="字符切片长度")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    try:
+        index = DedupIndex(args.index, args.num_perm, args.bands, args.ngram, args.threshold)
+    except ValueError as exc:
+        sys.exit(str(exc))
+
+    start = time.perf_counter()
+    report = []
+    counts: dict[str, int] = {}
+    try:
+        for path in args.inputs:
+            for question, result in index.add_many(iter_records(path)):
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                if result["status"] in ("duplicate", "replaced"):
+                    report.append({**result, "file": str(path), "question": question.get("question")})
+
+        write_records(index.representatives(), args.output)
+        items, clusters = index.stats()
+    finally:
+        index.close()
+
+    if args.report is not None:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        args.report.write_text(json.dumps(report, ensure_ascii=False, indent=4), encoding="utf-8")
+
+    elapsed = time.perf_counter() - start
+    summary = "，".join(f"{k} {v}" for k, v in sorted(counts.items()))
+    print(f"本次处理：{summary}，耗时 {elapsed:.2f}s")
+    print(f"索引共 {items} 道题目、{clusters} 个簇，去重结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
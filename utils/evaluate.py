@@ -0,0 +1,219 @@
+"""并发测评：让一个或多个 LLM 作答最终数据集中的题目
+
+流式读取合并后的数据集（JSON 数组或 JSONL），同时向多个 OpenAI 兼容接口发送作答请求，
+每个目标模型各自限制并发数；数据集只读取一遍，按条分发给所有目标模型。
+
+每条作答完成后立即追加到结果文件（JSONL），该文件同时作为断点：重新运行时跳过已成功的
+(题目, 模型) 组合，只重试失败或尚未作答的部分。
+
+用法：
+    python utils/evaluate.py output/final_dataset.jsonl --model gpt-4o-mini --model qwen-plus@https://dashscope.aliyuncs.com/compatible-mode/v1
+    python utils/evaluate.py output/final_dataset.jsonl --model mock@http://127.0.0.1:8765/v1 --concurrency 32
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import http_pool  # noqa: E402
+from utils.process_json import iter_records, make_uid  # noqa: E402
+
+DEFAULT_OUTPUT = Path("./output/eval/results.jsonl")
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+# 早期 objective/reasoning 模式生成的题目使用整数题型
+LEGACY_TYPES = {1: "T1", 2: "T3", 3: "T5"}
+ANSWER_INSTRUCTIONS = {
+    "T1": "这是单项选择题，只输出一个正确选项的字母，不要输出其他内容。",
+    "T2": "这是多项选择题，只输出所有正确选项的字母组合（如 ABD），不要输出其他内容。",
+    "T3": "这是判断题，只输出 true 或 false，不要输出其他内容。",
+    "T4": "这是填空题，只输出所填的数值（含单位）或术语，不要输出其他内容。",
+    "T5": "这是简答题，请简明作答，分点列出关键要点。",
+    "T6": "这是场景分析题，请给出分析过程与结论，分点列出关键要点。",
+}
+
+
+class Target:
+    """一个测评对象：``name`` 为命令行中的写法，同时用作结果文件中的模型标识。"""
+
+    def __init__(self, spec: str, default_base_url: str) -> None:
+        self.name = spec
+        self.model, _, base_url = spec.partition("@")
+        self.base_url = base_url or default_base_url
+
+
+def question_type(item: dict[str, Any]) -> str:
+    value = item.get("type")
+    return LEGACY_TYPES.get(value, value) if isinstance(value, int) else str(value or "T5")
+
+
+def item_key(item: dict[str, Any]) -> str:
+    """题目在结果文件中的 key：优先 uid，其次 id，都没有时按题干与答案生成内容哈希。"""
+
+    for field in ("uid", "id"):
+        value = item.get(field)
+        if value is not None and value != "":
+            return str(value)
+    return make_uid(item)
+
+
+def build_answer_prompt(item: dict[str, Any]) -> str:
+    """测评用的作答提示词：题干、选项（若单独给出）与作答格式要求。"""
+
+    lines = ["# Role", "你是一名铝冶炼工业领域的工程师，请回答下面的考核题目。", "", "# Question", str(item.get("question", ""))]
+    options = item.get("options")
+    if isinstance(options, dict):
+        lines += [f"{k}. {v}" for k, v in options.items()]
+    elif isinstance(options, list):
+        lines += [str(option) for option in options]
+    lines += ["", "# Answer Format", ANSWER_INSTRUCTIONS.get(question_type(item), ANSWER_INSTRUCTIONS["T5"])]
+    return "\n".join(lines)
+
+
+def load_done(path: Path) -> set[tuple[str, str]]:
+    """结果文件中已成功作答的 (题目 key, 目标模型)。"""
+
+    done: set[tuple[str, str]] = set()
+    if not path.exists():
+        return done
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:  # 中断时可能留下半行
+                continue
+            if record.get("error") is None:
+                done.add((record["uid"], record["target"]))
+    return done
+
+
+async def answer_one(client, target: Target, item: dict[str, Any], args: argparse.Namespace) -> dict[str, Any]:
+    record = {
+        "uid": item_key(item),
+        "target": target.name,
+        "model": target.model,
+        "type": question_type(item),
+        "question": item.get("question"),
+        "reference": item.get("answer"),
+        "response": None,
+        "error": None,
+    }
+    start = time.perf_counter()
+    try:
+        response = await client.chat.completions.create(
+            model=target.model,
+            messages=[{"role": "user", "content": build_answer_prompt(item)}],
+            temperature=args.temperature,
+            max_tokens=args.max_tokens,
+        )
+        record["response"] = response.choices[0].message.content or ""
+        if response.usage is not None:
+            record["prompt_tokens"] = response.usage.prompt_tokens
+            record["completion_tokens"] = response.usage.completion_tokens
+    except Exception as exc:  # noqa: BLE001 - 记录失败，下次运行时重试
+        record["error"] = f"{type(exc).__name__}: {exc}"
+    record["latency"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+async def run_eval(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    """执行测评，返回每个目标模型本次的统计（完成数、失败数、平均延迟）。"""
+
+    targets = [Target(spec, args.base_url) for spec in args.model]
+    api_key = args.api_key or os.getenv("OPENAI_API_KEY")
+    done = load_done(args.output)
+    stats = {t.name: {"done": 0, "errors": 0, "latency": 0.0} for t in targets}
+    queues: dict[str, asyncio.Queue] = {t.name: asyncio.Queue(maxsize=args.concurrency * 2) for t in targets}
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+
+    async def producer() -> None:
+        try:
+            for count, item in enumerate(iter_records(args.dataset)):
+                if args.limit and count >= args.limit:
+                    break
+                for target in targets:
+                    if (item_key(item), target.name) not in done:
+                        await queues[target.name].put(item)
+        finally:
+            for target in targets:
+                for _ in range(args.concurrency):
+                    await queues[target.name].put(None)
+
+    async def worker(target: Target, slot: int, out) -> None:
+        # 每个目标模型按 ASYNC_SHARD_SIZE 个并发一组使用独立的连接池
+        shard = f"{target.name}/{slot // http_pool.ASYNC_SHARD_SIZE}"
+        client = http_pool.get_async_openai_client(target.base_url, api_key, shard)
+        queue = queues[target.name]
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            record = await answer_one(client, target, item, args)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            entry = stats[target.name]
+            entry["errors" if record["error"] else "done"] += 1
+            entry["latency"] += record["latency"]
+
+    try:
+        with args.output.open("a", encoding="utf-8") as out:
+            await asyncio.gather(
+                producer(),
+                *(worker(t, slot, out) for t in targets for slot in range(args.concurrency)),
+            )
+    finally:
+        await http_pool.aclose_async_clients()
+    return stats
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="并发调用一个或多个 LLM 作答数据集题目，支持断点续跑。")
+    parser.add_argument("dataset", type=Path, help="合并后的数据集（JSON 数组或 JSONL）")
+    parser.add_argument("--model", action="append", required=True,
+                        help="测评目标，格式为 MODEL 或 MODEL@BASE_URL，可重复指定多个")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="未在 --model 中指定时使用的 API 基础 URL")
+    parser.add_argument("--api-key", default=None, help="API Key，默认读取 OPENAI_API_KEY")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="逐题结果（JSONL，追加写入，兼作断点）")
+    parser.add_argument("--concurrency", type=int, default=16, help="每个目标模型的最大并发请求数")
+    parser.add_argument("--temperature", type=float, default=0.0, help="采样温度")
+    parser.add_argument("--max-tokens", type=int, default=1024, help="最大返回 tokens")
+    parser.add_argument("--timeout", type=float, default=http_pool.DEFAULT_TIMEOUT, help="单次请求超时（秒）")
+    parser.add_argument("--rpm", type=float, default=None, help="每个接口每分钟请求数上限，默认根据响应头与 429 自适应")
+    parser.add_argument("--tpm", type=float, default=None, help="每个接口每分钟 token 数上限，默认根据响应头与 429 自适应")
+    parser.add_argument("--no-rate-limit", action="store_true", help="关闭共享限速与 429 自动重试")
+    parser.add_argument("--limit", type=int, default=0, help="只测评前 N 道题，0 表示全部")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    args.concurrency = max(1, args.concurrency)
+    http_pool.configure(
+        pool_size=min(args.concurrency, http_pool.ASYNC_SHARD_SIZE),
+        timeout=args.timeout,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        rate_limit=not args.no_rate_limit,
+    )
+
+    start = time.perf_counter()
+    stats = asyncio.run(run_eval(args))
+    elapsed = time.perf_counter() - start
+
+    for name, entry in stats.items():
+        finished = entry["done"] + entry["errors"]
+        latency = entry["latency"] / finished if finished else 0.0
+        print(f"{name}: 完成 {entry['done']}，失败 {entry['errors']}，平均延迟 {latency:.2f}s")
+    total = sum(e["done"] + e["errors"] for e in stats.values())
+    print(f"本次共 {total} 次作答，耗时 {elapsed:.1f}s（{total / elapsed if elapsed else 0:.1f} 次/s），结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""进程级共享的 HTTP 连接池
+
+dataset.py 调用 OpenAI 兼容接口、raw/OCR.py 调用 MinerU 接口时都从这里取客户端，
+同一个 base_url（或同一主机）在整个进程内只创建一次，连接保持 keep-alive 复用，
+避免每次请求都重新建立 TCP+TLS 连接。所有客户端都经过 utils/rate_limit.py 的共享限速
+（按接口的 rpm/tpm 令牌桶，遇到 429 自动降速并重试）；启用限速时 OpenAI 客户端的 SDK
+重试次数设为 0，重试统一由限速层负责。
+
+    configure(pool_size=64, timeout=120, rpm=500)   # 可选，需在首次取客户端之前调用
+    session = get_session(url)             # requests.Session，按 scheme://host 复用
+    client = get_openai_client(base_url, api_key)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from openai import AsyncOpenAI, OpenAI
+from requests.adapters import HTTPAdapter
+
+from utils.rate_limit import (
+    DEFAULT_PATH as DEFAULT_RATE_LIMIT_PATH,
+    AsyncRateLimitedTransport,
+    RateLimitedAdapter,
+    RateLimitedTransport,
+    RateLimiter,
+)
+
+DEFAULT_POOL_SIZE = 32
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+# 单个异步连接池建议的最大连接数，超过后按 shard 拆分
+ASYNC_SHARD_SIZE = 16
+
+_config = {
+    "pool_size": DEFAULT_POOL_SIZE,
+    "timeout": DEFAULT_TIMEOUT,
+    "connect_timeout": DEFAULT_CONNECT_TIMEOUT,
+    "rate_limit": True,
+    "rate_limit_path": DEFAULT_RATE_LIMIT_PATH,
+    "rpm": None,
+    "tpm": None,
+}
+_limiter: RateLimiter | None = None
+_lock = threading.Lock()
+_sessions: dict[str, requests.Session] = {}
+_openai_clients: dict[tuple[str, str], OpenAI] = {}
+_async_openai_clients: dict[tuple[asyncio.AbstractEventLoop, str, str, str], AsyncOpenAI] = {}
+
+
+def configure(
+    pool_size: int | None = None,
+    timeout: float | None = None,
+    connect_timeout: float | None = None,
+    rpm: float | None = None,
+    tpm: float | None = None,
+    rate_limit: bool | None = None,
+    rate_limit_path: str | None = None,
+) -> None:
+    """设置连接池大小、超时（秒）与限速，只影响之后新建的客户端。
+
+    ``rpm``/``tpm`` 为每个接口每分钟的请求数/token 数上限，不设时由服务端的响应头与 429
+    自适应得出；``rate_limit=False`` 关闭限速与自动重试。
+    """
+
+    global _limiter
+    with _lock:
+        for name, value in (("rpm", rpm), ("tpm", tpm), ("rate_limit", rate_limit), ("rate_limit_path", rate_limit_path)):
+            if value is not None:
+                _config[name] = value
+                _limiter = None
+        if pool_size is not None:
+            _config["pool_size"] = max(1, pool_size)
+        if timeout is not None:
+            _config["timeout"] = timeout
+        if connect_timeout is not None:
+            _config["connect_timeout"] = connect_timeout
+
+
+class _PooledSession(requests.Session):
+    """未显式传入 timeout 的请求使用全局默认超时。"""
+
+    def __init__(self, timeout: tuple[float, float]) -> None:
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):  # type: ignore[override]
+        kwargs.setdefault("timeout", self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _get_limiter() -> RateLimiter | None:
+    global _limiter
+    if not _config["rate_limit"]:
+        return None
+    if _limiter is None:
+        _limiter = RateLimiter(_config["rate_limit_path"], rpm=_config["rpm"], tpm=_config["tpm"])
+    return _limiter
+
+
+def get_session(url: str) -> requests.Session:
+    """返回 ``url`` 所在主机共享的 requests.Session。"""
+
+    origin = _origin(url)
+    with _lock:
+        session = _sessions.get(origin)
+        if session is None:
+            session = _PooledSession((_config["connect_timeout"], _config["timeout"]))
+            options = {"pool_connections": _config["pool_size"], "pool_maxsize": _config["pool_size"]}
+            limiter = _get_limiter()
+            adapter = RateLimitedAdapter(limiter, **options) if limiter else HTTPAdapter(**options)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[origin] = session
+        return session
+
+
+def _httpx_options(is_async: bool = False) -> dict:
+    limits = httpx.Limits(
+        max_connections=_config["pool_size"],
+        max_keepalive_connections=_config["pool_size"],
+    )
+    if is_async:
+        transport = httpx.AsyncHTTPTransport(limits=limits)
+    else:
+        transport = httpx.HTTPTransport(limits=limits)
+    limiter = _get_limiter()
+    if limiter is not None:
+        wrapper = AsyncRateLimitedTransport if is_async else RateLimitedTransport
+        transport = wrapper(limiter, transport)
+    return {
+        "transport": transport,
+        "timeout": httpx.Timeout(_config["timeout"], connect=_config["connect_timeout"]),
+    }
+
+
+def _sdk_retry_options() -> dict:
+    """限速层已经重试 429、5xx 与连接失败时关闭 OpenAI SDK 自带的重试，避免两层重试相乘。"""
+
+    return {"max_retries": 0} if _get_limiter() is not None else {}
+
+
+def get_openai_client(base_url: str, api_key: str | None) -> OpenAI:
+    """返回 (base_url, api_key) 对应的同步 OpenAI 客户端，进程内复用。"""
+
+    key = (base_url, api_key or "")
+    with _lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            client = OpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                http_client=httpx.Client(**_httpx_options()),
+                **_sdk_retry_options(),
+            )
+            _openai_clients[key] = client
+        return client
+
+
+def get_async_openai_client(base_url: str, api_key: str | None, shard: str = "") -> AsyncOpenAI:
+    """返回当前事件循环内复用的异步 OpenAI 客户端。
+
+    httpx.AsyncClient 的连接绑定在创建它的事件循环上，因此按事件循环分别缓存；多个线程
+    各自运行事件循环（如 utils/pipeline.py 并行处理多本书）时互不影响。
+    httpcore 每次分配请求都会线性扫描池内所有连接，单个连接池过大时 CPU 开销随并发数
+    平方增长；并发数远超 ``ASYNC_SHARD_SIZE`` 时可用不同的 ``shard`` 拆成多个小连接池。
+    """
+
+    key = (asyncio.get_running_loop(), base_url, api_key or "", shard)
+    with _lock:
+        client = _async_openai_clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                http_client=httpx.AsyncClient(**_httpx_options(is_async=True)),
+                **_sdk_retry_options(),
+            )
+            _async_openai_clients[key] = client
+        return client
+
+
+async def aclose_async_clients() -> None:
+    """关闭当前事件循环创建的异步客户端，应在 asyncio.run 结束前调用。"""
+
+    loop = asyncio.get_running_loop()
+    with _lock:
+        owned = [k for k in _async_openai_clients if k[0] is loop]
+        clients = [_async_openai_clients.pop(k) for k in owned]
+    for client in clients:
+        await client.close()
+
+
+def close_all() -> None:
+    """关闭所有同步客户端与会话。"""
+
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        for client in _openai_clients.values():
+            client.close()
+        _sessions.clear()
+        _openai_clients.clear()
@@ -0,0 +1,466 @@
+"""端到端增量流水线：PDF 拆分 -> OCR -> Markdown 分块 -> 生成题目 -> 合并
+
+把原来需要手动依次运行的五个脚本组织成一个 DAG。每本书（materials/raw/ 下的一个 PDF）
+依次经过 slice / ocr / split / generate 四个阶段，最后所有书的题目合并为一个数据集：
+
+    slice     raw/SlicePDF.py     materials/raw/<书>.pdf -> materials/processed/<书>/
+    ocr       raw/OCR.py          -> materials/ocr/<书>/<页文件>/full.md
+    split     raw/splitter.py     -> materials/split_markdown/<书>/*_chunks.json
+    generate  dataset/dataset.py  -> output/pipeline/questions/<书>.jsonl
+    merge     utils/process_json  -> output/pipeline/questions.jsonl（及 --labels 时的最终数据集）
+
+分块完成后，materials/split_markdown/ 下的分块会增量加入 utils/retrieval.py 的检索索引
+（只索引内容变化的分块文件），供 dataset.py --topic 按考点出题。
+
+每个阶段的键是“阶段参数 + 上游产物内容哈希”的哈希，与产物清单及其指纹一起记录在
+``output/pipeline/state.json``。重新运行时，键未变且产物未被改动的阶段直接跳过；阶段重跑后
+若产物内容与上次相同，下游阶段仍然保持干净。提示词模板的改动体现在 generate 阶段的参数中。
+因此新增或修改一本书只会重跑这本书的各阶段和最后的合并，修改分块参数只会从 split 开始重跑。
+
+不同书的阶段链在线程池中并行，拆分 PDF 与切分 Markdown 这类 CPU 密集的工作交给共享的进程池。
+OCR 阶段沿用 raw/OCR.py 的逐文件 manifest，只上传内容变化的页文件；generate 阶段沿用本地响应缓存。
+每次运行的各阶段耗时、请求延迟与 token 用量记录在 ``<workdir>/telemetry.jsonl``，结束时打印汇总
+（见 utils/telemetry.py）。
+
+用法：
+    python utils/pipeline.py --jobs 4 --pages-per-file 20 --max-chunk-size 2000
+    python utils/pipeline.py --plan                   # 只列出各书需要重跑的阶段
+    python utils/pipeline.py --docs 铝冶炼工艺 --force generate
+    python utils/pipeline.py --until split            # 只做到分块，不调用模型
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dataset.dataset import (  # noqa: E402
+    build_prompt,
+    combine_batch_results,
+    generate_batch,
+    load_batch_prompts,
+)
+from raw import OCR  # noqa: E402
+from raw.SlicePDF import INDEX_NAME, split_pdf  # noqa: E402
+from raw.splitter import output_name, split_to_file  # noqa: E402
+from utils import http_pool, telemetry  # noqa: E402
+from utils.llm_cache import DEFAULT_CACHE_PATH, ResponseCache  # noqa: E402
+from utils.process_json import iter_records, merge_data, write_records  # noqa: E402
+from utils.retrieval import DEFAULT_INDEX_DIR, BM25Index  # noqa: E402
+
+DEFAULT_MATERIALS = Path("./materials")
+DEFAULT_WORKDIR = Path("./output/pipeline")
+STATE_NAME = "state.json"
+DOC_STAGES = ("slice", "ocr", "split", "generate")
+MERGE_ID = "_corpus/merge"
+
+
+class Document:
+    """一本书在各阶段的产物位置，与各脚本单独运行时的默认目录一致。"""
+
+    def __init__(self, pdf: Path, materials: Path, workdir: Path) -> None:
+        self.name = pdf.stem
+        self.pdf = pdf
+        self.pages_dir = materials / "processed" / pdf.stem
+        self.ocr_dir = materials / "ocr" / pdf.stem
+        self.chunks_root = materials / "split_markdown"
+        self.chunks_dir = self.chunks_root / pdf.stem
+        self.questions = workdir / "questions" / f"{pdf.stem}.jsonl"
+
+
+class ArtifactStore:
+    """流水线状态：各阶段的键、产物清单与指纹，以及文件内容哈希的缓存。
+
+    文件哈希按 (大小, mtime) 缓存，与 raw/OCR.py 的 manifest 做法相同，未改动的大文件不会重复读取。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            state = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        self.files: dict[str, list] = state.get("files", {})
+        self.stages: dict[str, dict[str, Any]] = state.get("stages", {})
+
+    def file_hash(self, path: Path) -> str | None:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        rel = path.as_posix()
+        with self._lock:
+            cached = self.files.get(rel)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = OCR.hash_file(path)
+        with self._lock:
+            self.files[rel] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def fingerprint(self, paths: list[Path]) -> str | None:
+        """一组文件的内容指纹；任何一个文件缺失时返回 None。"""
+
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            file_hash = self.file_hash(path)
+            if file_hash is None:
+                return None
+            digest.update(f"{path.as_posix()}\0{file_hash}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_clean(self, stage_id: str, key: str) -> bool:
+        entry = self.stages.get(stage_id)
+        if entry is None or entry["key"] != key:
+            return False
+        return self.fingerprint([Path(p) for p in entry["outputs"]]) == entry["fingerprint"]
+
+    def is_intact(self, stage_id: str) -> bool:
+        """阶段曾经完成且产物未被改动（不检查参数是否变化）。"""
+
+        entry = self.stages.get(stage_id)
+        return entry is not None and self.fingerprint([Path(p) for p in entry["outputs"]]) == entry["fingerprint"]
+
+    def outputs(self, stage_id: str) -> list[Path]:
+        return [Path(p) for p in self.stages[stage_id]["outputs"]]
+
+    def output_fingerprint(self, stage_id: str) -> str:
+        return self.stages[stage_id]["fingerprint"]
+
+    def record(self, stage_id: str, key: str, outputs: list[Path]) -> None:
+        entry = {
+            "key": key,
+            "outputs": [p.as_posix() for p in outputs],
+            "fingerprint": self.fingerprint(outputs),
+            "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._lock:
+            self.stages[stage_id] = entry
+        self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            text = json.dumps({"files": self.files, "stages": self.stages}, ensure_ascii=False, indent=1)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def stage_key(stage: str, params: dict[str, Any], upstream: str | None) -> str:
+    payload = json.dumps({"stage": stage, "params": params, "inputs": upstream}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def generation_args(args: argparse.Namespace, chunks_dir: Path | None = None) -> argparse.Namespace:
+    """构造 dataset.py 批量模式所需的参数。"""
+
+    return argparse.Namespace(
+        input=chunks_dir,
+        topic=None,
+        mode=args.mode,
+        single_choice=args.single_choice,
+        true_false=args.true_false,
+        reasoning_count=args.reasoning_count,
+        pack_tokens=args.pack_tokens,
+        print_prompt=False,
+        dry_run=False,
+    )
+
+
+def stage_params(args: argparse.Namespace) -> dict[str, dict[str, Any]]:
+    """各阶段影响产物内容的参数；generate 用空输入渲染出的提示词模板代表模板与题量设置。"""
+
+    template = build_prompt(generation_args(args), "{input_text}")
+    return {
+        "slice": {"z_library": args.z_library, "pages_per_file": args.pages_per_file, "max_file_mb": args.max_file_mb},
+        "ocr": {"api_base": OCR.api_base},
+        "split": {"max_chunk_size": args.max_chunk_size, "chunk_overlap": args.chunk_overlap},
+        "generate": {
+            "template": hashlib.sha256(template.encode("utf-8")).hexdigest(),
+            "model": args.model,
+            "temperature": args.temperature,
+            "max_tokens": args.max_tokens,
+            "pack_tokens": args.pack_tokens,
+        },
+    }
+
+
+class Pipeline:
+    def __init__(self, args: argparse.Namespace, store: ArtifactStore, pool: Executor, cache: ResponseCache | None) -> None:
+        self.args = args
+        self.store = store
+        self.pool = pool
+        self.cache = cache
+        self.params = stage_params(args)
+        self.runners: dict[str, Callable[[Document, list[Path]], list[Path]]] = {
+            "slice": self.run_slice,
+            "ocr": self.run_ocr,
+            "split": self.run_split,
+            "generate": self.run_generate,
+        }
+        self.stages = DOC_STAGES[:DOC_STAGES.index(args.until) + 1] if args.until else DOC_STAGES
+
+    # ----------------------------- 各阶段 -----------------------------
+
+    def run_slice(self, doc: Document, inputs: list[Path]) -> list[Path]:
+        # 清掉上次的页文件，避免改变 --pages-per-file 后旧文件混入 OCR
+        for old in doc.pages_dir.glob("*.pdf"):
+            old.unlink()
+        args = self.args
+        # 相对路径会被 SlicePDF 解析到仓库内的 materials/，这里传绝对路径
+        _, seconds = self.pool.submit(
+            telemetry.timed_call,
+            split_pdf, doc.pdf.resolve(), None, args.z_library, args.pages_per_file, args.max_file_mb,
+        ).result()
+        telemetry.record("slice", seconds, item=doc.pdf.name)
+        return sorted(doc.pages_dir.glob("*.pdf")) + [doc.pages_dir / INDEX_NAME]
+
+    def run_ocr(self, doc: Document, inputs: list[Path]) -> list[Path]:
+        file_path, data = OCR.construct_pdf_data(doc.pages_dir, hash_workers=self.args.hash_workers)
+        if file_path:
+            batch_id = OCR.upload_pdfs(file_path, data, workers=self.args.upload_workers, pdf_url=doc.pages_dir)
+            if batch_id is None:
+                raise RuntimeError("上传失败")
+            OCR.download_results(
+                OCR.iter_resolved_results(batch_id), doc.ocr_dir, doc.pages_dir, workers=self.args.download_workers
+            )
+            OCR.clear_upload_state(doc.pages_dir)
+        manifest = OCR.load_manifest(doc.pages_dir)
+        pending = [rel for rel, entry in manifest.items() if entry.get("processed_sha256") != entry.get("sha256")]
+        if pending:
+            raise RuntimeError(f"{len(pending)} 个页文件 OCR 未完成，重新运行以继续")
+        return sorted(doc.ocr_dir / rel / "full.md" for rel in manifest)
+
+    def run_split(self, doc: Document, inputs: list[Path]) -> list[Path]:
+        for old in doc.chunks_dir.glob("*_chunks.json"):
+            old.unlink()
+        args = self.args
+        outputs = [doc.chunks_dir / output_name(md, doc.ocr_dir) for md in inputs]
+        futures = [
+            self.pool.submit(telemetry.timed_call, split_to_file, md, out, args.max_chunk_size, args.chunk_overlap)
+            for md, out in zip(inputs, outputs)
+        ]
+        for md, future in zip(inputs, futures):
+            count, seconds = future.result()
+            telemetry.record("split", seconds, item=str(md.relative_to(doc.ocr_dir)), chunks=count)
+        return outputs
+
+    def run_generate(self, doc: Document, inputs: list[Path]) -> list[Path]:
+        args = self.args
+        chunks, prompts = load_batch_prompts(generation_args(args, doc.chunks_dir))
+        results = asyncio.run(
+            generate_batch(
+                prompts,
+                model=args.model,
+                temperature=args.temperature,
+                max_tokens=args.max_tokens,
+                api_key=args.api_key or os.getenv("OPENAI_API_KEY"),
+                base_url=args.base_url,
+                concurrency=args.concurrency,
+                cache=self.cache,
+                stream=args.stream,
+            )
+        )
+        failed = sum(isinstance(r, Exception) for r in results)
+        count = write_records(combine_batch_results(chunks, results, doc.chunks_root), doc.questions)
+        telemetry.count("questions", count)
+        if failed:
+            # 已成功的分块在响应缓存中，重跑时只会重新请求失败的分块
+            raise RuntimeError(f"{failed}/{len(chunks)} 个分块生成失败，已写出的 {count} 道题目不计为完成")
+        return [doc.questions]
+
+    # ----------------------------- 调度 -----------------------------
+
+    def run_document(self, doc: Document) -> bool:
+        """按顺序检查并执行一本书的各阶段，返回是否全部完成。"""
+
+        upstream = self.store.fingerprint([doc.pdf])
+        inputs = [doc.pdf]
+        for stage in self.stages:
+            stage_id = f"{doc.name}/{stage}"
+            key = stage_key(stage, self.params[stage], upstream)
+            if stage not in self.args.force and self.store.is_clean(stage_id, key):
+                inputs = self.store.outputs(stage_id)
+            elif self.args.plan:
+                print(f"{doc.name}: 需要从 {stage} 开始重跑")
+                return False
+            else:
+                print(f"[{stage_id}] 开始")
+                start = time.perf_counter()
+                try:
+                    with telemetry.span(f"pipeline.{stage}", item=doc.name) as fields:
+                        inputs = self.runners[stage](doc, inputs)
+                        fields["outputs"] = len(inputs)
+                except Exception as exc:  # noqa: BLE001 - 一本书失败不影响其它书
+                    print(f"[{stage_id}] 失败：{exc}")
+                    return False
+                self.store.record(stage_id, key, inputs)
+                print(f"[{stage_id}] 完成，{len(inputs)} 个产物，耗时 {time.perf_counter() - start:.1f}s")
+            upstream = self.store.output_fingerprint(stage_id)
+        if self.args.plan:
+            print(f"{doc.name}: 已是最新")
+        return True
+
+    def run_index(self) -> None:
+        """把 split_markdown/ 下的分块增量加入检索索引，已删除的书同时从索引中移除。"""
+
+        source = self.args.materials / "split_markdown"
+        if not source.is_dir():
+            return
+        index = BM25Index(self.args.index)
+        try:
+            with telemetry.span("pipeline.index", item=str(self.args.index)) as fields:
+                added, removed = index.update([source])
+                fields.update(added=added, removed=removed)
+        finally:
+            index.close()
+        if added or removed:
+            print(f"检索索引已更新：新增 {added} 个分块，删除 {removed} 个")
+
+    def run_merge(self, docs: list[Document]) -> None:
+        """把各书的题目按书名顺序合并并重新编号；给出 --labels 时再与标签合并。"""
+
+        args = self.args
+        merged = args.workdir / "questions.jsonl"
+        upstream = {doc.name: self.store.output_fingerprint(f"{doc.name}/generate") for doc in docs}
+        params = {"labels": self.store.fingerprint([args.labels]) if args.labels else None, "output": str(args.output)}
+        key = stage_key("merge", params, json.dumps(upstream, sort_keys=True))
+        if "merge" not in args.force and self.store.is_clean(MERGE_ID, key):
+            print(f"合并结果已是最新：{merged}")
+            return
+        if args.plan:
+            print(f"需要重新合并 {len(docs)} 本书的题目")
+            return
+
+        def records():
+            for number, record in enumerate(
+                (r for doc in docs for r in iter_records(doc.questions)), start=1
+            ):
+                record["id"] = number
+                yield record
+
+        with telemetry.span("pipeline.merge", item=f"{len(docs)} docs"):
+            count = write_records(records(), merged)
+            outputs = [merged]
+            if args.labels:
+                merge_data(merged, args.labels, args.output)
+                outputs.append(args.output)
+        self.store.record(MERGE_ID, key, outputs)
+        print(f"已合并 {len(docs)} 本书的 {count} 道题目到 {merged}")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="增量运行 拆分 -> OCR -> 分块 -> 生成 -> 合并 流水线。")
+    parser.add_argument("--materials", type=Path, default=DEFAULT_MATERIALS, help="资料根目录，书籍 PDF 位于其下的 raw/")
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR, help="流水线状态与题目输出目录")
+    parser.add_argument("--docs", nargs="*", default=None, help="只处理这些书（PDF 文件名，不含扩展名）")
+    parser.add_argument("--jobs", type=int, default=4, help="并行处理的书籍数，同时也是 CPU 阶段的进程数")
+    parser.add_argument("--until", choices=DOC_STAGES, default=None, help="只运行到该阶段为止，不做合并")
+    parser.add_argument("--force", nargs="*", default=[], choices=DOC_STAGES + ("merge",), help="强制重跑这些阶段")
+    parser.add_argument("--plan", action="store_true", help="只列出需要重跑的阶段，不执行")
+    parser.add_argument("--telemetry", type=Path, default=None,
+                        help="各阶段耗时、请求延迟与 token 用量的 JSONL 记录，默认 <workdir>/telemetry.jsonl")
+    parser.add_argument("--no-telemetry", action="store_true", help="不记录运行统计")
+    parser.add_argument("--profile", type=Path, default=None, help="用 cProfile 分析主线程并写出 .prof 文件")
+    parser.add_argument("--price", type=float, nargs=2, metavar=("INPUT", "OUTPUT"), default=None,
+                        help="每百万输入/输出 token 的价格，用于在汇总中估算费用")
+
+    group = parser.add_argument_group("slice")
+    group.add_argument("--z-library", action="store_true", help="去掉 Z-Library PDF 中多余的扫描页")
+    group.add_argument("--pages-per-file", type=int, default=1, help="每个页文件包含的页数")
+    group.add_argument("--max-file-mb", type=float, default=None, help="页文件估计大小上限（MB）")
+
+    group = parser.add_argument_group("ocr")
+    group.add_argument("--ocr-api-key", default=os.getenv("MINERU_API_KEY", ""), help="MinerU API Key，默认读取 MINERU_API_KEY")
+    group.add_argument("--ocr-api-base", default=OCR.api_base, help="MinerU API 基础 URL")
+    group.add_argument("--hash-workers", type=int, default=4, help="每本书计算页文件哈希的线程数")
+    group.add_argument("--upload-workers", type=int, default=4, help="每本书并行上传的文件数")
+    group.add_argument("--download-workers", type=int, default=4, help="每本书并行下载解压的结果数")
+
+    group = parser.add_argument_group("split")
+    group.add_argument("--max-chunk-size", type=int, default=None, help="超过该字符数的章节继续切分")
+    group.add_argument("--chunk-overlap", type=int, default=0, help="切分片段之间重复的字符数")
+    group.add_argument("--index", type=Path, default=DEFAULT_INDEX_DIR, help="分块检索索引目录（供 dataset.py --topic 使用）")
+    group.add_argument("--no-index", action="store_true", help="不更新检索索引")
+
+    group = parser.add_argument_group("generate")
+    group.add_argument("--mode", choices=["objective", "reasoning"], default="objective", help="生成模式")
+    group.add_argument("--single-choice", type=int, default=5, help="单选题数量")
+    group.add_argument("--true-false", type=int, default=5, help="判断题数量")
+    group.add_argument("--reasoning-count", type=int, default=5, help="推理题数量")
+    group.add_argument("--pack-tokens", type=int, default=0, help="把相邻小分块合并到该 token 预算以内，0 表示不合并")
+    group.add_argument("--model", default="gpt-4o-mini", help="调用的 OpenAI 模型名称")
+    group.add_argument("--temperature", type=float, default=0.2, help="采样温度")
+    group.add_argument("--max-tokens", type=int, default=2000, help="最大返回 tokens")
+    group.add_argument("--api-key", default=None, help="OpenAI API Key，默认读取 OPENAI_API_KEY")
+    group.add_argument("--base-url", default="https://api.openai.com/v1", help="OpenAI API 基础 URL")
+    group.add_argument("--concurrency", type=int, default=8, help="每本书同时进行的最大请求数")
+    group.add_argument("--stream", action="store_true", help="流式解析模型输出")
+    group.add_argument("--no-cache", action="store_true", help="不使用本地响应缓存")
+    group.add_argument("--cache-path", type=Path, default=DEFAULT_CACHE_PATH, help="响应缓存 SQLite 文件路径")
+
+    group = parser.add_argument_group("merge")
+    group.add_argument("--labels", type=Path, default=None, help="人工标签文件；给出时与题目合并为最终数据集")
+    group.add_argument("--output", type=Path, default=Path("./output/final_dataset.jsonl"), help="最终数据集路径（需 --labels）")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    args.jobs = max(1, args.jobs)
+    OCR.api_base = args.ocr_api_base
+    OCR.token = args.ocr_api_key
+    OCR.header = {"Content-Type": "application/json", "Authorization": f"Bearer {OCR.token}"}
+    http_pool.configure(pool_size=max(args.concurrency, args.upload_workers, args.download_workers) * args.jobs)
+    if not args.plan and not args.no_telemetry:
+        telemetry.enable(args.telemetry or args.workdir / "telemetry.jsonl", profile=args.profile, prices=args.price)
+
+    docs = [Document(pdf, args.materials, args.workdir) for pdf in sorted((args.materials / "raw").glob("*.pdf"))]
+    selected = [doc for doc in docs if not args.docs or doc.name in args.docs]
+    if not selected:
+        raise SystemExit(f"{args.materials / 'raw'} 下没有需要处理的 PDF")
+
+    store = ArtifactStore(args.workdir / STATE_NAME)
+    cache = None if args.no_cache or args.plan else ResponseCache(args.cache_path)
+    start = time.perf_counter()
+    # 进程池在工作线程中才开始提交任务，用 spawn 避免在多线程进程中 fork
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=args.jobs, mp_context=context) as pool, \
+                ThreadPoolExecutor(max_workers=args.jobs) as threads:
+            pipeline = Pipeline(args, store, pool, cache)
+            done = dict(zip((doc.name for doc in selected), threads.map(pipeline.run_document, selected)))
+        if "split" in pipeline.stages and not args.plan and not args.no_index:
+            pipeline.run_index()
+        if args.until is None:
+            # 未选中的书沿用上次完成的题目
+            finished = [
+                doc for doc in docs
+                if (done[doc.name] if doc.name in done else store.is_intact(f"{doc.name}/generate"))
+            ]
+            if len(finished) < len(docs) and not args.plan:
+                print(f"{len(docs) - len(finished)} 本书未完成，合并结果只包含已完成的 {len(finished)} 本")
+            if finished and (not args.plan or len(finished) == len(docs)):
+                pipeline.run_merge(finished)
+    finally:
+        store.save()
+        if cache is not None:
+            cache.close()
+    print(f"流水线结束，耗时 {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,240 @@
-import json
+"""数据集文件工具：合并问题与标签、JSON/JSONL 互转
+
+数据集以追加写入的 JSONL（每行一道题）为主格式，题目带全局唯一且稳定的 ``uid``
+（见 make_uid），多次生成的结果可以直接拼接而不会冲突。以前的 JSON 数组格式仍可读写，
+两种格式都按条流式处理，合并与转换时内存占用与数据集大小无关。
+
+用法：
+   python utils/process_json.py questions.jsonl labels.jsonl --output output/final_dataset.jsonl
+   python utils/process_json.py output/questions.json --convert --output output/questions.jsonl
+"""
+
+from __future__ import annotations
+
 import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable, Iterator
 
-def merge_data(questions_file,labels_file,output_file):
+READ_BLOCK_SIZE = 1 << 16
+SEPARATOR_PATTERN = re.compile(r'[\s,]*')
+# 数字与 true/false/null 可能出现的字符；标量之后到缓冲区末尾只剩这些字符时，它可能还没读完
+SCALAR_TAIL_PATTERN = re.compile(r'[\w.+-]*')
+# 标签文件小于该大小时直接载入内存做连接，否则放到临时 SQLite 中按键查询
+IN_MEMORY_LIMIT_MB = 64
 
-   with open(questions_file,'r',encoding='utf-8') as f:
-      questions = json.load(f)
-   with open(labels_file,'r',encoding='utf-8') as f:
-      labels = json.load(f)
 
-   label_map = {item['id']:item for item in labels}
-   final_dataset = []
+def _digest(text: str, length: int) -> str:
+   return hashlib.sha1(text.encode('utf-8')).hexdigest()[:length]
 
-   for q in questions:
-      q_id = q.get('id')
-      if q_id in label_map:
-         label_data = label_map[q_id]
-         q.update(label_data)
-         final_dataset.append(q)
+
+def make_uid(question: dict[str, Any], chunk_text: str | None = None, source: str = '') -> str:
+   """稳定的全局题目 ID：``<分块哈希12位>-<题目哈希8位>``。
+
+   分块哈希优先取分块原文，其次取题目记录的 chunk 引用（文件名#序号），最后取来源文件名；
+   题目哈希取题干加答案。每次运行的序号都从 1 开始，因此这里用题目内容代替序号，
+   同一分块多次生成的题目不会撞 ID，同一道题重新导出时 ID 不变。
+   """
+
+   if chunk_text is None:
+      chunk = question.get('chunk')
+      if isinstance(chunk, dict) and chunk.get('file') is not None:
+         chunk_text = f"{chunk['file']}#{chunk.get('index')}"
       else:
-         print(f"警告：题目{q_id}没找到标签，跳过。")
+         chunk_text = source
+   content = f"{question.get('question', '')}\n{question.get('answer', '')}"
+   return f"{_digest(chunk_text, 12)}-{_digest(content, 8)}"
+
+
+def chunk_ref(file: str | Path, root: str | Path | None = None) -> str:
+   """分块文件在题目 ``chunk.file`` 中的写法：相对分块根目录的路径（如 ``<书>/<文件>``）。
+
+   流水线按书分目录存放分块，不同书中常有同名的分块文件，只用文件名会让出处互相冲突；
+   文件不在 ``root`` 下（或未给出 ``root``）时退回文件名。
+   """
+
+   file = Path(file)
+   if root is not None:
+      try:
+         return file.resolve().relative_to(Path(root).resolve()).as_posix()
+      except ValueError:
+         pass
+   return file.name
+
+
+def iter_json_array(path: str | Path) -> Iterator[Any]:
+   """逐个产出 JSON 数组文件中的元素，每次只读入一块内容。
+
+   标量只有在其后出现分隔符（或文件结束）时才被接受，跨块的数字不会被拆成两个值。
+   """
+
+   decoder = json.JSONDecoder()
+   with open(path, 'r', encoding='utf-8') as f:
+      buffer = f.read(READ_BLOCK_SIZE).lstrip()
+      if not buffer.startswith('['):
+         raise ValueError(f"{path} 不是 JSON 数组")
+      pos, eof = 1, False
+      while True:
+         pos = SEPARATOR_PATTERN.match(buffer, pos).end()
+         if buffer.startswith(']', pos):
+            return
+         try:
+            if pos == len(buffer):
+               raise json.JSONDecodeError('需要更多内容', buffer, pos)
+            item, end = decoder.raw_decode(buffer, pos)
+            # 数字与 true/false/null 读到缓冲区末尾时可能只是前半截，读入下一块后重新解析
+            if (not eof and not isinstance(item, (dict, list, str))
+                  and SCALAR_TAIL_PATTERN.match(buffer, end).end() == len(buffer)):
+               raise json.JSONDecodeError('标量可能尚未结束', buffer, pos)
+            pos = end
+         except json.JSONDecodeError:
+            if eof:
+               raise
+            block = f.read(READ_BLOCK_SIZE)
+            eof = not block
+            buffer, pos = buffer[pos:] + block, 0
+            continue
+         yield item
+
+
+def iter_records(path: str | Path) -> Iterator[dict[str, Any]]:
+   """按扩展名读取 JSONL（.jsonl）或 JSON 数组文件，逐条产出。"""
+
+   if Path(path).suffix == '.jsonl':
+      with open(path, 'r', encoding='utf-8') as f:
+         for line in f:
+            if line.strip():
+               yield json.loads(line)
+   else:
+      yield from iter_json_array(path)
+
+
+def write_records(records: Iterable[dict[str, Any]], path: str | Path, append: bool = False) -> int:
+   """流式写出记录，返回条数。.jsonl 为每行一条（可追加），否则写成与以前相同的缩进 JSON 数组。"""
+
+   path = Path(path)
+   path.parent.mkdir(parents=True, exist_ok=True)
+   count = 0
+   if path.suffix == '.jsonl':
+      with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+         for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+      return count
+
+   if append:
+      raise ValueError("只有 JSONL 输出支持追加写入")
+   with open(path, 'w', encoding='utf-8') as f:
+      for record in records:
+         text = json.dumps(record, ensure_ascii=False, indent=4).replace('\n', '\n    ')
+         f.write(('[\n    ' if count == 0 else ',\n    ') + text)
+         count += 1
+      f.write('\n]' if count else '[]')
+   return count
+
+
+def with_uids(records: Iterable[dict[str, Any]], source: str = '') -> Iterator[dict[str, Any]]:
+   """为缺少 uid 的记录补上稳定 ID。"""
+
+   for record in records:
+      if not record.get('uid'):
+         record['uid'] = make_uid(record, source=source)
+      yield record
+
+
+class LabelStore:
+   """按键查询标签：小文件放在内存字典中，大文件放在临时 SQLite 中。"""
+
+   def __init__(self, labels: Iterable[dict[str, Any]], key: str, in_memory: bool) -> None:
+      self._tmpdir = None
+      self._conn = None
+      self._map: dict[Any, dict[str, Any]] = {}
+      if in_memory:
+         self._map = {item.get(key): item for item in labels}
+         return
+
+      self._tmpdir = tempfile.TemporaryDirectory()
+      self._conn = sqlite3.connect(os.path.join(self._tmpdir.name, 'labels.sqlite'))
+      self._conn.execute('CREATE TABLE labels (key TEXT PRIMARY KEY, record TEXT NOT NULL)')
+      rows = ((json.dumps(item.get(key)), json.dumps(item, ensure_ascii=False)) for item in labels)
+      while True:
+         batch = list(itertools.islice(rows, 10000))
+         if not batch:
+            break
+         self._conn.executemany('INSERT OR REPLACE INTO labels VALUES (?, ?)', batch)
+      self._conn.commit()
+
+   def get(self, value: Any) -> dict[str, Any] | None:
+      if self._conn is None:
+         return self._map.get(value)
+      row = self._conn.execute('SELECT record FROM labels WHERE key = ?', (json.dumps(value),)).fetchone()
+      return json.loads(row[0]) if row else None
+
+   def close(self) -> None:
+      if self._conn is not None:
+         self._conn.close()
+         self._tmpdir.cleanup()
+
+
+def merge_data(questions_file, labels_file, output_file, key=None, max_memory_mb=IN_MEMORY_LIMIT_MB):
+   """流式合并：逐条读取问题，按 ``key``（默认有 uid 时用 uid，否则用 id）查找标签并写出。"""
+
+   labels = iter_records(labels_file)
+   first = next(labels, None)
+   if key is None:
+      key = 'uid' if first is not None and 'uid' in first else 'id'
+   labels = itertools.chain([first] if first is not None else [], labels)
+   in_memory = os.path.getsize(labels_file) <= max_memory_mb * 1024 * 1024
+   store = LabelStore(labels, key, in_memory)
+
+   def merged():
+      for q in iter_records(questions_file):
+         q_id = q.get(key)
+         label_data = store.get(q_id)
+         if label_data is not None:
+            q.update(label_data)
+            yield q
+         else:
+            print(f"警告：题目{q_id}没找到标签，跳过。")
+
+   try:
+      count = write_records(merged(), output_file)
+   finally:
+      store.close()
+
+   print(f"完成！共生成 {count} 条数据。")
+
+
+def convert(input_file, output_file, append=False):
+   """JSON 数组与 JSONL 互转（格式由扩展名决定），同时为缺少 uid 的题目补上 uid。"""
 
-   with open(output_file,'w',encoding='utf-8')as f:
-      json.dump(final_dataset, f, ensure_ascii=False, indent=4)
+   records = with_uids(iter_records(input_file), source=Path(input_file).name)
+   count = write_records(records, output_file, append=append)
+   print(f"完成！共转换 {count} 条数据到 {output_file}。")
 
-   print(f"完成！共生成 {len(final_dataset)} 条数据。")
 
 def getArgs():
    parser = argparse.ArgumentParser()
-   parser.add_argument('questions', type=str, default='step1_questions.json', help='问题文件路径')
-   parser.add_argument('labels', type=str, default='step2_annotations.json', help='标签文件路径')
-   parser.add_argument('--output', type=str, default='./output/output.json', help='输出文件路径')
+   parser.add_argument('questions', type=str, default='step1_questions.json', help='问题文件路径（.json 或 .jsonl）')
+   parser.add_argument('labels', type=str, nargs='?', default=None, help='标签文件路径（.json 或 .jsonl）')
+   parser.add_argument('--output', type=str, default='./output/output.json', help='输出文件路径，扩展名为 .jsonl 时输出 JSONL')
+   parser.add_argument('--key', type=str, default=None, help='问题与标签的连接字段，默认有 uid 时用 uid，否则用 id')
+   parser.add_argument('--max-memory-mb', type=float, default=IN_MEMORY_LIMIT_MB, help='标签文件超过该大小时改用磁盘连接')
+   parser.add_argument('--convert', action='store_true', help='只把问题文件转换为 --output 的格式并补全 uid')
+   parser.add_argument('--append', action='store_true', help='--convert 时追加到已有的 JSONL 文件')
    return parser.parse_args()
 
 if __name__ == "__main__":
    args = getArgs()
-   merge_data(args.questions, args.labels, args.output)
\ No newline at end of file
+   if args.convert:
+      convert(args.questions, args.output, args.append)
+   elif args.labels is None:
+      raise SystemExit('需要提供标签文件，或使用 --convert 只做格式转换')
+   else:
+      merge_data(args.questions, args.labels, args.output, args.key, args.max_memory_mb)
@@ -0,0 +1,426 @@
+"""按接口自适应限速：请求数与 token 数的令牌桶，跨线程、跨进程共享
+
+http_pool 创建的所有客户端（OpenAI 兼容接口的 httpx 客户端、MinerU 的 requests 会话）都在
+传输层经过这里，调用方无需改动：
+
+- 每个接口（主机 + 路径前三段 + 请求体中的 model）一个令牌桶，分别限制每分钟请求数（rpm）
+  与每分钟 token 数（tpm）。桶的状态保存在本地 SQLite 文件中，同一台机器上的所有线程和
+  进程（例如 utils/pipeline.py 并行处理多本书、同时运行的多个脚本）共用同一份额度。
+- 响应头中的 ``x-ratelimit-limit-*`` 给出服务端的真实上限，按 ``SAFETY`` 比例取用；
+  ``x-ratelimit-remaining-* == 0`` 时在对应的 reset 时间之前暂停发送。
+- 收到 429 时按 ``Retry-After``（或 reset 头）暂停该接口的所有请求，速率乘以 ``DECREASE``；
+  之后每次成功加回一份（加性增、乘性减），在不触发 429 的前提下逼近服务端上限。
+- 429 与连接失败（请求未发出）自动重试；5xx 只对幂等请求重试（GET/HEAD/PUT 等、带
+  ``Idempotency-Key`` 的请求，以及 chat/completions 这类不在服务端创建对象的生成接口），
+  避免 MinerU 建批次等请求在服务端已处理后被重发。没有 Retry-After 时使用带随机抖动的指数退避。
+  http_pool 创建 OpenAI 客户端时相应关闭 SDK 自带的重试，避免两层重试叠加。
+- 异步传输层把 SQLite 读写放到线程中执行，共享文件被其它进程锁住时不会阻塞事件循环。
+
+没有配置上限且服务端也未给出时，接口不限速，只在出现 429 后才开始按观测到的速率限速。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import httpx
+from requests.adapters import HTTPAdapter
+
+from utils import telemetry
+
+DEFAULT_PATH = Path("./output/.rate_limits.sqlite")
+SAFETY = 0.95            # 按服务端上限的这一比例发送
+DECREASE = 0.7           # 每次 429 后速率乘以该系数
+INCREASE = 3.0           # 每次成功后 rpm 增加的量（约每 20 秒速率翻 e 倍），tpm 按请求 token 数同比增加
+MIN_RPM = 1.0
+BURST_SECONDS = 2.0      # 桶容量：按当前速率可连续发送这么多秒的请求
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+MAX_WAIT_STEP = 5.0      # 单次等待上限，之后重新读取共享状态
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# 这些 POST 只返回计算结果、不在服务端创建对象，5xx 后重发最多多算一次 token
+STATELESS_POST_SUFFIXES = ("/chat/completions", "/completions", "/embeddings")
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    rpm REAL, tpm REAL,              -- 当前速率，NULL 表示不限
+    max_rpm REAL, max_tpm REAL,      -- 配置或服务端给出的上限
+    req REAL NOT NULL, tok REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0,
+    window_start REAL NOT NULL, window_count INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def parse_duration(value: str | None) -> float | None:
+    """解析 ``Retry-After``（秒数或 HTTP 日期）以及 ``6m0s`` / ``20ms`` 这类 reset 时长。"""
+
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if parts:
+        return sum(float(n) * DURATION_UNITS[unit] for n, unit in parts)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(headers) -> float | None:
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    waits = [
+        parse_duration(headers.get(name))
+        for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+    ]
+    waits = [w for w in waits if w is not None]
+    return max(waits) if waits else None
+
+
+def endpoint_key(url: str, body: bytes | None) -> str:
+    parts = urlsplit(url)
+    path = "/".join(parts.path.split("/")[:4])
+    key = f"{parts.netloc}{path}"
+    if body and body[:1] == b"{":
+        try:
+            model = json.loads(body).get("model")
+        except (ValueError, AttributeError):
+            model = None
+        if isinstance(model, str):
+            key += f"#{model}"
+    return key
+
+
+def estimate_request_tokens(body: bytes | None) -> int:
+    """粗略估计一次请求消耗的 token：提示词按 UTF-8 字节数 / 3，加上 max_tokens。"""
+
+    if not body or body[:1] != b"{":
+        return 0
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return 0
+    if not isinstance(payload, dict):
+        return 0
+    prompt = json.dumps(payload.get("messages", payload.get("input", "")), ensure_ascii=False)
+    return len(prompt.encode("utf-8")) // 3 + int(payload.get("max_tokens") or 0)
+
+
+def should_retry(status: int, method: str, url: str, headers) -> bool:
+    """429 总是重试（服务端没有处理该请求）；5xx 只对幂等请求重试。"""
+
+    if status == 429:
+        return True
+    if status not in RETRY_STATUSES:
+        return False
+    return (
+        method.upper() in IDEMPOTENT_METHODS
+        or "idempotency-key" in headers
+        or urlsplit(url).path.rstrip("/").endswith(STATELESS_POST_SUFFIXES)
+    )
+
+
+def _header_float(headers, name: str) -> float | None:
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    """共享令牌桶。每个线程使用自己的 SQLite 连接，所有修改都在 ``BEGIN IMMEDIATE`` 事务中完成。"""
+
+    def __init__(self, path: str | Path = DEFAULT_PATH, rpm: float | None = None, tpm: float | None = None) -> None:
+        self.path = Path(path)
+        self.rpm = rpm
+        self.tpm = tpm
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(SCHEMA)
+            if rpm is not None or tpm is not None:
+                # 显式配置的上限覆盖之前学到的值
+                conn.execute(
+                    "UPDATE buckets SET max_rpm = coalesce(?, max_rpm), rpm = coalesce(min(rpm, ?), ?, rpm),"
+                    " max_tpm = coalesce(?, max_tpm), tpm = coalesce(min(tpm, ?), ?, tpm)",
+                    (rpm, rpm, rpm, tpm, tpm, tpm),
+                )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _load(self, conn: sqlite3.Connection, key: str, now: float) -> dict:
+        row = conn.execute(
+            "SELECT rpm, tpm, max_rpm, max_tpm, req, tok, updated, blocked_until, window_start, window_count"
+            " FROM buckets WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            bucket = {
+                "rpm": self.rpm, "tpm": self.tpm, "max_rpm": self.rpm, "max_tpm": self.tpm,
+                "req": 1.0, "tok": 0.0, "updated": now, "blocked_until": 0.0,
+                "window_start": now, "window_count": 0,
+            }
+            bucket["tok"] = self._capacity(bucket["tpm"]) or 0.0
+            return bucket
+        names = ("rpm", "tpm", "max_rpm", "max_tpm", "req", "tok", "updated", "blocked_until", "window_start", "window_count")
+        bucket = dict(zip(names, row))
+        elapsed = max(0.0, now - bucket["updated"])
+        if bucket["rpm"]:
+            bucket["req"] = min(self._capacity(bucket["rpm"]), bucket["req"] + bucket["rpm"] / 60 * elapsed)
+        if bucket["tpm"]:
+            bucket["tok"] = min(self._capacity(bucket["tpm"]), bucket["tok"] + bucket["tpm"] / 60 * elapsed)
+        bucket["updated"] = now
+        return bucket
+
+    @staticmethod
+    def _capacity(rate: float | None) -> float | None:
+        return None if rate is None else max(1.0, rate / 60 * BURST_SECONDS)
+
+    @staticmethod
+    def _save(conn: sqlite3.Connection, key: str, b: dict) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, b["rpm"], b["tpm"], b["max_rpm"], b["max_tpm"], b["req"], b["tok"], b["updated"],
+             b["blocked_until"], b["window_start"], b["window_count"]),
+        )
+
+    def reserve(self, key: str, tokens: int = 0) -> float:
+        """尝试占用一个请求及 ``tokens`` 个 token；成功返回 0，否则返回建议等待的秒数。"""
+
+        now = time.time()
+        with self._transaction() as conn:
+            b = self._load(conn, key, now)
+            if b["blocked_until"] > now:
+                wait = b["blocked_until"] - now
+            else:
+                waits = []
+                if b["rpm"] and b["req"] < 1:
+                    waits.append((1 - b["req"]) / (b["rpm"] / 60))
+                if b["tpm"] and tokens:
+                    # 单次请求超过桶容量时，等桶满即可发送
+                    need = min(tokens, self._capacity(b["tpm"]))
+                    if b["tok"] < need:
+                        waits.append((need - b["tok"]) / (b["tpm"] / 60))
+                wait = max(waits, default=0.0)
+                if wait == 0:
+                    if b["rpm"]:
+                        b["req"] -= 1
+                    if b["tpm"]:
+                        b["tok"] -= tokens
+                    if now - b["window_start"] > 60:
+                        b["window_start"], b["window_count"] = now, 0
+                    b["window_count"] += 1
+            self._save(conn, key, b)
+        return wait
+
+    def feedback(self, key: str, status: int, headers, tokens: int = 0) -> None:
+        """根据响应调整速率：同步服务端上限，429 时暂停并降速，成功时缓慢回升。"""
+
+        now = time.time()
+        with self._transaction() as conn:
+            b = self._load(conn, key, now)
+            for kind, rate, cap, configured in (
+                ("requests", "rpm", "max_rpm", self.rpm),
+                ("tokens", "tpm", "max_tpm", self.tpm),
+            ):
+                limit = _header_float(headers, f"x-ratelimit-limit-{kind}")
+                if limit:
+                    b[cap] = min(limit * SAFETY, configured or float("inf"))
+                    b[rate] = min(b[rate] or b[cap], b[cap])
+                if _header_float(headers, f"x-ratelimit-remaining-{kind}") == 0:
+                    reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                    if reset:
+                        b["blocked_until"] = max(b["blocked_until"], now + reset)
+
+            if status == 429:
+                # 同一轮暂停期间并发返回的多个 429 只降速一次
+                if b["blocked_until"] <= now:
+                    if b["rpm"] is None:
+                        # 之前不限速：从最近一分钟观测到的发送速率开始
+                        elapsed = max(1.0, now - b["window_start"])
+                        b["rpm"] = b["window_count"] / elapsed * 60
+                    b["rpm"] = max(MIN_RPM, b["rpm"] * DECREASE)
+                    if b["tpm"]:
+                        b["tpm"] = max(1.0, b["tpm"] * DECREASE)
+                    b["req"] = min(b["req"], 0.0)
+                wait = retry_after(headers)
+                b["blocked_until"] = max(b["blocked_until"], now + (wait if wait is not None else BACKOFF_BASE))
+            elif status < 400:
+                if b["rpm"] is not None:
+                    b["rpm"] = min(b["max_rpm"] or float("inf"), b["rpm"] + INCREASE)
+                if b["tpm"] is not None and tokens:
+                    b["tpm"] = min(b["max_tpm"] or float("inf"), b["tpm"] + tokens * INCREASE)
+            self._save(conn, key, b)
+
+    def acquire(self, key: str, tokens: int = 0) -> None:
+        while True:
+            wait = self.reserve(key, tokens)
+            if wait <= 0:
+                return
+            wait = min(wait, MAX_WAIT_STEP) * random.uniform(1.0, 1.1)
+            telemetry.count("throttle_seconds", wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, key: str, tokens: int = 0) -> None:
+        while True:
+            # SQLite 事务可能等待其它进程释放锁（最长 30 秒），不能在事件循环线程里执行
+            wait = await asyncio.to_thread(self.reserve, key, tokens)
+            if wait <= 0:
+                return
+            wait = min(wait, MAX_WAIT_STEP) * random.uniform(1.0, 1.1)
+            telemetry.count("throttle_seconds", wait)
+            await asyncio.sleep(wait)
+
+
+def backoff(attempt: int, headers=None) -> float:
+    """重试前的等待：优先使用服务端给出的时间，否则为带全抖动的指数退避。"""
+
+    wait = retry_after(headers) if headers is not None else None
+    if wait is not None:
+        return wait * random.uniform(1.0, 1.1)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _count_retry(status: int) -> None:
+    telemetry.count("retries")
+    if status == 429:
+        telemetry.count("rate_limited")
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx 同步传输层：发送前占用额度，按 should_retry 反馈并重试，连接失败时重连。"""
+
+    def __init__(self, limiter: RateLimiter, transport: httpx.BaseTransport) -> None:
+        self.limiter = limiter
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        key = endpoint_key(str(request.url), body)
+        tokens = estimate_request_tokens(body)
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire(key, tokens)
+            try:
+                response = self.transport.handle_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt == MAX_RETRIES:
+                    raise
+                telemetry.count("retries")
+                time.sleep(backoff(attempt))
+                continue
+            self.limiter.feedback(key, response.status_code, response.headers, tokens)
+            retry = should_retry(response.status_code, request.method, str(request.url), request.headers)
+            if not retry or attempt == MAX_RETRIES:
+                return response
+            response.close()
+            _count_retry(response.status_code)
+            if response.status_code != 429:  # 429 的等待由共享的暂停时间控制
+                time.sleep(backoff(attempt, response.headers))
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """httpx 异步传输层，逻辑同 RateLimitedTransport。"""
+
+    def __init__(self, limiter: RateLimiter, transport: httpx.AsyncBaseTransport) -> None:
+        self.limiter = limiter
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        key = endpoint_key(str(request.url), body)
+        tokens = estimate_request_tokens(body)
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire_async(key, tokens)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt == MAX_RETRIES:
+                    raise
+                telemetry.count("retries")
+                await asyncio.sleep(backoff(attempt))
+                continue
+            await asyncio.to_thread(self.limiter.feedback, key, response.status_code, response.headers, tokens)
+            retry = should_retry(response.status_code, request.method, str(request.url), request.headers)
+            if not retry or attempt == MAX_RETRIES:
+                return response
+            await response.aclose()
+            _count_retry(response.status_code)
+            if response.status_code != 429:
+                await asyncio.sleep(backoff(attempt, response.headers))
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """requests 传输适配器（MinerU 等接口）；按 should_retry 重试，请求体是文件流时无法重发，只限速不重试。"""
+
+    def __init__(self, limiter: RateLimiter, **kwargs) -> None:
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+        replayable = body is None or isinstance(body, bytes)
+        key = endpoint_key(request.url, body if replayable else None)
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire(key)
+            response = super().send(request, **kwargs)
+            self.limiter.feedback(key, response.status_code, response.headers)
+            retry = replayable and should_retry(response.status_code, request.method, request.url, request.headers)
+            if not retry or attempt == MAX_RETRIES:
+                return response
+            response.close()
+            _count_retry(response.status_code)
+            if response.status_code != 429:
+                time.sleep(backoff(attempt, response.headers))
+        return response
@@ -0,0 +1,413 @@
+"""OCR 分块的本地 BM25 检索索引，用于按考点检索参考文本（RAG）
+
+schemes/详细方案.md 中的“基于 RAG 的 LLM 自动化生成”从考点出发：先按考点（如“阳极效应”、
+“物料平衡”）从全部资料中检索最相关的分块，再拼成参考文本交给 dataset/dataset.py 出题。
+
+- 分词：NFKC 规范化并转小写后，汉字连续段切成字符二元组（单字段保留单字），字母数字按词切分。
+- 打分：BM25（k1=1.2，b=0.75）；按考点检索时，taxonomy.json 中该考点的关键词以较低权重并入查询。
+- 存储：索引目录下的 ``index.json`` 记录分块文件的内容哈希与各段（segment）；每个段是一组
+  numpy 数组（按词项哈希排序的词表、倒排表的文档号与词频、文档长度）加分块原文，
+  查询时以 mmap 方式打开，不需要把倒排表读入内存。
+- 增量：重新运行时只为新增或内容变化的分块文件写一个新段，旧版本的分块标记为删除；
+  段数超过 ``MAX_SEGMENTS`` 时自动合并为一个段（被删除的分块此时才真正移除，此前它们仍计入
+  文档频率，对打分的影响可以忽略）。同一索引目录同一时间只应有一个写入者。
+
+用法：
+    python utils/retrieval.py materials/split_markdown/               # 建立或增量更新索引
+    python utils/retrieval.py --topic 阳极效应 --top-k 5               # 按考点检索
+    python utils/retrieval.py --query "冰晶石 分子比" --top-k 5         # 按任意文本检索
+    python dataset/dataset.py --topic 阳极效应 物料平衡 --output output/topic_questions.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import mmap
+import re
+import shutil
+import sys
+import time
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.tagger import DEFAULT_TAXONOMY, load_taxonomy  # noqa: E402
+
+DEFAULT_INDEX_DIR = Path("./output/retrieval")
+MANIFEST_NAME = "index.json"
+TOKENIZER = "nfkc-cjk-bigram-v1"
+K1 = 1.2
+B = 0.75
+KEYWORD_WEIGHT = 0.5
+MAX_SEGMENTS = 8
+MAX_TF = np.iinfo(np.uint16).max
+TOKEN_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+|[a-z0-9]+(?:\.[0-9]+)?")
+CJK_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿]")
+
+_hash_cache: dict[str, int] = {}
+
+
+def tokenize(text: str) -> list[str]:
+    """汉字连续段切成二元组，字母数字按词保留。"""
+
+    tokens: list[str] = []
+    for run in TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).lower()):
+        if len(run) > 1 and CJK_PATTERN.match(run):
+            tokens.extend(map(str.__add__, run[:-1], run[1:]))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def term_hash(term: str) -> int:
+    value = _hash_cache.get(term)
+    if value is None:
+        value = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+        _hash_cache[term] = value
+    return value
+
+
+def topic_terms(topic: str, taxonomy: dict[str, Any] | None = None) -> dict[str, float]:
+    """考点查询：考点名本身权重 1，taxonomy 中该考点（或二级类目下各考点）的关键词权重 ``KEYWORD_WEIGHT``。"""
+
+    weights: dict[str, float] = {}
+    for token in tokenize(topic):
+        weights[token] = weights.get(token, 0.0) + 1.0
+    if taxonomy is None:
+        return weights
+    keywords = taxonomy.get("keywords", {})
+    related: list[str] = []
+    for categories in taxonomy["knowledge_map"].values():
+        for level_2, topics in categories.items():
+            if topic == level_2:
+                related += topics + [k for t in topics for k in keywords.get(t, [])]
+            elif topic in topics:
+                related += keywords.get(topic, [])
+    for keyword in dict.fromkeys(related):
+        for token in tokenize(keyword):
+            weights[token] = weights.get(token, 0.0) + KEYWORD_WEIGHT
+    return weights
+
+
+def iter_chunk_files(sources: Iterable[Path]) -> list[Path]:
+    files: list[Path] = []
+    for source in sources:
+        files += sorted(source.rglob("*_chunks.json")) if source.is_dir() else [source]
+    return files
+
+
+class Segment:
+    """一个只读段：词表、倒排表与文档均以 mmap 打开。"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.terms = np.load(path / "terms.npy", mmap_mode="r")
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.postings = np.load(path / "postings.npy", mmap_mode="r")
+        self.tfs = np.load(path / "tfs.npy", mmap_mode="r")
+        self.doclen = np.load(path / "doclen.npy", mmap_mode="r")
+        self.doc_offsets = np.load(path / "doc_offsets.npy", mmap_mode="r")
+        with (path / "docs.jsonl").open("rb") as f:
+            self._docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.doclen)
+
+    def find(self, h: int) -> tuple[int, int] | None:
+        pos = int(np.searchsorted(self.terms, np.uint64(h)))
+        if pos < len(self.terms) and int(self.terms[pos]) == h:
+            return int(self.offsets[pos]), int(self.offsets[pos + 1])
+        return None
+
+    def document(self, doc: int) -> dict[str, Any]:
+        return json.loads(self._docs[int(self.doc_offsets[doc]):int(self.doc_offsets[doc + 1])])
+
+    def close(self) -> None:
+        self._docs.close()
+
+    @staticmethod
+    def write(path: Path, docs: list[dict[str, Any]]) -> dict[str, Any]:
+        """把文档（file/index/metadata/content）写成一个新段，返回段的统计信息。"""
+
+        path.mkdir(parents=True, exist_ok=True)
+        # 新词项的编号为当前词表大小；整篇文档的词项在 C 层一次映射，不逐个倒排项执行 Python 代码
+        vocab: defaultdict[str, int] = defaultdict()
+        vocab.default_factory = vocab.__len__
+        term_ids, tfs = array("I"), array("I")
+        unique_terms = np.zeros(len(docs), dtype=np.int64)
+        doclen = np.zeros(len(docs), dtype=np.uint32)
+        doc_offsets = np.zeros(len(docs) + 1, dtype=np.uint64)
+        with (path / "docs.jsonl").open("wb") as out:
+            for doc_id, doc in enumerate(docs):
+                line = (json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8")
+                out.write(line)
+                doc_offsets[doc_id + 1] = doc_offsets[doc_id] + len(line)
+                tokens = tokenize(_indexed_text(doc))
+                counts = Counter(tokens)
+                term_ids.extend(map(vocab.__getitem__, counts))
+                tfs.extend(counts.values())
+                unique_terms[doc_id] = len(counts)
+                doclen[doc_id] = len(tokens)
+
+        hashes = np.array([term_hash(t) for t in vocab], dtype=np.uint64)
+        term_ids_np = np.frombuffer(term_ids, dtype=np.uint32)
+        doc_ids_np = np.repeat(np.arange(len(docs), dtype=np.uint32), unique_terms)
+        posting_hashes = hashes[term_ids_np]
+        order = np.lexsort((doc_ids_np, posting_hashes))
+        posting_hashes = posting_hashes[order]
+        terms, starts = np.unique(posting_hashes, return_index=True)
+        offsets = np.append(starts, len(posting_hashes)).astype(np.uint64)
+
+        np.save(path / "terms.npy", terms)
+        np.save(path / "offsets.npy", offsets)
+        np.save(path / "postings.npy", doc_ids_np[order])
+        np.save(path / "tfs.npy", np.minimum(np.frombuffer(tfs, dtype=np.uint32)[order], MAX_TF).astype(np.uint16))
+        np.save(path / "doclen.npy", doclen)
+        np.save(path / "doc_offsets.npy", doc_offsets)
+        return {"name": path.name, "docs": len(docs), "tokens": int(doclen.sum())}
+
+
+def _indexed_text(doc: dict[str, Any]) -> str:
+    # 标题同样参与检索
+    headers = " ".join(str(v) for k, v in doc.get("metadata", {}).items() if k in ("H1", "H2", "H3") and v)
+    return f"{headers}\n{doc['content']}" if headers else doc["content"]
+
+
+class BM25Index:
+    """分段的 BM25 索引；``update`` 增量加入分块文件，``search`` 返回得分最高的分块。"""
+
+    def __init__(self, path: str | Path = DEFAULT_INDEX_DIR) -> None:
+        self.path = Path(path)
+        manifest_path = self.path / MANIFEST_NAME
+        if manifest_path.exists():
+            self.manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        else:
+            self.manifest = {"tokenizer": TOKENIZER, "next_segment": 0, "segments": [], "files": {}, "deleted": {}}
+        if self.manifest.get("tokenizer") != TOKENIZER:
+            raise ValueError(f"{self.path} 由不同的分词方式建立，请删除后重建")
+        self._segments: dict[str, Segment] = {}
+        self._deleted: dict[str, np.ndarray] = {}
+
+    # ----------------------------- 读取 -----------------------------
+
+    def _segment(self, name: str) -> Segment:
+        segment = self._segments.get(name)
+        if segment is None:
+            segment = self._segments[name] = Segment(self.path / name)
+        return segment
+
+    def _deleted_mask(self, name: str) -> np.ndarray:
+        mask = self._deleted.get(name)
+        if mask is None:
+            mask = np.array(self.manifest["deleted"].get(name, []), dtype=np.int64)
+            self._deleted[name] = mask
+        return mask
+
+    def stats(self) -> tuple[int, float]:
+        """存活文档数与平均文档长度（token）。"""
+
+        docs = tokens = 0
+        for info in self.manifest["segments"]:
+            deleted = self._deleted_mask(info["name"])
+            docs += info["docs"] - len(deleted)
+            tokens += info["tokens"]
+            if len(deleted):
+                tokens -= int(self._segment(info["name"]).doclen[deleted].sum())
+        return docs, (tokens / docs if docs else 0.0)
+
+    def search(self, query: str | dict[str, float], k: int = 5) -> list[dict[str, Any]]:
+        """返回得分最高的 ``k`` 个分块：``{"score", "file", "index", "metadata", "content"}``。
+
+        ``query`` 为文本（按 tokenize 切分，重复词项累加权重）或 topic_terms 得到的 {词项: 权重}。
+        """
+
+        if isinstance(query, str):
+            query = dict(Counter(tokenize(query)))
+        n_docs, avgdl = self.stats()
+        if not query or not n_docs:
+            return []
+        segments = [self._segment(info["name"]) for info in self.manifest["segments"]]
+        spans = {term: [seg.find(term_hash(term)) for seg in segments] for term in query}
+
+        candidates: list[tuple[float, int, int]] = []
+        for s, (info, segment) in enumerate(zip(self.manifest["segments"], segments)):
+            scores = np.zeros(len(segment), dtype=np.float32)
+            norm = None
+            for term, weight in query.items():
+                span = spans[term][s]
+                if span is None:
+                    continue
+                df = sum(b - a for a, b in filter(None, spans[term]))
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                docs = segment.postings[span[0]:span[1]]
+                tf = segment.tfs[span[0]:span[1]].astype(np.float32)
+                if norm is None:
+                    norm = K1 * (1 - B + B * segment.doclen.astype(np.float32) / avgdl)
+                scores[docs] += weight * idf * tf * (K1 + 1) / (tf + norm[docs])
+            deleted = self._deleted_mask(info["name"])
+            if len(deleted):
+                scores[deleted] = 0
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            candidates += [(float(scores[d]), s, int(d)) for d in top if scores[d] > 0]
+
+        hits = []
+        for score, s, doc in sorted(candidates, reverse=True)[:k]:
+            hit = segments[s].document(doc)
+            hit["score"] = round(score, 4)
+            hits.append(hit)
+        return hits
+
+    def search_topic(self, topic: str, k: int = 5, taxonomy: dict[str, Any] | None = None) -> list[dict[str, Any]]:
+        if taxonomy is None and DEFAULT_TAXONOMY.exists():
+            taxonomy = load_taxonomy()
+        return self.search(topic_terms(topic, taxonomy), k)
+
+    # ----------------------------- 写入 -----------------------------
+
+    def _delete_file(self, key: str) -> int:
+        entry = self.manifest["files"].pop(key)
+        ids = list(range(entry["docs"][0], entry["docs"][1]))
+        if ids:
+            deleted = self.manifest["deleted"].setdefault(entry["segment"], [])
+            deleted += ids
+            self._deleted.pop(entry["segment"], None)
+        return len(ids)
+
+    def update(self, sources: Iterable[Path]) -> tuple[int, int]:
+        """按内容哈希增量索引 ``sources``（*_chunks.json 文件或目录）下的分块，返回 (新增, 删除) 分块数。
+
+        目录下已不存在的分块文件会从索引中删除。
+        """
+
+        sources = [Path(s) for s in sources]
+        files = {path.as_posix(): path for path in iter_chunk_files(sources)}
+        roots = [s.as_posix().rstrip("/") + "/" for s in sources if s.is_dir()]
+        removed = 0
+        for key in list(self.manifest["files"]):
+            if key not in files and any(key.startswith(root) for root in roots):
+                removed += self._delete_file(key)
+
+        docs: list[dict[str, Any]] = []
+        name = f"seg-{self.manifest['next_segment']:05d}"
+        added_files = {}
+        for key, path in files.items():
+            data = path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            entry = self.manifest["files"].get(key)
+            if entry is not None and entry["sha256"] == digest:
+                continue
+            if entry is not None:
+                removed += self._delete_file(key)
+            start = len(docs)
+            for idx, chunk in enumerate(json.loads(data)):
+                if chunk.get("content", "").strip():
+                    docs.append({"file": key, "index": idx, "metadata": chunk.get("metadata", {}), "content": chunk["content"]})
+            added_files[key] = {"sha256": digest, "segment": name, "docs": [start, len(docs)]}
+
+        if docs:
+            self.manifest["segments"].append(Segment.write(self.path / name, docs))
+            self.manifest["next_segment"] += 1
+        self.manifest["files"].update(added_files)
+        if docs or removed:
+            self._drop_empty_segments()
+            self.save()
+            if len(self.manifest["segments"]) > MAX_SEGMENTS:
+                self.compact()
+        return len(docs), removed
+
+    def _drop_empty_segments(self) -> None:
+        live = []
+        for info in self.manifest["segments"]:
+            if len(self.manifest["deleted"].get(info["name"], [])) < info["docs"]:
+                live.append(info)
+            else:
+                self.manifest["deleted"].pop(info["name"], None)
+                self._retire(info["name"])
+        self.manifest["segments"] = live
+
+    def _retire(self, name: str) -> None:
+        segment = self._segments.pop(name, None)
+        if segment is not None:
+            segment.close()
+        self._deleted.pop(name, None)
+        shutil.rmtree(self.path / name, ignore_errors=True)
+
+    def compact(self) -> None:
+        """把所有段合并为一个，彻底移除已删除的分块。"""
+
+        old = [info["name"] for info in self.manifest["segments"]]
+        if not old:
+            return
+        docs: list[dict[str, Any]] = []
+        files: dict[str, dict[str, Any]] = {}
+        name = f"seg-{self.manifest['next_segment']:05d}"
+        for key, entry in sorted(self.manifest["files"].items()):
+            segment = self._segment(entry["segment"])
+            start = len(docs)
+            docs += [segment.document(d) for d in range(*entry["docs"])]
+            files[key] = {"sha256": entry["sha256"], "segment": name, "docs": [start, len(docs)]}
+        self.manifest["segments"] = [Segment.write(self.path / name, docs)] if docs else []
+        self.manifest["next_segment"] += 1
+        self.manifest["files"] = files
+        self.manifest["deleted"] = {}
+        self.save()
+        for stale in old:
+            self._retire(stale)
+
+    def save(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / (MANIFEST_NAME + ".tmp")
+        tmp.write_text(json.dumps(self.manifest, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path / MANIFEST_NAME)
+
+    def close(self) -> None:
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="为 *_chunks.json 分块建立 BM25 索引并按考点检索。")
+    parser.add_argument("sources", type=Path, nargs="*", help="要索引的 *_chunks.json 文件或目录（增量更新）")
+    parser.add_argument("--index", type=Path, default=DEFAULT_INDEX_DIR, help="索引目录")
+    parser.add_argument("--topic", default=None, help="按考点检索（合并 taxonomy.json 中的关键词）")
+    parser.add_argument("--query", default=None, help="按任意文本检索")
+    parser.add_argument("--top-k", type=int, default=5, help="返回的分块数")
+    parser.add_argument("--compact", action="store_true", help="把所有段合并为一个")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    index = BM25Index(args.index)
+    if args.sources:
+        start = time.perf_counter()
+        added, removed = index.update(args.sources)
+        docs, avgdl = index.stats()
+        print(f"新增 {added} 个分块，删除 {removed} 个，索引共 {docs} 个分块（平均 {avgdl:.0f} 词项），"
+              f"{len(index.manifest['segments'])} 个段，耗时 {time.perf_counter() - start:.1f}s")
+    if args.compact:
+        index.compact()
+        print(f"已合并为 {len(index.manifest['segments'])} 个段")
+    if args.topic or args.query:
+        start = time.perf_counter()
+        hits = index.search_topic(args.topic, args.top_k) if args.topic else index.search(args.query, args.top_k)
+        elapsed = (time.perf_counter() - start) * 1000
+        for rank, hit in enumerate(hits, start=1):
+            headers = " / ".join(str(v) for k, v in hit["metadata"].items() if k in ("H1", "H2", "H3") and v)
+            snippet = " ".join(hit["content"].split())[:80]
+            print(f"[{rank}] {hit['score']:.2f} {hit['file']}#{hit['index']} {headers}\n    {snippet}")
+        print(f"检索耗时 {elapsed:.1f}ms")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
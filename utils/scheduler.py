@@ -0,0 +1,374 @@
+"""配额驱动的题目生成调度器
+
+按 schemes/详细方案.md 的题目分布（dataset/taxonomy.json 中的 category_quotas、
+difficulty_ratio 与 type_distribution）把 1000 道题拆成 (二级考点, 难度, 题型) 单元格，
+在持久化状态文件中记录每个单元格的目标数与已完成数。每一轮为缺口最大的单元格挑选同一
+二级考点下使用次数最少的已打标分块（utils/tagger.py 的输出），按缺口决定题型、难度和题量，
+已满的单元格不再发出请求。
+
+每个请求完成后立即把题目追加到 JSONL 输出并保存状态，中断后重新运行即可从断点继续。
+启动时以输出文件为准重建各单元格的完成数与已尝试组合，并按 uid 去重，写出题目后、保存状态前
+中断也不会产生重复题目或重复编号。
+
+用法：
+    python utils/scheduler.py materials/labeled/ --status
+    python utils/scheduler.py materials/labeled/ --concurrency 8 --output output/scheduled_questions.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dataset.dataset import (  # noqa: E402
+    build_question_prompt,
+    request_questions_async,
+)
+from utils import http_pool  # noqa: E402
+from utils.llm_cache import ResponseCache  # noqa: E402
+from utils.process_json import chunk_ref, make_uid  # noqa: E402
+from utils.tagger import DEFAULT_TAXONOMY, load_taxonomy  # noqa: E402
+
+DEFAULT_STATE = Path("./output/schedule_state.json")
+DEFAULT_OUTPUT = Path("./output/scheduled_questions.jsonl")
+
+
+def _apportion(total: int, weights: dict[str, float]) -> dict[str, int]:
+    """最大余数法按权重分配整数，保证各项之和等于 ``total``。"""
+
+    weight_sum = sum(weights.values())
+    exact = {k: total * w / weight_sum for k, w in weights.items()}
+    result = {k: int(v) for k, v in exact.items()}
+    for k in sorted(exact, key=lambda k: exact[k] - result[k], reverse=True)[: total - sum(result.values())]:
+        result[k] += 1
+    return result
+
+
+def cell_key(category: str, difficulty: str, question_type: str) -> str:
+    return f"{category}|{difficulty}|{question_type}"
+
+
+def compute_targets(taxonomy: dict[str, Any]) -> dict[str, int]:
+    """每个 (二级考点, 难度, 题型) 单元格的目标题数。"""
+
+    targets = {}
+    for category, quota in taxonomy["category_quotas"].items():
+        by_difficulty = _apportion(quota, taxonomy["difficulty_ratio"])
+        for difficulty, count in by_difficulty.items():
+            by_type = _apportion(count, taxonomy["type_distribution"][difficulty])
+            for question_type, n in by_type.items():
+                if n:
+                    targets[cell_key(category, difficulty, question_type)] = n
+    return targets
+
+
+class ScheduleState:
+    """单元格目标/完成数以及已尝试过的 (分块, 单元格) 组合，每次更新后原子写盘。"""
+
+    def __init__(self, path: Path, targets: dict[str, int]) -> None:
+        self.path = path
+        self.targets = targets
+        self.filled: dict[str, int] = {key: 0 for key in targets}
+        self.attempted: set[str] = set()
+        self.uids: set[str] = set()
+        self.next_id = 1
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            self.filled.update({k: v for k, v in data.get("filled", {}).items() if k in targets})
+            self.attempted = set(data.get("attempted", []))
+
+    def reconcile(self, output: Path) -> None:
+        """以已写出的题目为准重建完成数、已尝试组合、已有 uid 与下一个题目编号。
+
+        题目先写出再保存状态，两者之间中断时状态文件会落后于输出文件；末尾写了一半的行被忽略。
+        """
+
+        if not output.exists():
+            return
+        filled = {key: 0 for key in self.targets}
+        with output.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    question = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = cell_key(question.get("level_2_tag"), question.get("difficulty"), question.get("type"))
+                if key in filled:
+                    filled[key] += 1
+                chunk = question.get("chunk") or {}
+                self.attempted.add(f"{chunk.get('file')}#{chunk.get('index')}@{key}")
+                self.uids.add(question.get("uid"))
+                self.next_id = max(self.next_id, int(question.get("id") or 0) + 1)
+        self.filled = filled
+
+    def deficit(self, key: str) -> int:
+        return max(0, self.targets[key] - self.filled.get(key, 0))
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({
+            "targets": self.targets,
+            "filled": self.filled,
+            "attempted": sorted(self.attempted),
+        }, ensure_ascii=False, indent=4), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+def load_tagged_chunks(path: Path) -> dict[str, list[dict[str, Any]]]:
+    """按二级考点分组读取已打标分块，跳过没有 level_2_tag 的分块。
+
+    分块出处记为相对输入目录的路径（如 ``<书>/<分块文件>``），不同书中的同名文件不会冲突。
+    """
+
+    root = path if path.is_dir() else path.parent
+    files = sorted(path.rglob("*_chunks.json")) if path.is_dir() else [path]
+    by_category: dict[str, list[dict[str, Any]]] = {}
+    for file in files:
+        ref = chunk_ref(file, root)
+        for idx, chunk in enumerate(json.loads(file.read_text(encoding="utf-8"))):
+            category = chunk.get("metadata", {}).get("level_2_tag")
+            if category and chunk.get("content", "").strip():
+                by_category.setdefault(category, []).append(
+                    {"id": f"{ref}#{idx}", "file": ref, "index": idx, "chunk": chunk}
+                )
+    return by_category
+
+
+def _trim_partial_line(path: Path) -> None:
+    """去掉中断时写了一半的最后一行，使追加写入从新行开始。"""
+
+    if not path.exists():
+        return
+    with path.open("rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def plan_requests(
+    state: ScheduleState,
+    chunks_by_category: dict[str, list[dict[str, Any]]],
+    max_requests: int,
+    batch_size: int,
+) -> list[dict[str, Any]]:
+    """为一轮生成挑选请求。
+
+    每次取相对缺口（缺口 / 目标）最大、且仍有未尝试分块的单元格，分配同一二级考点下
+    本轮与历史使用最少的分块，题量取 min(batch_size, 剩余缺口)。
+    """
+
+    planned: dict[str, int] = {}
+    usage: dict[str, int] = {}
+    for attempt in state.attempted:
+        chunk_id = attempt.split("@", 1)[0]
+        usage[chunk_id] = usage.get(chunk_id, 0) + 1
+
+    # 每个单元格一个按 (使用次数, 原始顺序) 排序的最小堆，只含该单元格尚未尝试的分块；
+    # 分块被选中后从该单元格的堆中弹出，因此同一 (分块, 单元格) 不会被规划两次。
+    # 使用次数只增不减，堆顶过期时按新的使用次数重新入堆。
+    heaps: dict[str, list[tuple[int, int, dict[str, Any]]]] = {}
+
+    def least_used(key: str) -> dict[str, Any] | None:
+        heap = heaps.get(key)
+        if heap is None:
+            category = key.split("|", 1)[0]
+            heap = heaps[key] = [
+                (usage.get(c["id"], 0), order, c)
+                for order, c in enumerate(chunks_by_category.get(category, []))
+                if f"{c['id']}@{key}" not in state.attempted
+            ]
+            heapq.heapify(heap)
+        while heap and heap[0][0] != usage.get(heap[0][2]["id"], 0):
+            _, order, chunk = heapq.heappop(heap)
+            heapq.heappush(heap, (usage.get(chunk["id"], 0), order, chunk))
+        return heap[0][2] if heap else None
+
+    requests = []
+    while len(requests) < max_requests:
+        best = None
+        for key in state.targets:
+            remaining = state.deficit(key) - planned.get(key, 0)
+            if remaining <= 0:
+                continue
+            priority = (remaining / state.targets[key], remaining)
+            if best is not None and priority <= best[0]:
+                continue
+            if least_used(key) is None:
+                continue
+            best = (priority, key, remaining)
+        if best is None:
+            break
+
+        _, key, remaining = best
+        _, _, chunk = heapq.heappop(heaps[key])
+        usage[chunk["id"]] = usage.get(chunk["id"], 0) + 1
+        count = min(batch_size, remaining)
+        planned[key] = planned.get(key, 0) + count
+        requests.append({"cell": key, "chunk": chunk, "count": count})
+    return requests
+
+
+def build_request_prompt(request: dict[str, Any]) -> str:
+    _, difficulty, question_type = request["cell"].split("|")
+    metadata = request["chunk"]["chunk"].get("metadata", {})
+    return build_question_prompt(
+        request["chunk"]["chunk"]["content"],
+        question_type,
+        difficulty,
+        request["count"],
+        metadata.get("level_3_tag") or "",
+    )
+
+
+def accept_questions(
+    request: dict[str, Any], questions: list[dict[str, Any]], state: ScheduleState
+) -> list[dict[str, Any]]:
+    """按剩余缺口截取题目并补全题型、难度与来源信息。"""
+
+    category, difficulty, question_type = request["cell"].split("|")
+    metadata = request["chunk"]["chunk"].get("metadata", {})
+    accepted = []
+    for question in questions:
+        if not isinstance(question, dict) or len(accepted) >= state.deficit(request["cell"]):
+            continue
+        question = dict(question)
+        question["type"] = question_type
+        question["difficulty"] = difficulty
+        question.setdefault("knowledge_point", metadata.get("level_3_tag"))
+        question["level_1_tag"] = metadata.get("level_1_tag")
+        question["level_2_tag"] = category
+        question["level_3_tag"] = metadata.get("level_3_tag")
+        question["uid"] = make_uid(question, request["chunk"]["chunk"]["content"])
+        question["chunk"] = {
+            "file": request["chunk"]["file"],
+            "index": request["chunk"]["index"],
+            "metadata": metadata,
+        }
+        accepted.append(question)
+    return accepted
+
+
+async def run_schedule(
+    state: ScheduleState,
+    chunks_by_category: dict[str, list[dict[str, Any]]],
+    args: argparse.Namespace,
+) -> int:
+    """循环规划并执行请求，直到所有单元格填满或再无可用分块，返回本次新增题数。"""
+
+    client = http_pool.get_async_openai_client(args.base_url, args.api_key or os.getenv("OPENAI_API_KEY"))
+    cache = None if args.no_cache else ResponseCache()
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    _trim_partial_line(args.output)
+    added = 0
+
+    async def run_one(request: dict[str, Any]) -> tuple[dict[str, Any], list | Exception]:
+        prompt = build_request_prompt(request)
+        async with semaphore:
+            try:
+                return request, await request_questions_async(
+                    client, prompt, args.model, args.temperature, args.max_tokens, cache, stream=args.stream,
+                )
+            except ValueError:  # 内容不合格：记为已尝试，下一轮换分块
+                if cache is not None:
+                    cache.delete(ResponseCache.make_key(prompt, args.model, args.temperature, args.max_tokens))
+                return request, []
+            except Exception as exc:  # noqa: BLE001 - 网络等错误：不记为已尝试
+                return request, exc
+
+    try:
+        with args.output.open("a", encoding="utf-8") as out:
+            while True:
+                requests = plan_requests(state, chunks_by_category, args.concurrency * 2, args.batch_size)
+                if not requests:
+                    break
+                errors = 0
+                for task in asyncio.as_completed([run_one(r) for r in requests]):
+                    request, result = await task
+                    if isinstance(result, Exception):
+                        errors += 1
+                        print(f"{request['cell']} @ {request['chunk']['id']} 请求失败：{result}")
+                        continue
+                    accepted = [q for q in accept_questions(request, result, state) if q["uid"] not in state.uids]
+                    for question in accepted:
+                        question["id"] = state.next_id
+                        state.next_id += 1
+                        state.uids.add(question["uid"])
+                        out.write(json.dumps(question, ensure_ascii=False) + "\n")
+                    out.flush()
+                    state.filled[request["cell"]] += len(accepted)
+                    state.attempted.add(f"{request['chunk']['id']}@{request['cell']}")
+                    state.save()
+                    added += len(accepted)
+                if errors == len(requests):
+                    print("本轮请求全部失败，停止调度。")
+                    break
+    finally:
+        if cache is not None:
+            cache.close()
+        await http_pool.aclose_async_clients()
+    return added
+
+
+def print_status(state: ScheduleState, chunks_by_category: dict[str, list[dict[str, Any]]]) -> None:
+    by_category: dict[str, list[int]] = {}
+    for key, target in state.targets.items():
+        category = key.split("|", 1)[0]
+        entry = by_category.setdefault(category, [0, 0])
+        entry[0] += state.filled.get(key, 0)
+        entry[1] += target
+    for category, (filled, target) in by_category.items():
+        print(f"{category}: {filled}/{target}（可用分块 {len(chunks_by_category.get(category, []))}）")
+    total = sum(state.filled.values())
+    print(f"合计: {total}/{sum(state.targets.values())}")
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="按题目分布配额调度生成请求，可中断续跑。")
+    parser.add_argument("input", type=Path, help="已打标的 *_chunks.json 文件或目录（utils/tagger.py 输出）")
+    parser.add_argument("--taxonomy", type=Path, default=DEFAULT_TAXONOMY, help="知识点映射表及配额 Json")
+    parser.add_argument("--state", type=Path, default=DEFAULT_STATE, help="调度状态文件")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="题目输出（JSONL，追加写入）")
+    parser.add_argument("--batch-size", type=int, default=5, help="单次请求最多生成的题数")
+    parser.add_argument("--concurrency", type=int, default=8, help="最大并发请求数")
+    parser.add_argument("--status", action="store_true", help="只打印各考点完成情况")
+    parser.add_argument("--dry-run", action="store_true", help="只打印下一轮的请求计划")
+    parser.add_argument("--model", default="gpt-4o-mini", help="调用的 OpenAI 模型名称")
+    parser.add_argument("--temperature", type=float, default=0.2, help="采样温度")
+    parser.add_argument("--max-tokens", type=int, default=2000, help="最大返回 tokens")
+    parser.add_argument("--api-key", default=None, help="OpenAI API Key，默认读取 OPENAI_API_KEY")
+    parser.add_argument("--base-url", default="https://api.openai.com/v1", help="OpenAI API 基础 URL")
+    parser.add_argument("--no-cache", action="store_true", help="不使用本地响应缓存")
+    parser.add_argument("--stream", action="store_true", help="流式解析输出，截断时保留已完整的题目，格式不符时提前中止")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    state = ScheduleState(args.state, compute_targets(load_taxonomy(args.taxonomy)))
+    state.reconcile(args.output)
+    chunks_by_category = load_tagged_chunks(args.input)
+
+    if args.status:
+        print_status(state, chunks_by_category)
+        return
+    if args.dry_run:
+        for request in plan_requests(state, chunks_by_category, args.concurrency * 2, args.batch_size):
+            print(f"{request['cell']} x{request['count']} <- {request['chunk']['id']}")
+        return
+
+    added = asyncio.run(run_schedule(state, chunks_by_category, args))
+    print(f"本次新增 {added} 道题目，已写入 {args.output}")
+    print_status(state, chunks_by_category)
+
+
+if __name__ == "__main__":
+    main()
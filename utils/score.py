@@ -0,0 +1,363 @@
+"""测评结果自动评分（NumPy 向量化）
+
+按 schemes/详细方案.md 3.2 节的规则为 utils/evaluate.py 的作答结果打分：
+    T1 单选 / T3 判断   精确匹配（从回答中抽取选项字母、中英文的对/错）
+    T2 多选             选项集合完全一致满分；漏选得 MULTI_PARTIAL_CREDIT；错选零分
+    T4 填空             术语精确匹配（参考答案可用 “/”“或” 等列出多个写法）或数值误差 ±1%
+    T5 / T6 主观题      关键得分点覆盖率：参考答案与解析按序号/分号切成得分点，回答覆盖某
+                        得分点一半以上的字符二元组即视为命中，得分为命中得分点的比例
+早期生成的整数题型按 1 -> T1、2 -> T3、3 -> T5 处理。
+
+每道题的参考答案只解析一次（选项位掩码、布尔值、数值、得分点二元组），所有模型与多次
+采样的回答都复用这些预计算结果；评分与按 模型 × 模块 × 难度 × 题型 的汇总都在数组上一次完成。
+
+用法：
+    python utils/score.py output/final_dataset.jsonl output/eval/results.jsonl --report output/eval/report.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.dedup import normalize_text  # noqa: E402
+from utils.evaluate import item_key, question_type  # noqa: E402
+from utils.process_json import iter_records  # noqa: E402
+
+TYPES = ["T1", "T2", "T3", "T4", "T5", "T6"]
+OBJECTIVE_TYPES = {"T1", "T2", "T3", "T4"}
+MULTI_PARTIAL_CREDIT = 0.5
+NUMERIC_RTOL = 0.01
+KEY_POINT_HIT_RATIO = 0.5
+UNKNOWN = "未标注"
+
+CHOICE_ONLY_PATTERN = re.compile(r"^[\sA-Fa-f,，、;；和及]+$")
+CHOICE_ANSWER_PATTERN = re.compile(r"(?:答案|选择|选项|应选|故选|选)\s*(?:是|为)?\s*[:：]?\s*([A-F](?:[\s,，、和及]*[A-F])*)(?![A-Za-z])")
+CHOICE_LETTER_PATTERN = re.compile(r"(?<![A-Za-z])[A-F](?![A-Za-z])")
+# “是/否”“T/F”太常见，只在整个回答就是该词时才认
+TRUE_WORDS = {"true", "t", "yes", "是", "对", "正确", "√", "✓"}
+FALSE_WORDS = {"false", "f", "no", "否", "错", "错误", "×", "✗"}
+FALSE_PATTERN = re.compile(r"false|错误|不正确|不对|错|×|✗", re.IGNORECASE)
+TRUE_PATTERN = re.compile(r"true|正确|对|√|✓", re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r"[-+]?\d+(?:\.\d+)?")
+ALTERNATIVES_PATTERN = re.compile(r"\s*(?:/|／|或者|或|;|；|\|)\s*")
+KEY_POINT_SPLIT_PATTERN = re.compile(r"[；;。\n]|(?:^|\s)\d+[.、．)）]|[（(]\d+[)）]")
+KEY_POINT_LABEL_PATTERN = re.compile(r"^[^：:]{1,8}[：:]")
+
+
+# --------------------------- answer normalization ---------------------------
+
+def choice_mask(text: Any) -> int:
+    """回答中的选项字母转为位掩码（A=1, B=2, C=4...），没有识别到时为 0。"""
+
+    text = str(text or "").strip()
+    if CHOICE_ONLY_PATTERN.match(text):
+        letters = text.upper()
+    else:
+        match = CHOICE_ANSWER_PATTERN.search(text.upper())
+        letters = match.group(1) if match else "".join(CHOICE_LETTER_PATTERN.findall(text[:40]))
+    mask = 0
+    for letter in letters:
+        if "A" <= letter <= "F":
+            mask |= 1 << (ord(letter) - ord("A"))
+    return mask
+
+
+def parse_bool(value: Any) -> int:
+    """1 为对，0 为错，-1 为无法识别；先匹配否定词，避免“不正确”被判为正确。"""
+
+    if isinstance(value, bool):
+        return int(value)
+    text = str(value or "").strip()
+    word = text.strip("。.！!").lower()
+    if word in TRUE_WORDS:
+        return 1
+    if word in FALSE_WORDS:
+        return 0
+    false_match, true_match = FALSE_PATTERN.search(text), TRUE_PATTERN.search(text)
+    if false_match and (not true_match or false_match.start() <= true_match.start()):
+        return 0
+    if true_match:
+        return 1
+    return -1
+
+
+def parse_number(text: Any) -> float:
+    match = NUMBER_PATTERN.search(str(text or ""))
+    return float(match.group()) if match else np.nan
+
+
+def bigrams(text: str) -> set[str]:
+    text = normalize_text(text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def key_points(answer: Any, explanation: Any) -> list[str]:
+    """把参考答案与解析切成得分点，去掉“原因分析：”之类的小标题，过短的片段不计。"""
+
+    points = []
+    for part in KEY_POINT_SPLIT_PATTERN.split(f"{answer or ''}\n{explanation or ''}"):
+        part = KEY_POINT_LABEL_PATTERN.sub("", part.strip())
+        if len(normalize_text(part)) >= 4 and part not in points:
+            points.append(part)
+    return points
+
+
+# --------------------------- reference table ---------------------------
+
+class ItemTable:
+    """数据集中每道题的分类信息与预解析的参考答案，按题目序号存成数组。"""
+
+    def __init__(self, items: Iterable[dict[str, Any]]) -> None:
+        self.index: dict[str, int] = {}
+        self.modules: list[str] = []
+        self.difficulties: list[str] = []
+        module_idx, difficulty_idx, type_idx = [], [], []
+        ref_mask, ref_bool, ref_num, ref_terms = [], [], [], []
+        self.vocab: dict[str, int] = {}
+        bigram_ids: list[int] = []
+        bigram_kp: list[int] = []
+        kp_start, kp_len = [], []
+        kp_total = 0
+
+        for item in items:
+            self.index[item_key(item)] = len(type_idx)
+            qtype = question_type(item)
+            type_idx.append(TYPES.index(qtype) if qtype in TYPES else TYPES.index("T5"))
+            module_idx.append(self._category(self.modules, item.get("level_1_tag")))
+            difficulty_idx.append(self._category(self.difficulties, item.get("difficulty")))
+
+            answer = item.get("answer")
+            ref_mask.append(choice_mask(answer) if qtype in ("T1", "T2") else 0)
+            ref_bool.append(parse_bool(answer) if qtype == "T3" else -1)
+            ref_num.append(parse_number(answer) if qtype == "T4" else np.nan)
+            ref_terms.append(
+                {normalize_text(t) for t in ALTERNATIVES_PATTERN.split(str(answer or "")) if t.strip()}
+                if qtype == "T4" else set()
+            )
+
+            kp_start.append(len(bigram_ids))
+            if qtype not in OBJECTIVE_TYPES:
+                for point in key_points(answer, item.get("explanation")):
+                    for gram in bigrams(point):
+                        bigram_ids.append(self.vocab.setdefault(gram, len(self.vocab)))
+                        bigram_kp.append(kp_total)
+                    kp_total += 1
+            kp_len.append(len(bigram_ids) - kp_start[-1])
+
+        self.type_idx = np.array(type_idx, dtype=np.int64)
+        self.module_idx = np.array(module_idx, dtype=np.int64)
+        self.difficulty_idx = np.array(difficulty_idx, dtype=np.int64)
+        self.ref_mask = np.array(ref_mask, dtype=np.int64)
+        self.ref_bool = np.array(ref_bool, dtype=np.int64)
+        self.ref_num = np.array(ref_num, dtype=np.float64)
+        self.ref_terms = ref_terms
+        self.bigram_ids = np.array(bigram_ids, dtype=np.int64)
+        self.bigram_kp = np.array(bigram_kp, dtype=np.int64)
+        self.kp_start = np.array(kp_start, dtype=np.int64)
+        self.kp_len = np.array(kp_len, dtype=np.int64)
+        self.kp_total = kp_total
+
+    @staticmethod
+    def _category(names: list[str], value: Any) -> int:
+        name = str(value) if value else UNKNOWN
+        if name not in names:
+            names.append(name)
+        return names.index(name)
+
+    def __len__(self) -> int:
+        return len(self.type_idx)
+
+
+# --------------------------- scoring ---------------------------
+
+def key_point_coverage(table: ItemTable, items: np.ndarray, responses: list[str]) -> np.ndarray:
+    """主观题得分：每个回答命中的得分点比例，所有回答在一次 np.isin 中完成比对。"""
+
+    count = len(items)
+    scores = np.zeros(count)
+    if count == 0 or table.kp_total == 0:
+        return scores
+    vocab_size = len(table.vocab)
+
+    # 回答中出现的二元组，编码为 (回答序号, 二元组 id)
+    resp_codes = np.fromiter(
+        (r * vocab_size + table.vocab[g] for r, text in enumerate(responses) for g in bigrams(text) if g in table.vocab),
+        dtype=np.int64,
+    )
+
+    # 按回答展开各自题目的得分点二元组
+    lengths = table.kp_len[items]
+    owner = np.repeat(np.arange(count), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    source = table.kp_start[items][owner] + offsets
+    hits = np.isin(owner * vocab_size + table.bigram_ids[source], resp_codes)
+
+    # 每个 (回答, 得分点) 的命中比例，再按回答求命中得分点的比例
+    groups, inverse = np.unique(owner * table.kp_total + table.bigram_kp[source], return_inverse=True)
+    ratio = np.bincount(inverse, weights=hits) / np.bincount(inverse)
+    covered = (ratio >= KEY_POINT_HIT_RATIO).astype(np.float64)
+    group_owner = groups // table.kp_total
+    total = np.bincount(group_owner, minlength=count)
+    scores = np.bincount(group_owner, weights=covered, minlength=count)
+    return np.divide(scores, total, out=np.zeros(count), where=total > 0)
+
+
+def score_responses(table: ItemTable, items: np.ndarray, responses: list[str]) -> np.ndarray:
+    """为 ``items[i]`` 题的回答 ``responses[i]`` 打分，返回 0~1 的得分数组。"""
+
+    types = table.type_idx[items]
+    scores = np.zeros(len(items))
+
+    # 选择题：位掩码比较
+    choice = np.isin(types, [TYPES.index("T1"), TYPES.index("T2")])
+    pred = np.array([choice_mask(r) if c else 0 for r, c in zip(responses, choice)], dtype=np.int64)
+    ref = table.ref_mask[items]
+    exact = choice & (pred == ref) & (ref != 0)
+    partial = (types == TYPES.index("T2")) & (pred != 0) & ((pred & ~ref) == 0) & (pred != ref)
+    scores = np.where(exact, 1.0, np.where(partial, MULTI_PARTIAL_CREDIT, scores))
+
+    # 判断题
+    judge = types == TYPES.index("T3")
+    pred_bool = np.array([parse_bool(r) if j else -1 for r, j in zip(responses, judge)], dtype=np.int64)
+    scores = np.where(judge & (pred_bool >= 0) & (pred_bool == table.ref_bool[items]), 1.0, scores)
+
+    # 填空题：术语匹配或数值误差范围
+    blank = np.flatnonzero(types == TYPES.index("T4"))
+    if len(blank):
+        term_hit = np.array([normalize_text(responses[i]) in table.ref_terms[items[i]] for i in blank])
+        pred_num = np.array([parse_number(responses[i]) for i in blank])
+        ref_num = table.ref_num[items[blank]]
+        num_hit = np.isclose(pred_num, ref_num, rtol=NUMERIC_RTOL, atol=0.0) & ~np.isnan(ref_num)
+        scores[blank] = (term_hit | num_hit).astype(np.float64)
+
+    # 主观题
+    subjective = np.flatnonzero(types >= TYPES.index("T5"))
+    scores[subjective] = key_point_coverage(table, items[subjective], [responses[i] for i in subjective])
+    return scores
+
+
+# --------------------------- aggregation ---------------------------
+
+def aggregate(
+    table: ItemTable, targets: list[str], target_idx: np.ndarray, items: np.ndarray, scores: np.ndarray
+) -> dict[str, Any]:
+    """一次 bincount 得到 模型 × 模块 × 难度 × 题型 的得分和与题数，再求各维度的得分率。"""
+
+    shape = (len(targets), len(table.modules), len(table.difficulties), len(TYPES))
+    flat = np.ravel_multi_index(
+        (target_idx, table.module_idx[items], table.difficulty_idx[items], table.type_idx[items]), shape
+    )
+    size = int(np.prod(shape))
+    sums = np.bincount(flat, weights=scores, minlength=size).reshape(shape)
+    counts = np.bincount(flat, minlength=size).reshape(shape)
+
+    def rate(s, c) -> Any:
+        result = np.divide(s, c, out=np.full(np.shape(s), np.nan), where=np.asarray(c) > 0)
+        return np.round(result, 4)
+
+    def by_axis(axis: int, names: list[str], t: int) -> dict[str, Any]:
+        other = tuple(a for a in (1, 2, 3) if a != axis)
+        s = sums[t].sum(axis=tuple(a - 1 for a in other))
+        c = counts[t].sum(axis=tuple(a - 1 for a in other))
+        return {name: {"score": _num(r), "count": int(n)} for name, r, n in zip(names, rate(s, c), c) if n}
+
+    objective = [TYPES.index(t) for t in ("T1", "T2", "T3", "T4")]
+    subjective = [TYPES.index(t) for t in ("T5", "T6")]
+    hard = table.difficulties.index("Hard") if "Hard" in table.difficulties else None
+
+    report = {}
+    for t, target in enumerate(targets):
+        report[target] = {
+            "overall": {"score": _num(rate(sums[t].sum(), counts[t].sum())), "count": int(counts[t].sum())},
+            # 方案 7 节的三项能力指标
+            "objective_accuracy": _num(rate(sums[t][..., objective].sum(), counts[t][..., objective].sum())),
+            "subjective_score": _num(rate(sums[t][..., subjective].sum(), counts[t][..., subjective].sum())),
+            "hard_score": _num(rate(sums[t][:, hard].sum(), counts[t][:, hard].sum())) if hard is not None else None,
+            "by_module": by_axis(1, table.modules, t),
+            "by_difficulty": by_axis(2, table.difficulties, t),
+            "by_type": by_axis(3, TYPES, t),
+            "matrix": {
+                module: {
+                    difficulty: {
+                        qtype: _num(r)
+                        for qtype, r, n in zip(TYPES, rate(sums[t, m, d], counts[t, m, d]), counts[t, m, d]) if n
+                    }
+                    for d, difficulty in enumerate(table.difficulties) if counts[t, m, d].sum()
+                }
+                for m, module in enumerate(table.modules) if counts[t, m].sum()
+            },
+        }
+    return report
+
+
+def _num(value: Any) -> float | None:
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def load_results(table: ItemTable, paths: list[Path]) -> tuple[list[str], np.ndarray, np.ndarray, list[str], list[dict]]:
+    """读取作答结果，跳过失败记录与数据集中不存在的题目。"""
+
+    targets: list[str] = []
+    target_idx, items, responses, records = [], [], [], []
+    skipped = 0
+    for path in paths:
+        for record in iter_records(path):
+            idx = table.index.get(str(record.get("uid")))
+            if record.get("error") or idx is None:
+                skipped += 1
+                continue
+            if record["target"] not in targets:
+                targets.append(record["target"])
+            target_idx.append(targets.index(record["target"]))
+            items.append(idx)
+            responses.append(str(record.get("response") or ""))
+            records.append({"uid": record["uid"], "target": record["target"]})
+    if skipped:
+        print(f"跳过 {skipped} 条失败或不在数据集中的作答记录")
+    return targets, np.array(target_idx, dtype=np.int64), np.array(items, dtype=np.int64), responses, records
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="按题型规则为测评结果打分，并按模块/难度/题型汇总。")
+    parser.add_argument("dataset", type=Path, help="测评使用的数据集（JSON 数组或 JSONL）")
+    parser.add_argument("results", type=Path, nargs="+", help="utils/evaluate.py 的结果文件，可有多个（如多次采样）")
+    parser.add_argument("--report", type=Path, default=Path("./output/eval/report.json"), help="汇总报告输出路径")
+    parser.add_argument("--scores", type=Path, default=None, help="逐条得分输出（JSONL），可选")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    table = ItemTable(iter_records(args.dataset))
+    targets, target_idx, items, responses, records = load_results(table, args.results)
+    if not records:
+        sys.exit("没有可评分的作答记录")
+
+    scores = score_responses(table, items, responses)
+    report = aggregate(table, targets, target_idx, items, scores)
+
+    args.report.parent.mkdir(parents=True, exist_ok=True)
+    args.report.write_text(json.dumps(report, ensure_ascii=False, indent=4), encoding="utf-8")
+    if args.scores is not None:
+        args.scores.parent.mkdir(parents=True, exist_ok=True)
+        with args.scores.open("w", encoding="utf-8") as f:
+            for record, score in zip(records, scores):
+                f.write(json.dumps({**record, "score": round(float(score), 4)}, ensure_ascii=False) + "\n")
+
+    for target, entry in report.items():
+        by_type = "，".join(f"{k} {v['score']:.3f}" for k, v in entry["by_type"].items())
+        print(f"{target}: 总体 {entry['overall']['score']:.3f}（{entry['overall']['count']} 条）；{by_type}")
+    print(f"汇总报告已写入 {args.report}")
+
+
+if __name__ == "__main__":
+    main()
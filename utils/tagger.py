@@ -0,0 +1,297 @@
+"""本地知识点打标工具：为分块标注 level_1/2/3 考点标签
+
+按照 schemes/详细方案.md 的三级索引（dataset/taxonomy.json），用 Aho-Corasick 多模式匹配
+一次扫描统计每个分块中各考点关键词（含同义词）的命中情况并打分，标题中的命中权重更高。
+只有低置信度的分块才（可选地）交给 LLM 打标，其余分块无需任何 API 调用。
+
+用法：
+    python utils/tagger.py materials/split_markdown/ --output materials/labeled/
+    python utils/tagger.py materials/split_markdown/ --llm --model gpt-4o-mini
+
+输出与输入的 *_chunks.json 同名，在每个分块的 metadata 中增加：
+    level_1_tag / level_2_tag / level_3_tag、tag_score、tag_confidence、
+    confident（标签是否可直接使用）、tag_source（keyword / llm / unresolved）
+LLM 打标成功的分块 confident 为 True，tag_score 与 tag_confidence 为 None（关键词得分不再适用）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+DEFAULT_TAXONOMY = Path(__file__).resolve().parent.parent / "dataset" / "taxonomy.json"
+HEADER_KEYS = ("H1", "H2", "H3")
+HEADER_WEIGHT = 3.0
+DEFAULT_MIN_SCORE = 2.0
+DEFAULT_MIN_MARGIN = 0.3
+
+
+class AhoCorasick:
+    """多模式字符串匹配自动机，一次线性扫描找出文本中所有模式的出现位置。"""
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns = list(patterns)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[int]] = [[]]
+
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(pid)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int]]:
+        """依次产出 (结束位置, 模式序号)。"""
+
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pid in out[state]:
+                yield pos, pid
+
+    def count(self, text: str) -> Counter:
+        """各模式在文本中出现的次数（允许重叠）。"""
+
+        return Counter(pid for _, pid in self.iter_matches(text))
+
+
+def load_taxonomy(path: str | Path = DEFAULT_TAXONOMY) -> dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+class TaxonomyTagger:
+    """基于关键词自动机的三级考点打标器。"""
+
+    def __init__(
+        self,
+        taxonomy: dict[str, Any],
+        min_score: float = DEFAULT_MIN_SCORE,
+        min_margin: float = DEFAULT_MIN_MARGIN,
+    ) -> None:
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.paths: dict[str, tuple[str, str]] = {}
+        targets: dict[str, dict[str, float]] = {}
+
+        def add(term: str, tag: str, weight: float) -> None:
+            targets.setdefault(term.lower(), {})
+            targets[term.lower()][tag] = max(targets[term.lower()].get(tag, 0.0), weight)
+
+        for level_1, categories in taxonomy["knowledge_map"].items():
+            for level_2, topics in categories.items():
+                for level_3 in topics:
+                    self.paths[level_3] = (level_1, level_2)
+                    add(level_3, level_3, 1.0)
+                    for term in taxonomy.get("keywords", {}).get(level_3, []):
+                        add(term, level_3, 1.0)
+                # 二级类目名只说明大方向，命中时平分给其下各考点
+                for level_3 in topics:
+                    add(level_2, level_3, 1.0 / len(topics))
+
+        # 同一个词对应多个考点时按考点数摊薄权重
+        self._terms = list(targets)
+        self._targets = [
+            {tag: w / len(targets[term]) for tag, w in targets[term].items()}
+            for term in self._terms
+        ]
+        self._automaton = AhoCorasick(self._terms)
+
+    def score(self, content: str, headers: str = "") -> dict[str, float]:
+        scores: dict[str, float] = {}
+        for text, weight in ((content.lower(), 1.0), (headers.lower(), HEADER_WEIGHT)):
+            if not text:
+                continue
+            for pid, count in self._automaton.count(text).items():
+                contribution = weight * (1.0 + math.log(count))
+                for tag, tag_weight in self._targets[pid].items():
+                    scores[tag] = scores.get(tag, 0.0) + contribution * tag_weight
+        return scores
+
+    def tag(self, chunk: dict[str, Any]) -> dict[str, Any]:
+        """返回 level_1/2/3 标签、得分与置信度；``confident`` 为 False 的分块建议交给 LLM。"""
+
+        metadata = chunk.get("metadata", {})
+        headers = " ".join(str(metadata[k]) for k in HEADER_KEYS if metadata.get(k))
+        scores = self.score(chunk.get("content", ""), headers)
+        if not scores:
+            return {"level_1_tag": None, "level_2_tag": None, "level_3_tag": None,
+                    "tag_score": 0.0, "tag_confidence": 0.0, "confident": False}
+
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        top_tag, top = ranked[0]
+        second = ranked[1][1] if len(ranked) > 1 else 0.0
+        margin = (top - second) / top
+        level_1, level_2 = self.paths[top_tag]
+        return {
+            "level_1_tag": level_1,
+            "level_2_tag": level_2,
+            "level_3_tag": top_tag,
+            "tag_score": round(top, 3),
+            "tag_confidence": round(margin, 3),
+            "confident": top >= self.min_score and margin >= self.min_margin,
+        }
+
+
+# --------------------------- LLM fallback ---------------------------
+
+def build_tagging_prompt(content: str, knowledge_map: dict[str, Any]) -> str:
+    """为低置信度分块生成 LLM 打标提示词。"""
+
+    return f"""# Role
+你是一位有30年工作经验的资深严谨的铝冶炼工业专家。
+
+# Task
+请阅读下方【参考文本】，从【知识点映射表】中选出与其最相关的一个三级考点。
+
+# Knowledge Map(Json)
+{json.dumps(knowledge_map, ensure_ascii=False)}
+
+# Input Context
+\"\"\"
+{content}
+\"\"\"
+
+# Output Format(Json)
+{{"level_1_tag":"Module_A","level_2_tag":"电解工艺流程","level_3_tag":"物料平衡"}}
+若文本与所有考点均无关，请返回 NULL。
+"""
+
+
+def tag_with_llm(
+    pending: list[dict[str, Any]],
+    tagger: TaxonomyTagger,
+    taxonomy: dict[str, Any],
+    args: argparse.Namespace,
+) -> int:
+    """把低置信度分块交给 LLM 打标，返回成功打标的数量。"""
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from dataset.dataset import generate_batch
+    from utils.llm_cache import ResponseCache
+
+    prompts = [build_tagging_prompt(c["content"], taxonomy["knowledge_map"]) for c in pending]
+    cache = None if args.no_cache else ResponseCache()
+    try:
+        results = asyncio.run(generate_batch(
+            prompts,
+            model=args.model,
+            temperature=0.0,
+            max_tokens=200,
+            api_key=args.api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=args.base_url,
+            concurrency=args.concurrency,
+            cache=cache,
+        ))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    tagged = 0
+    for chunk, result in zip(pending, results):
+        if isinstance(result, Exception) or not result:
+            continue
+        level_3 = result[0].get("level_3_tag")
+        if level_3 in tagger.paths:
+            level_1, level_2 = tagger.paths[level_3]
+            chunk["metadata"].update({
+                "level_1_tag": level_1,
+                "level_2_tag": level_2,
+                "level_3_tag": level_3,
+                "tag_score": None,
+                "tag_confidence": None,
+                "confident": True,
+                "tag_source": "llm",
+            })
+            tagged += 1
+    return tagged
+
+
+# --------------------------- CLI ---------------------------
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="按三级考点为分块打标签（关键词自动机 + 可选 LLM 兜底）。")
+    parser.add_argument("input", type=Path, help="*_chunks.json 文件或其所在目录")
+    parser.add_argument("--output", type=Path, default=Path("./materials/labeled/"), help="输出目录")
+    parser.add_argument("--taxonomy", type=Path, default=DEFAULT_TAXONOMY, help="知识点映射表 Json")
+    parser.add_argument("--min-score", type=float, default=DEFAULT_MIN_SCORE, help="判定为高置信度的最低得分")
+    parser.add_argument("--min-margin", type=float, default=DEFAULT_MIN_MARGIN, help="第一名领先第二名的最小比例")
+    parser.add_argument("--llm", action="store_true", help="低置信度分块调用 LLM 打标")
+    parser.add_argument("--model", default="gpt-4o-mini", help="LLM 打标使用的模型")
+    parser.add_argument("--api-key", default=None, help="OpenAI API Key，默认读取 OPENAI_API_KEY")
+    parser.add_argument("--base-url", default="https://api.openai.com/v1", help="OpenAI API 基础 URL")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM 打标的最大并发数")
+    parser.add_argument("--no-cache", action="store_true", help="LLM 打标不使用本地响应缓存")
+    return parser.parse_args()
+
+
+def main() -> None:
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from utils.process_json import chunk_ref
+
+    args = _parse_args()
+    taxonomy = load_taxonomy(args.taxonomy)
+    tagger = TaxonomyTagger(taxonomy, args.min_score, args.min_margin)
+
+    # 按书分目录的分块（utils/pipeline.py 的布局）在输出中保留相同的子目录，同名文件不会互相覆盖
+    root = args.input if args.input.is_dir() else args.input.parent
+    files = sorted(args.input.rglob("*_chunks.json")) if args.input.is_dir() else [args.input]
+    start = time.perf_counter()
+    documents = {}
+    pending = []
+    total = 0
+    for file in files:
+        chunks = json.loads(file.read_text(encoding="utf-8"))
+        for chunk in chunks:
+            result = tagger.tag(chunk)
+            result["tag_source"] = "keyword" if result["confident"] else "unresolved"
+            chunk.setdefault("metadata", {}).update(result)
+            if not result["confident"]:
+                pending.append(chunk)
+        documents[chunk_ref(file, root)] = chunks
+        total += len(chunks)
+    elapsed = time.perf_counter() - start
+    print(f"关键词打标完成：{total} 个分块，高置信度 {total - len(pending)}，低置信度 {len(pending)}，耗时 {elapsed:.2f}s")
+
+    if args.llm and pending:
+        tagged = tag_with_llm(pending, tagger, taxonomy, args)
+        print(f"LLM 打标：{tagged}/{len(pending)} 个低置信度分块")
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    for name, chunks in documents.items():
+        (args.output / name).parent.mkdir(parents=True, exist_ok=True)
+        (args.output / name).write_text(json.dumps(chunks, ensure_ascii=False, indent=4), encoding="utf-8")
+    print(f"已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
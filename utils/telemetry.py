@@ -0,0 +1,338 @@
+"""按阶段记录耗时、请求延迟、token 用量与费用
+
+各脚本（dataset/dataset.py、raw/OCR.py、raw/SlicePDF.py、raw/splitter.py、utils/pipeline.py）
+加 ``--telemetry PATH`` 后，运行期间的每条记录以 JSONL 追加写入 PATH，进程退出时再追加一条
+汇总并打印报告（各阶段 p50/p95 耗时、请求延迟分布、token 用量、每题 token、每分钟题数、
+缓存命中与重试次数，给出单价时附带费用）。未启用时所有记录函数都是空操作。
+
+记录类型（``type`` 字段）：
+
+- ``span``：一个阶段处理一个条目的墙钟时间，如 ``{"stage": "slice", "item": "bookA.pdf", "duration": 3.2}``
+- ``request``：一次外部请求，含 latency、prompt_tokens、completion_tokens、cached 等
+- ``summary``：本次运行的汇总
+
+在代码中埋点：
+
+    telemetry.enable("output/telemetry.jsonl", profile="output/run.prof", prices=(2.0, 8.0))
+    with telemetry.span("split", item=md.name) as fields:
+        fields["chunks"] = split_to_file(md, out)
+    telemetry.request("llm", latency, prompt_tokens=..., completion_tokens=...)
+    telemetry.count("questions", len(questions))
+
+用法（重新汇总已有记录）：
+    python utils/telemetry.py output/telemetry.jsonl            # 最近一次运行
+    python utils/telemetry.py output/telemetry.jsonl --all      # 文件中的全部运行
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+# 请求延迟直方图的上界（秒），最后一档为 "+inf"
+HISTOGRAM_BOUNDS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+PROFILE_TOP = 25
+
+_lock = threading.Lock()
+_state: dict[str, Any] = {"file": None}
+
+
+def enabled() -> bool:
+    return _state["file"] is not None
+
+
+def enable(
+    path: str | Path,
+    profile: str | Path | None = None,
+    prices: tuple[float, float] | None = None,
+) -> None:
+    """开始记录到 ``path``（追加），进程退出时自动调用 finish。
+
+    ``profile`` 给出时对主线程运行 cProfile，结束时写出 .prof 并打印累计耗时最多的函数；
+    ``prices`` 为 (输入, 输出) 每百万 token 的价格，用于估算费用。
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        if _state["file"] is not None:
+            return
+        _state.update(
+            file=path.open("a", encoding="utf-8"),
+            path=path,
+            run=f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}",
+            start=time.time(),
+            records=[],
+            counters=defaultdict(float),
+            prices=prices,
+            profile_path=Path(profile) if profile else None,
+            profiler=None,
+        )
+    _write({"type": "start", "argv": sys.argv})
+    if profile:
+        _state["profiler"] = cProfile.Profile()
+        _state["profiler"].enable()
+    atexit.register(finish)
+
+
+def _write(record: dict[str, Any]) -> None:
+    record.setdefault("ts", round(time.time(), 3))
+    record["run"] = _state["run"]
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _lock:
+        if _state["file"] is None:
+            return
+        _state["file"].write(line)
+        _state["file"].flush()
+        if record["type"] in ("span", "request"):
+            _state["records"].append(record)
+
+
+def record(stage: str, duration: float, item: str | None = None, **fields: Any) -> None:
+    """记录一个已知耗时的阶段条目（例如在子进程中计时、由主进程汇报）。"""
+
+    if enabled():
+        _write({"type": "span", "stage": stage, "item": item, "duration": round(duration, 6), **fields})
+
+
+@contextmanager
+def span(stage: str, item: str | None = None, **fields: Any) -> Iterator[dict[str, Any]]:
+    """为一个阶段条目计时；可往返回的字典里补充字段（如产出数量），异常时记录 error。"""
+
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as exc:
+        fields["error"] = type(exc).__name__
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, item, **fields)
+
+
+def request(
+    stage: str,
+    latency: float | None,
+    prompt_tokens: int | None = None,
+    completion_tokens: int | None = None,
+    cached: bool = False,
+    **fields: Any,
+) -> None:
+    """记录一次外部请求（缓存命中也记录，latency 为 None 或 0）。"""
+
+    if not enabled():
+        return
+    if cached:
+        count("cache_hits")
+    _write({
+        "type": "request",
+        "stage": stage,
+        "latency": None if latency is None else round(latency, 6),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached": cached,
+        **fields,
+    })
+
+
+def count(name: str, n: float = 1) -> None:
+    """累加计数器（questions、retries、cache_hits、throttle_seconds 等）。"""
+
+    if enabled():
+        with _lock:
+            _state["counters"][name] += n
+
+
+def timed_call(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> tuple[Any, float]:
+    """在进程池中执行 ``fn`` 并返回 (结果, 耗时)，供主进程调用 record。"""
+
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values) + 0.5) - 1))
+    return round(values[index], 4)
+
+
+def summarize(
+    records: list[dict[str, Any]],
+    counters: dict[str, float] | None = None,
+    wall: float | None = None,
+    prices: tuple[float, float] | None = None,
+) -> dict[str, Any]:
+    """由 span/request 记录计算汇总。"""
+
+    counters = dict(counters or {})
+    stages: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    requests: dict[str, list[dict[str, Any]]] = defaultdict(list)
+    for r in records:
+        if r["type"] == "span":
+            stages[r["stage"]].append(r["duration"])
+            errors[r["stage"]] += "error" in r
+        elif r["type"] == "request":
+            requests[r["stage"]].append(r)
+
+    summary: dict[str, Any] = {"wall_seconds": round(wall, 3) if wall is not None else None, "stages": {}, "requests": {}}
+    for stage, durations in stages.items():
+        summary["stages"][stage] = {
+            "count": len(durations),
+            "errors": errors[stage],
+            "total": round(sum(durations), 3),
+            "p50": _percentile(durations, 50),
+            "p95": _percentile(durations, 95),
+            "max": round(max(durations), 4),
+        }
+
+    prompt_total = completion_total = 0
+    for stage, items in requests.items():
+        latencies = [r["latency"] for r in items if r["latency"] and not r["cached"]]
+        histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        for latency in latencies:
+            histogram[next((i for i, b in enumerate(HISTOGRAM_BOUNDS) if latency <= b), len(HISTOGRAM_BOUNDS))] += 1
+        prompt = sum(r["prompt_tokens"] or 0 for r in items if not r["cached"])
+        completion = sum(r["completion_tokens"] or 0 for r in items if not r["cached"])
+        prompt_total += prompt
+        completion_total += completion
+        summary["requests"][stage] = {
+            "count": len(items),
+            "cached": sum(r["cached"] for r in items),
+            "errors": sum(bool(r.get("error")) for r in items),
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "histogram": dict(zip([str(b) for b in HISTOGRAM_BOUNDS] + ["+inf"], histogram)),
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+        }
+
+    if "questions" in counters:
+        questions = int(counters["questions"])
+    else:  # 中途退出的运行没有计数器，按 span 上的 questions 字段统计
+        questions = sum(r.get("questions", 0) for r in records if r["type"] == "span")
+    summary["tokens"] = {"prompt": prompt_total, "completion": completion_total}
+    summary["questions"] = questions
+    summary["tokens_per_question"] = round((prompt_total + completion_total) / questions, 1) if questions else None
+    summary["questions_per_minute"] = round(questions / wall * 60, 2) if questions and wall else None
+    summary["counters"] = {k: round(v, 3) for k, v in counters.items() if k != "questions"}
+    if prices:
+        cost = prompt_total / 1e6 * prices[0] + completion_total / 1e6 * prices[1]
+        summary["cost"] = round(cost, 4)
+        summary["cost_per_question"] = round(cost / questions, 6) if questions else None
+    return summary
+
+
+def print_report(summary: dict[str, Any]) -> None:
+    wall = summary.get("wall_seconds")
+    print(f"==== 运行统计{f'（{wall:.1f}s）' if wall else ''} ====")
+    for stage, s in summary["stages"].items():
+        failed = f"，失败 {s['errors']}" if s["errors"] else ""
+        print(f"  {stage}: {s['count']} 项，合计 {s['total']:.1f}s，p50 {s['p50']:.3f}s，p95 {s['p95']:.3f}s{failed}")
+    for stage, r in summary["requests"].items():
+        latency = f"p50 {r['p50']:.3f}s，p95 {r['p95']:.3f}s" if r["p50"] is not None else "无延迟数据"
+        tokens = f"，token {r['prompt_tokens']}+{r['completion_tokens']}" if r["prompt_tokens"] or r["completion_tokens"] else ""
+        cached = f"，缓存命中 {r['cached']}" if r["cached"] else ""
+        print(f"  请求 {stage}: {r['count']} 次，{latency}{tokens}{cached}")
+    if summary["questions"]:
+        per_question = summary["tokens_per_question"]
+        speed = summary["questions_per_minute"]
+        print(f"  题目 {summary['questions']} 道" + (f"，每题 {per_question} token" if per_question else "")
+              + (f"，每分钟 {speed} 道" if speed else ""))
+    if summary.get("cost") is not None:
+        print(f"  费用约 {summary['cost']:.4f}" + (f"（每题 {summary['cost_per_question']:.6f}）" if summary.get("cost_per_question") else ""))
+    if summary["counters"]:
+        print("  " + "，".join(f"{k} {v:g}" for k, v in sorted(summary["counters"].items())))
+
+
+def finish() -> dict[str, Any] | None:
+    """写出汇总记录、打印报告并停止 profiler；重复调用无副作用。"""
+
+    if not enabled():
+        return None
+    profiler = _state.get("profiler")
+    if profiler is not None:
+        profiler.disable()
+    with _lock:
+        records = list(_state["records"])
+        counters = dict(_state["counters"])
+    summary = summarize(records, counters, time.time() - _state["start"], _state["prices"])
+    _write({"type": "summary", **summary})
+    with _lock:
+        _state["file"].close()
+        _state["file"] = None
+    print_report(summary)
+    print(f"  明细：{_state['path']}")
+    if profiler is not None:
+        path = _state["profile_path"]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(out.getvalue())
+        print(f"  profile：{path}（可用 python -m pstats 或 snakeviz 查看）")
+    return summary
+
+
+def load_runs(path: Path) -> dict[str, dict[str, Any]]:
+    runs: dict[str, dict[str, Any]] = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            run = runs.setdefault(r.get("run", ""), {"records": [], "start": r.get("ts"), "end": r.get("ts"), "summary": None})
+            run["end"] = r.get("ts", run["end"])
+            if r["type"] in ("span", "request"):
+                run["records"].append(r)
+            elif r["type"] == "summary":
+                run["summary"] = r
+    return runs
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="汇总 --telemetry 写出的 JSONL 记录。")
+    parser.add_argument("path", type=Path, help="telemetry JSONL 文件")
+    parser.add_argument("--all", action="store_true", help="逐个汇总文件中的全部运行（默认只看最近一次）")
+    parser.add_argument("--price", type=float, nargs=2, metavar=("INPUT", "OUTPUT"), default=None,
+                        help="每百万输入/输出 token 的价格，用于估算费用")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    runs = load_runs(args.path)
+    if not runs:
+        print("没有可汇总的记录")
+        return
+    selected = list(runs.items()) if args.all else [list(runs.items())[-1]]
+    for run_id, run in selected:
+        print(f"运行 {run_id}")
+        summary = run["summary"]
+        if summary is None or args.price:
+            # 中途退出的运行没有汇总记录（计数器丢失），按明细重新计算
+            counters = (summary or {}).get("counters", {})
+            if summary:
+                counters = {**counters, "questions": summary["questions"]}
+            wall = (run["end"] or 0) - (run["start"] or 0)
+            summary = summarize(run["records"], counters, wall, args.price)
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""校验题目中的 source_quote 是否确实出自原文
+
+提示词要求 source_quote 逐字摘自参考文本，但模型仍可能编造引文。本工具对所有分块
+（raw/splitter.py 或 utils/tagger.py 的 *_chunks.json 输出）建立一次字符 n-gram 倒排索引，
+每条引文只查询自身 n-gram 的倒排表得到候选分块，再在候选分块内做精确匹配与模糊匹配，
+耗时与语料总量基本无关。
+
+匹配前统一做 NFKC 归一化并去掉空白、标点与 LaTeX 命令，以容忍全/半角、换行及 OCR
+公式标记的差异。每道题会增加 ``quote_check`` 字段：
+    status   verbatim（原样出现）/ exact（归一化后出现）/ fuzzy（模糊匹配达到阈值）/
+             unmatched / missing（题目没有 source_quote）
+    score    引文被原文覆盖的比例（0~1）
+    file / chunk_index / pages / headers   匹配到的分块及其页码范围
+
+用法：
+    python utils/verify_quotes.py output/scheduled_questions.jsonl materials/split_markdown/ \\
+        --output output/questions_verified.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.dedup import normalize_text  # noqa: E402
+from utils.process_json import chunk_ref, iter_records, write_records  # noqa: E402
+
+DEFAULT_PAGES_DIR = Path("./materials/processed")
+# raw/SlicePDF.py 在每本书的页文件目录中写出的页码对照表（同 SlicePDF.INDEX_NAME），
+# 在这里单独定义以免为一个文件名引入 pypdf
+INDEX_NAME = "pages_index.json"
+DEFAULT_NGRAM = 3
+DEFAULT_MIN_SCORE = 0.8
+DEFAULT_CANDIDATES = 5
+MAX_QUERY_GRAMS = 16
+LATEX_PATTERN = re.compile(r"\\[a-zA-Z]+|!\[[^\]]*\]\([^)]*\)")
+PAGE_PATTERN = re.compile(r"pages?_(\d+)(?:-(\d+))?\.pdf")
+
+
+def normalize_quote(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    return normalize_text(LATEX_PATTERN.sub("", text))
+
+
+@lru_cache(maxsize=None)
+def _load_page_index(path: Path) -> dict[str, list[int]]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8")).get("files", {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def page_range(path: Path, pages_dir: Path | None = DEFAULT_PAGES_DIR) -> list[int] | None:
+    """``book__pages_001-020.pdf__full_chunks.json`` 这类分块文件对应的原书页码范围。
+
+    --z-library 去掉首尾页后页文件编号与原书页码不再一致，因此优先按 SlicePDF 在页文件目录
+    （``pages_dir/<书>/``）写出的 pages_index.json 换算；没有该文件时才按文件名中的编号解析。
+    文件名不带书名前缀时（流水线的 split_markdown/<书>/ 布局），书名取分块文件所在目录名。
+    """
+
+    match = PAGE_PATTERN.search(path.name)
+    if match is None:
+        return None
+    if pages_dir is not None:
+        prefix = path.name[:match.start()].split("__")[:-1]
+        folder = pages_dir.joinpath(*prefix) if prefix else pages_dir / path.parent.name
+        pages = _load_page_index(folder / INDEX_NAME).get(match.group(0))
+        if pages:
+            return [min(pages), max(pages)]
+    start = int(match.group(1))
+    return [start, int(match.group(2) or start)]
+
+
+class QuoteIndex:
+    """分块文本的字符 n-gram 倒排索引（n-gram -> 分块序号）。"""
+
+    def __init__(self, ngram: int = DEFAULT_NGRAM, pages_dir: Path | None = DEFAULT_PAGES_DIR) -> None:
+        self.ngram = ngram
+        self.pages_dir = pages_dir
+        self.chunks: list[dict[str, Any]] = []
+        self.texts: list[str] = []
+        self._postings: defaultdict[str, list[int]] = defaultdict(list)
+
+    def _grams(self, text: str) -> set[str]:
+        n = self.ngram
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def add_file(self, path: Path, root: Path | None = None) -> int:
+        """加入一个分块文件；``file`` 记为相对 ``root`` 的路径，与题目 ``chunk.file`` 的写法一致。"""
+
+        chunks = json.loads(path.read_text(encoding="utf-8"))
+        pages = page_range(path, self.pages_dir)
+        ref = chunk_ref(path, root)
+        for idx, chunk in enumerate(chunks):
+            content = chunk.get("content", "")
+            chunk_id = len(self.chunks)
+            self.chunks.append({
+                "file": ref,
+                "chunk_index": idx,
+                "pages": pages,
+                "headers": {k: v for k, v in chunk.get("metadata", {}).items() if k in ("H1", "H2", "H3")},
+                "content": content,
+            })
+            normalized = normalize_quote(content)
+            self.texts.append(normalized)
+            postings = self._postings
+            for gram in self._grams(normalized):
+                postings[gram].append(chunk_id)
+        return len(chunks)
+
+    def candidates(self, quote: str, limit: int = DEFAULT_CANDIDATES) -> list[int]:
+        """用引文中最罕见的若干 n-gram 投票，返回命中最多的分块序号。
+
+        只取文档频率最低的 ``MAX_QUERY_GRAMS`` 个 n-gram，查询开销与常用词的倒排表长度无关。
+        """
+
+        postings = [p for p in map(self._postings.get, self._grams(quote)) if p]
+        postings.sort(key=len)
+        votes: Counter = Counter()
+        for posting in postings[:MAX_QUERY_GRAMS]:
+            votes.update(posting)
+        return [chunk_id for chunk_id, _ in votes.most_common(limit)]
+
+    def locate(self, quote: str, hint: int | None = None, limit: int = DEFAULT_CANDIDATES) -> tuple[str, float, int | None]:
+        """返回 (status, score, 分块序号)；``hint`` 为题目自带的来源分块，优先检查。"""
+
+        normalized = normalize_quote(quote)
+        if not normalized:
+            return "missing", 0.0, None
+
+        ordered = self.candidates(normalized, limit) if len(normalized) >= self.ngram else []
+        if hint is not None:
+            ordered = [hint] + [c for c in ordered if c != hint]
+        if not ordered and len(normalized) < self.ngram:
+            ordered = range(len(self.chunks))  # 过短的引文无法走倒排索引
+
+        for chunk_id in ordered:
+            if normalized in self.texts[chunk_id]:
+                status = "verbatim" if quote.strip() in self.chunks[chunk_id]["content"] else "exact"
+                return status, 1.0, chunk_id
+
+        best_score, best_chunk = 0.0, None
+        for chunk_id in list(ordered)[:limit]:
+            score = self.fuzzy_score(normalized, self.texts[chunk_id])
+            if score > best_score:
+                best_score, best_chunk = score, chunk_id
+        return "fuzzy", best_score, best_chunk
+
+    def fuzzy_score(self, quote: str, text: str) -> float:
+        """引文在分块中最佳对齐位置附近被覆盖的比例。
+
+        先用 n-gram 出现位置投票找出最可能的对齐偏移，只在该窗口内比较，避免零散的
+        单字命中抬高得分；长度小于 2 的匹配块不计入。
+        """
+
+        n = self.ngram
+        diagonals: Counter = Counter()
+        for i in range(len(quote) - n + 1):
+            gram = quote[i:i + n]
+            pos = text.find(gram)
+            while pos != -1:
+                diagonals[pos - i] += 1
+                pos = text.find(gram, pos + 1)
+        if not diagonals:
+            return 0.0
+        offset = diagonals.most_common(1)[0][0]
+        slack = max(n, len(quote) // 5)
+        window = text[max(0, offset - slack):offset + len(quote) + slack]
+        matcher = SequenceMatcher(None, quote, window, autojunk=False)
+        matched = sum(block.size for block in matcher.get_matching_blocks() if block.size >= 2)
+        return matched / len(quote)
+
+
+def build_index(
+    paths: list[Path], ngram: int = DEFAULT_NGRAM, pages_dir: Path | None = DEFAULT_PAGES_DIR
+) -> QuoteIndex:
+    """索引 ``paths`` 下的分块文件；目录会递归查找，以覆盖流水线 ``split_markdown/<书>/`` 的布局。"""
+
+    index = QuoteIndex(ngram, pages_dir)
+    for path in paths:
+        if path.is_dir():
+            for file in sorted(path.rglob("*_chunks.json")):
+                index.add_file(file, path)
+        else:
+            index.add_file(path)
+    return index
+
+
+def _hint(question: dict[str, Any], positions: dict[tuple[str, int], int]) -> int | None:
+    ref = question.get("chunk")
+    if not isinstance(ref, dict):
+        return None
+    return positions.get((ref.get("file"), ref.get("index")))
+
+
+def iter_verified(
+    questions: Iterable[dict[str, Any]],
+    index: QuoteIndex,
+    min_score: float = DEFAULT_MIN_SCORE,
+    counts: Counter | None = None,
+) -> Iterator[dict[str, Any]]:
+    """逐条为题目写入 ``quote_check`` 后产出，各状态计入 ``counts``。"""
+
+    positions = {(c["file"], c["chunk_index"]): i for i, c in enumerate(index.chunks)}
+    counts = Counter() if counts is None else counts
+    for question in questions:
+        quote = str(question.get("source_quote") or "")
+        status, score, chunk_id = index.locate(quote, _hint(question, positions))
+        if status == "fuzzy" and score < min_score:
+            status = "unmatched"
+        check: dict[str, Any] = {"status": status, "score": round(score, 3)}
+        if chunk_id is not None and status != "unmatched":
+            chunk = index.chunks[chunk_id]
+            check.update({k: chunk[k] for k in ("file", "chunk_index", "pages", "headers")})
+        question["quote_check"] = check
+        counts[status] += 1
+        yield question
+
+
+def verify_questions(
+    questions: list[dict[str, Any]],
+    index: QuoteIndex,
+    min_score: float = DEFAULT_MIN_SCORE,
+) -> Counter:
+    """为每道题写入 ``quote_check``，返回各状态的计数。"""
+
+    counts: Counter = Counter()
+    for _ in iter_verified(questions, index, min_score, counts):
+        pass
+    return counts
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="校验题目的 source_quote 是否出自原文分块。")
+    parser.add_argument("questions", type=Path, help="题目文件（JSON 数组或 JSONL）")
+    parser.add_argument("sources", type=Path, nargs="+", help="*_chunks.json 文件或其所在目录")
+    parser.add_argument("--output", type=Path, default=Path("./output/questions_verified.json"), help="带校验结果的题目输出")
+    parser.add_argument("--min-score", type=float, default=DEFAULT_MIN_SCORE, help="模糊匹配判定为通过的最低覆盖率")
+    parser.add_argument("--ngram", type=int, default=DEFAULT_NGRAM, help="倒排索引的字符 n-gram 长度")
+    parser.add_argument(
+        "--pages-dir", type=Path, default=DEFAULT_PAGES_DIR,
+        help="raw/SlicePDF.py 的输出目录，按其中各书的 pages_index.json 换算原书页码",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+
+    start = time.perf_counter()
+    index = build_index(args.sources, args.ngram, args.pages_dir)
+    built = time.perf_counter()
+    counts: Counter = Counter()
+    total = write_records(iter_verified(iter_records(args.questions), index, args.min_score, counts), args.output)
+    done = time.perf_counter()
+
+    print(f"索引 {len(index.chunks)} 个分块，耗时 {built - start:.2f}s；校验 {total} 道题目，耗时 {done - built:.2f}s")
+    print("，".join(f"{status} {count}" for status, count in counts.most_common()))
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()